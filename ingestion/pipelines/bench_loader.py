@@ -0,0 +1,306 @@
+# ingestion/pipelines/bench_loader.py
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from ingestion.utils import ensure_schema
+from ingestion.pipelines.csv_to_db import (
+    FILE_ORD,
+    LOAD_MODES,
+    LOADER_ENGINES,
+    ROW_ORD,
+    STAGING_MODES,
+    TARGET_SCHEMA,
+    _last_wins_select,
+    _peak_rss_mb,
+    table_storage,
+    upsert_table,
+)
+
+# 合成 CSV を作り、同じ入力に対して upsert_table をエンジン別に計測するベンチマーク
+# （--dedupe では TEMP の後勝ち重複除去 + UPSERT だけを旧方式と比較する）
+# （--typed では all-TEXT と typed: true の raw を作り、ディスク使用量と mart 相当の集計時間を比べる）
+BENCH_FOLDER = "namespace=bench/table=ratings"
+DEDUPE_METHODS = ("rowid_anti_join", "qualify")
+
+
+def _write_synthetic_csvs(csv_root: Path, rows: int, files: int, seed: int = 42) -> int:
+    """ratings 風（userId, movieId, rating, timestamp）の CSV を files 個に分けて生成。"""
+    rnd = random.Random(seed)
+    base = csv_root / BENCH_FOLDER
+    base.mkdir(parents=True, exist_ok=True)
+    per_file = max(1, rows // files)
+    written = 0
+    for i in range(files):
+        n = per_file if i < files - 1 else rows - written
+        with (base / f"ratings_{i:03d}.csv").open("w", encoding="utf-8", newline="") as f:
+            f.write("userId,movieId,rating,timestamp\n")
+            for _ in range(n):
+                rating = "" if rnd.random() < 0.01 else f"{rnd.randint(1, 10) / 2:.1f}"
+                f.write(f"{rnd.randint(1, 50_000)},{rnd.randint(1, 20_000)},{rating},{rnd.randint(800_000_000, 1_700_000_000)}\n")
+        written += n
+    return sum(p.stat().st_size for p in base.glob("*.csv"))
+
+
+def _timed_run(
+    workdir: Path, loader: str, staging: str, load_mode: str, chunksize: int, reload: bool
+) -> tuple[float, int, float | None]:
+    """
+    子プロセスで 1 回ロードし (秒, 出力行数, ピークRSS MiB) を返す。RSS をエンジン間で混ぜないため。
+    reload=True なら 1 回目（計測外）で本テーブルを埋め、同じファイルの再ロードを計測する。
+    """
+    engine = create_engine(f"duckdb:///{workdir / 'bench.duckdb'}", future=True)
+    ensure_schema(engine, TARGET_SCHEMA)
+    target = f"bench_{loader}_{staging}_{load_mode}"
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{TARGET_SCHEMA}"."{target}"'))
+    spec = {
+        "folder": BENCH_FOLDER,
+        "primary_key": ["userId", "movieId"],
+        "engine": loader,
+        "staging": staging,
+        "load_mode": load_mode,
+        "replace_keys": ["userId"],
+        "target_table": target,
+    }
+    # 台帳は本テーブルを DROP しても残るので、毎回 full で全ファイルを読む
+    csv_root = workdir / "db_ingestion"
+    if reload:
+        upsert_table(engine, target, spec, csv_root, chunksize=chunksize, auto_add_columns=True, full=True)
+    t0 = time.perf_counter()
+    upsert_table(engine, target, spec, csv_root, chunksize=chunksize, auto_add_columns=True, full=True)
+    elapsed = time.perf_counter() - t0
+    with engine.connect() as conn:
+        n = conn.execute(text(f'SELECT COUNT(*) FROM "{TARGET_SCHEMA}"."{target}"')).scalar()
+    engine.dispose()
+    return elapsed, n, _peak_rss_mb()
+
+
+def run_bench(
+    rows: int,
+    files: int,
+    engines: list[str],
+    stagings: list[str],
+    load_modes: list[str],
+    repeat: int,
+    chunksize: int,
+    workdir: Path,
+    reload: bool = False,
+):
+    size = _write_synthetic_csvs(workdir / "db_ingestion", rows, files)
+    print(f"[bench] rows={rows:,} files={files} bytes={size:,} reload={reload} workdir={workdir}")
+
+    variants = [(lo, st, mo) for lo in engines for st in stagings for mo in load_modes]
+    results: list[tuple[str, float, int, float | None]] = []
+    for loader, staging, load_mode in variants:
+        label = f"{loader}/{staging}/{load_mode}"
+        for r in range(1, repeat + 1):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                elapsed, n, rss = pool.submit(
+                    _timed_run, workdir, loader, staging, load_mode, chunksize, reload
+                ).result()
+            results.append((label, elapsed, n, rss))
+            rss_txt = f" peak_rss={rss:.0f}MiB" if rss is not None else ""
+            print(f"[bench] {label} run={r} {elapsed:.2f}s rows_out={n:,}{rss_txt}")
+
+    print("[bench] ---------- summary (best of runs) ----------")
+    for loader, staging, load_mode in variants:
+        label = f"{loader}/{staging}/{load_mode}"
+        runs = [(t, n, rss) for name, t, n, rss in results if name == label]
+        best, n, _ = min(runs, key=lambda x: x[0])
+        peak = max((rss for _, _, rss in runs if rss is not None), default=None)
+        rss_txt = f"  peak_rss={peak:.0f}MiB" if peak is not None else ""
+        print(f"[bench] {label:<32} best={best:8.2f}s  {rows / best:12,.0f} rows/s  rows_out={n:,}{rss_txt}")
+
+
+def _build_dedupe_staging(engine, rows: int, dup_ratio: float) -> str:
+    """TEMP と同じ形（TEXT 列 + 取り込み順）の合成ステージングを作る。PK の種類数は rows * (1 - dup_ratio)。"""
+    keys = max(1, int(rows * (1 - dup_ratio)))
+    stg = f'"{TARGET_SCHEMA}"."bench_dedupe_stg"'
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {stg}"))
+        conn.execute(text(f"""
+            CREATE TABLE {stg} AS
+            SELECT
+                CAST(k // 20000 AS TEXT) AS "userId",
+                CAST(k % 20000 AS TEXT) AS "movieId",
+                CAST((i % 10) / 2 AS TEXT) AS "rating",
+                CAST(i AS TEXT) AS "timestamp",
+                CAST(i // 1000000 AS INTEGER) AS "{FILE_ORD}",
+                i AS "{ROW_ORD}"
+            FROM (SELECT i, hash(i) % {keys} AS k FROM range({rows}) t(i))
+        """))
+    return stg
+
+
+def _timed_dedupe(workdir: Path, method: str, rows: int, dup_ratio: float) -> tuple[float, int, float | None]:
+    """子プロセスでステージングを作り、重複除去 + UPSERT の部分だけを計測する。"""
+    engine = create_engine(f"duckdb:///{workdir / 'bench_dedupe.duckdb'}", future=True)
+    ensure_schema(engine, TARGET_SCHEMA)
+    stg = _build_dedupe_staging(engine, rows, dup_ratio)
+    target = f'"{TARGET_SCHEMA}"."bench_dedupe_{method}"'
+    cols = ["userId", "movieId", "rating", "timestamp"]
+    pk = ["userId", "movieId"]
+    col_sql = ", ".join([f'"{c}"' for c in cols])
+    pk_sql = ", ".join([f'"{c}"' for c in pk])
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {target}"))
+        col_ddl = ", ".join([f'"{c}" TEXT' for c in cols])
+        conn.execute(text(f"CREATE TABLE {target} ({col_ddl}, PRIMARY KEY ({pk_sql}))"))
+
+    if method == "rowid_anti_join":
+        # 旧 _dedupe_temp_by_pk: 重複を DELETE してから素の SELECT で UPSERT
+        select_sql = f"SELECT {col_sql} FROM {stg}"
+        pre_sql = f"DELETE FROM {stg} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {stg} GROUP BY {pk_sql})"
+    else:
+        select_sql = _last_wins_select(stg, cols, pk)
+        pre_sql = None
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        if pre_sql:
+            conn.execute(text(pre_sql))
+        conn.execute(text(f"""
+            INSERT INTO {target} ({col_sql})
+            {select_sql}
+            ON CONFLICT ({pk_sql}) DO UPDATE SET "rating" = EXCLUDED."rating", "timestamp" = EXCLUDED."timestamp"
+        """))
+    elapsed = time.perf_counter() - t0
+    with engine.connect() as conn:
+        n = conn.execute(text(f"SELECT COUNT(*) FROM {target}")).scalar()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {target}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {stg}"))
+    engine.dispose()
+    return elapsed, n, _peak_rss_mb()
+
+
+def run_dedupe_bench(rows: int, dup_ratio: float, repeat: int, workdir: Path):
+    print(f"[bench][dedupe] rows={rows:,} dup_ratio={dup_ratio} workdir={workdir}")
+    best: dict[str, tuple[float, int, float | None]] = {}
+    for method in DEDUPE_METHODS:
+        for r in range(1, repeat + 1):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                elapsed, n, rss = pool.submit(_timed_dedupe, workdir, method, rows, dup_ratio).result()
+            rss_txt = f" peak_rss={rss:.0f}MiB" if rss is not None else ""
+            print(f"[bench][dedupe] {method} run={r} {elapsed:.2f}s rows_out={n:,}{rss_txt}")
+            if method not in best or elapsed < best[method][0]:
+                best[method] = (elapsed, n, rss)
+
+    print("[bench][dedupe] ---------- summary (best of runs) ----------")
+    for method, (t, n, rss) in best.items():
+        rss_txt = f"  peak_rss={rss:.0f}MiB" if rss is not None else ""
+        print(f"[bench][dedupe] {method:<16} best={t:8.2f}s  {rows / t:12,.0f} rows/s  rows_out={n:,}{rss_txt}")
+
+
+# dbt の mart 相当。raw が TEXT でも typed でも同じ SQL（typed 列の CAST は no-op）
+_MART_SQL = """
+    CREATE OR REPLACE TABLE {mart} AS
+    SELECT
+        CAST("movieId" AS BIGINT) AS movie_id,
+        count(*) AS n_ratings,
+        avg(CAST("rating" AS DOUBLE)) AS avg_rating,
+        to_timestamp(max(CAST("timestamp" AS BIGINT))) AS last_rated_at
+    FROM {raw}
+    GROUP BY 1
+"""
+
+
+def _timed_typed(workdir: Path, typed: bool, repeat: int) -> tuple[dict, float, float]:
+    """子プロセスで append + typed/TEXT でロードし (storage, ロード秒, mart ベスト秒) を返す。"""
+    engine = create_engine(f"duckdb:///{workdir / 'bench_typed.duckdb'}", future=True)
+    ensure_schema(engine, TARGET_SCHEMA)
+    target = f"bench_{'typed' if typed else 'text'}"
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{TARGET_SCHEMA}"."{target}"'))
+    spec = {
+        "folder": BENCH_FOLDER,
+        "primary_key": ["userId", "movieId"],
+        "engine": "duckdb_native",
+        "load_mode": "append",
+        "typed": typed,
+        "target_table": target,
+    }
+    t0 = time.perf_counter()
+    upsert_table(engine, target, spec, workdir / "db_ingestion", chunksize=200_000, auto_add_columns=True)
+    load_seconds = time.perf_counter() - t0
+    storage = table_storage(engine, TARGET_SCHEMA, target)
+
+    mart_sql = _MART_SQL.format(mart=f'"{TARGET_SCHEMA}"."{target}_mart"', raw=f'"{TARGET_SCHEMA}"."{target}"')
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text(mart_sql))
+        best = min(best, time.perf_counter() - t0)
+    engine.dispose()
+    return storage, load_seconds, best
+
+
+def run_typed_bench(rows: int, files: int, repeat: int, workdir: Path):
+    size = _write_synthetic_csvs(workdir / "db_ingestion", rows, files)
+    print(f"[bench][typed] rows={rows:,} files={files} bytes={size:,} workdir={workdir}")
+    for typed in (False, True):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            st, load_s, mart_s = pool.submit(_timed_typed, workdir, typed, max(repeat, 3)).result()
+        label = "typed" if typed else "text"
+        print(
+            f"[bench][typed] {label:<6} size={st['bytes'] / 1024 / 1024:8.1f}MiB  typed={st['typed_columns']}/{st['columns']}  "
+            f"load={load_s:6.2f}s  mart={mart_s:6.3f}s (best of {max(repeat, 3)})"
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark upsert_table loader engines on synthetic CSVs")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--files", type=int, default=4)
+    ap.add_argument("--engines", nargs="+", default=list(LOADER_ENGINES), choices=LOADER_ENGINES)
+    ap.add_argument("--staging", nargs="+", default=["unindexed"], choices=STAGING_MODES,
+                    help="staging modes to compare (e.g. --staging unindexed indexed)")
+    ap.add_argument("--load-modes", nargs="+", default=["upsert"], choices=LOAD_MODES,
+                    help="load modes to compare (replace uses replace_keys=[userId]; append ignores the PK)")
+    ap.add_argument("--reload", action="store_true",
+                    help="time a second load of the same files over a populated table")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--chunksize", type=int, default=200_000)
+    ap.add_argument("--workdir", help="work directory (default: temporary, removed afterwards)")
+    ap.add_argument("--dedupe", action="store_true",
+                    help="benchmark only the staging dedupe + upsert (rowid anti-join vs QUALIFY)")
+    ap.add_argument("--dup-ratio", type=float, default=0.2, help="--dedupe: share of rows that repeat a PK")
+    ap.add_argument("--typed", action="store_true",
+                    help="compare all-TEXT vs typed raw: on-disk size and a mart-style aggregation")
+    args = ap.parse_args()
+
+    def _run(workdir: Path):
+        if args.typed:
+            run_typed_bench(args.rows, args.files, args.repeat, workdir)
+        elif args.dedupe:
+            run_dedupe_bench(args.rows, args.dup_ratio, args.repeat, workdir)
+        else:
+            run_bench(
+                args.rows, args.files, args.engines, args.staging, args.load_modes,
+                args.repeat, args.chunksize, workdir, args.reload,
+            )
+
+    if args.workdir:
+        workdir = Path(args.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        _run(workdir)
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="bench_loader_"))
+        try:
+            _run(workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
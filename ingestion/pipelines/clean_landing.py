@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import argparse
 import gzip
+import multiprocessing
 import os
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from ingestion.utils import get_paths
+from ingestion.pipelines.landing_catalog import list_batches, mark_compressed, unregister_batch
 
 
 def _parse_run_date(dirpath: Path) -> datetime | None:
@@ -20,18 +25,129 @@ def _parse_run_date(dirpath: Path) -> datetime | None:
     return None
 
 
-def _compress_csv_in_parts(parts_dir: Path):
-    for csv in list(parts_dir.glob("*.csv")):
-        gz = csv.with_suffix(csv.suffix + ".gz")  # .csv.gz
-        if gz.exists():
-            continue
-        with csv.open("rb") as src, gzip.open(gz, "wb") as dst:
-            shutil.copyfileobj(src, dst)
-        csv.unlink()
-        print(f"[landing-clean] compressed: {csv.name} -> {gz.name}")
-
-
-def clean_landing():
+# 圧縮コーデック（.env の LANDING_COMPRESS_CODEC / LANDING_COMPRESS_LEVEL）
+#   gzip : 標準ライブラリ（レベル 1-9。既定 6）
+#   zstd : pyarrow の Codec（レベル 1-22。既定 3）。READ_CHUNK ごとに独立フレームで書く
+#          （連結フレームは pyarrow / DuckDB / zstd CLI とも 1 ファイルとして読める）
+COMPRESS_CODECS = {"gzip": ".gz", "zstd": ".zst"}
+_DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+_READ_CHUNK = 16 * 1024 * 1024
+
+
+def _tmp_name(dst: Path) -> Path:
+    return dst.with_name(f".{dst.name}.tmp")
+
+
+def _compress_file(src: Path, codec: str, level: int) -> tuple[int, int, float]:
+    """
+    1 パーツを圧縮する（ワーカープロセスで実行）。一時ファイルに書いて fsync → rename し、
+    最後に元の CSV を消すので、途中で止まっても CSV か完成した圧縮ファイルのどちらかが必ず残る。
+    戻り値: (元のバイト数, 圧縮後のバイト数, 秒)
+    """
+    import pyarrow as pa
+
+    t0 = time.perf_counter()
+    dst = src.with_name(src.name + COMPRESS_CODECS[codec])
+    tmp = _tmp_name(dst)
+    with src.open("rb") as fsrc, tmp.open("wb") as fdst:
+        if codec == "gzip":
+            # mtime=0 で同じ入力からは同じ .gz になるようにする
+            with gzip.GzipFile(filename=src.name, mode="wb", compresslevel=level, fileobj=fdst, mtime=0) as gz:
+                shutil.copyfileobj(fsrc, gz, _READ_CHUNK)
+        else:
+            zstd = pa.Codec("zstd", compression_level=level)
+            while chunk := fsrc.read(_READ_CHUNK):
+                fdst.write(zstd.compress(chunk, asbytes=True))
+        fdst.flush()
+        os.fsync(fdst.fileno())
+    shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+    # 前回の中断で残った別コーデックの圧縮版があれば消す（同じパーツを二重に読ませない）
+    for suffix in COMPRESS_CODECS.values():
+        other = src.with_name(src.name + suffix)
+        if other != dst and other.exists():
+            other.unlink()
+    src_bytes = src.stat().st_size
+    src.unlink()
+    return src_bytes, dst.stat().st_size, time.perf_counter() - t0
+
+
+def _resolve_codec(codec: str | None, level: int | None, workers: int | None) -> tuple[str, int, int]:
+    codec = codec or os.getenv("LANDING_COMPRESS_CODEC", "gzip")
+    if codec not in COMPRESS_CODECS:
+        raise ValueError(f"unknown codec '{codec}' (choose from: {', '.join(COMPRESS_CODECS)})")
+    if level is None:
+        level = int(os.getenv("LANDING_COMPRESS_LEVEL") or _DEFAULT_LEVELS[codec])
+    workers = workers or int(os.getenv("LANDING_COMPRESS_WORKERS", "0")) or (os.cpu_count() or 1)
+    return codec, level, max(1, workers)
+
+
+def _pending_csvs(parts_dir: Path) -> list[Path]:
+    """未圧縮の CSV。前回中断した一時ファイルは消しておく。"""
+    for tmp in parts_dir.glob(".*.tmp"):
+        tmp.unlink()
+        print(f"[landing-clean] removed stale temp: {tmp}")
+    return sorted(parts_dir.glob("*.csv"), key=lambda p: str(p))
+
+
+def compress_batches(landing: Path, batches: list[Path], codec: str, level: int, workers: int) -> dict:
+    """
+    batches の parts/*.csv をプロセスプールで並列に圧縮し、全パーツが済んだバッチをカタログに反映する。
+    戻り値: 集計（files, bytes_in, bytes_out, seconds, failed）
+    """
+    tasks = [(b, csv) for b in batches for csv in _pending_csvs(b / "parts")]
+    summary = {"files": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0, "failed": 0}
+    if not tasks:
+        return summary
+
+    print(f"[landing-clean] compressing {len(tasks)} file(s) in {len(batches)} batch(es) "
+          f"(codec={codec}, level={level}, workers={workers})")
+    t0 = time.perf_counter()
+    failed_batches: set[Path] = set()
+    # pyarrow のスレッドを抱えた親を fork しないよう spawn を使う
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=ctx) as pool:
+        futures = {pool.submit(_compress_file, csv, codec, level): (b, csv) for b, csv in tasks}
+        for fut in as_completed(futures):
+            b, csv = futures[fut]
+            try:
+                src_bytes, dst_bytes, sec = fut.result()
+            except Exception as e:
+                print(f"[landing-clean] compress failed: {csv} ({e})")
+                summary["failed"] += 1
+                failed_batches.add(b)
+                continue
+            summary["files"] += 1
+            summary["bytes_in"] += src_bytes
+            summary["bytes_out"] += dst_bytes
+            print(f"[landing-clean] compressed: {csv.name} -> {csv.name}{COMPRESS_CODECS[codec]} "
+                  f"({src_bytes / 2**20:.1f} -> {dst_bytes / 2**20:.1f} MiB, {sec:.2f}s)")
+    summary["seconds"] = time.perf_counter() - t0
+
+    for b in {b for b, _ in tasks} - failed_batches:
+        mark_compressed(landing, b)
+    return summary
+
+
+def _print_summary(summary: dict):
+    if not summary["files"] and not summary["failed"]:
+        return
+    mib_in, mib_out = summary["bytes_in"] / 2**20, summary["bytes_out"] / 2**20
+    saved = 100.0 * (1 - mib_out / mib_in) if mib_in else 0.0
+    rate = mib_in / summary["seconds"] if summary["seconds"] else 0.0
+    print(
+        f"[landing-clean] compression summary: files={summary['files']} failed={summary['failed']} "
+        f"{mib_in:.1f} MiB -> {mib_out:.1f} MiB (saved {mib_in - mib_out:.1f} MiB, {saved:.1f}%) "
+        f"in {summary['seconds']:.1f}s ({rate:.1f} MiB/s)"
+    )
+
+
+def clean_landing(codec: str | None = None, level: int | None = None, workers: int | None = None):
+    """
+    古いバッチの parts/*.csv を圧縮し（LANDING_COMPRESS_AFTER_DAYS 超）、保持期間を過ぎたものを消す。
+    圧縮はバッチ・パーツをまたいで workers プロセスで並列に行う（codec / level は gzip / zstd）。
+    """
+    codec, level, workers = _resolve_codec(codec, level, workers)
     paths = get_paths()
     landing = paths["LANDING_ROOT"]
 
@@ -43,21 +159,17 @@ def clean_landing():
     cutoff_delete = now - timedelta(days=retention_days)
     cutoff_compress = now - timedelta(days=compress_after_days)
 
-    # namespace/table ごとに直近 keep_per_namespace を保護
+    # namespace/table ごとに直近 keep_per_namespace を保護（バッチ一覧は landing のカタログから）
     groups: dict[str, list[Path]] = {}
-    for batch in landing.rglob("batch_id=*"):
-        if not batch.is_dir():
+    for entry in list_batches(landing):
+        if not entry["dir"].is_dir():
             continue
-        ns = "<unknown>"
-        tbl = "<unknown>"
-        for part in batch.parts:
-            if part.startswith("namespace="):
-                ns = part.split("=", 1)[1]
-            if part.startswith("table="):
-                tbl = part.split("=", 1)[1]
-        key = f"{ns}/{tbl}"
-        groups.setdefault(key, []).append(batch)
+        key = f"{entry['namespace']}/{entry['table_name']}"
+        groups.setdefault(key, []).append(entry["dir"])
 
+    # 先に圧縮対象と削除対象を決める（この回で消すバッチは圧縮しない）
+    to_compress: list[Path] = []
+    to_delete: list[Path] = []
     for key, batches in groups.items():
         batches.sort(key=lambda p: str(p))  # batch_id 命名が時系列ソート前提
         protected = set(batches[-keep_per_namespace:]) if keep_per_namespace > 0 else set()
@@ -68,18 +180,31 @@ def clean_landing():
                 print(f"[landing-clean] skip (no run_date): {b}")
                 continue
 
-            parts_dir = b / "parts"
-            if parts_dir.exists() and run_dt < cutoff_compress:
-                _compress_csv_in_parts(parts_dir)
-
             if b in protected:
                 print(f"[landing-clean] protect latest: {b}")
+            elif run_dt < cutoff_delete:
+                to_delete.append(b)
                 continue
 
-            if run_dt < cutoff_delete:
-                shutil.rmtree(b)
-                print(f"[landing-clean] deleted: {b}")
+            if (b / "parts").exists() and run_dt < cutoff_compress:
+                to_compress.append(b)
+
+    _print_summary(compress_batches(landing, to_compress, codec, level, workers))
+
+    for b in to_delete:
+        shutil.rmtree(b)
+        unregister_batch(landing, b)
+        print(f"[landing-clean] deleted: {b}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compress old landing batches and delete expired ones")
+    ap.add_argument("--codec", choices=sorted(COMPRESS_CODECS), help="default: LANDING_COMPRESS_CODEC or gzip")
+    ap.add_argument("--level", type=int, help="default: LANDING_COMPRESS_LEVEL or the codec default (gzip 6, zstd 3)")
+    ap.add_argument("--workers", type=int, help="compression processes (default: LANDING_COMPRESS_WORKERS or CPU count)")
+    args = ap.parse_args()
+    clean_landing(codec=args.codec, level=args.level, workers=args.workers)
 
 
 if __name__ == "__main__":
-    clean_landing()
\ No newline at end of file
+    main()
\ No newline at end of file
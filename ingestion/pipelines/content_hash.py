@@ -0,0 +1,94 @@
+# ingestion/pipelines/content_hash.py
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+from pathlib import Path
+
+from ingestion.utils import COMPRESSED_CSV_SUFFIXES
+
+# manifest.json に記録するコンテンツハッシュ（.env の LANDING_HASH_ALGO。既定 auto）
+#   md5 / sha256 / blake2b : hashlib（常に使える）
+#   xxh3_128 / xxh64       : xxhash パッケージ（任意依存。非暗号だが桁違いに速い）
+#   blake3                 : blake3 パッケージ（任意依存）
+# auto は _AUTO_ORDER のうち import できる最初のもの（hashlib だけなら SHA 拡張命令が効く sha256）。
+# manifest には hash_algo と、ファイルごとに <algo>: <hexdigest> を書く（旧形式は md5 のみ = hash_algo 無し）。
+HASH_ALGOS = ("md5", "sha256", "blake2b", "xxh3_128", "xxh64", "blake3")
+_AUTO_ORDER = ("xxh3_128", "blake3", "sha256")
+LEGACY_HASH_ALGO = "md5"
+
+READ_CHUNK = 4 * 1024 * 1024
+# これ以上のファイルは mmap して memoryview のままハッシュに渡す（read のバッファコピーを省く）
+MMAP_THRESHOLD = 64 * 1024 * 1024
+_MMAP_SLICE = 64 * 1024 * 1024
+
+
+def new_hasher(algo: str):
+    """algo のハッシュオブジェクト（update / hexdigest を持つ）を返す。任意依存が無ければ RuntimeError。"""
+    if algo in ("md5", "sha256", "blake2b"):
+        return hashlib.new(algo)
+    if algo in ("xxh3_128", "xxh64"):
+        try:
+            import xxhash
+        except ImportError as e:
+            raise RuntimeError(f"hash algo '{algo}' requires the xxhash package (pip install xxhash)") from e
+        return getattr(xxhash, algo)()
+    if algo == "blake3":
+        try:
+            import blake3
+        except ImportError as e:
+            raise RuntimeError("hash algo 'blake3' requires the blake3 package (pip install blake3)") from e
+        return blake3.blake3()
+    raise ValueError(f"unknown hash algo '{algo}' (choose from: {', '.join(HASH_ALGOS)})")
+
+
+def resolve_hash_algo(algo: str | None = None) -> str:
+    """引数 → LANDING_HASH_ALGO → auto の順に決め、使えることを確かめて返す。"""
+    algo = algo or os.getenv("LANDING_HASH_ALGO", "auto")
+    if algo != "auto":
+        new_hasher(algo)
+        return algo
+    for candidate in _AUTO_ORDER:
+        try:
+            new_hasher(candidate)
+        except RuntimeError:
+            continue
+        return candidate
+    return "sha256"
+
+
+def hash_file(path: Path, algo: str) -> str:
+    """
+    ファイル全体のハッシュ。MMAP_THRESHOLD 以上は mmap で読む。
+    圧縮パーツ（.gz / .zst）は展開しながら元の CSV のハッシュを計算する（manifest は圧縮前の値）。
+    """
+    h = new_hasher(algo)
+    if path.suffix in COMPRESSED_CSV_SUFFIXES:
+        import pyarrow as pa
+        with pa.input_stream(str(path), compression="detect") as f:
+            while chunk := f.read(READ_CHUNK):
+                h.update(chunk)
+        return h.hexdigest()
+
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                try:
+                    for offset in range(0, size, _MMAP_SLICE):
+                        h.update(view[offset:offset + _MMAP_SLICE])
+                finally:
+                    view.release()
+        else:
+            while chunk := f.read(READ_CHUNK):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def manifest_hash(meta: dict, file_meta: dict) -> tuple[str, str] | None:
+    """manifest とそのファイル要素から (algo, hexdigest) を返す。旧形式は md5。記録が無ければ None。"""
+    algo = meta.get("hash_algo", LEGACY_HASH_ALGO)
+    digest = file_meta.get(algo)
+    return (algo, digest) if digest else None
@@ -2,21 +2,47 @@
 from __future__ import annotations
 
 import argparse
+import codecs
+import io
+import itertools
+import multiprocessing
 import os
+import queue
 import sys
 import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import duckdb
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import yaml
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 from ingestion.utils import (
     get_engine, ensure_schema, get_paths,
-    table_exists, get_table_columns, create_text_table, add_missing_text_columns
+    create_text_table, add_missing_text_columns,
+    cached_header, store_header, cached_table_columns, cached_table_types, invalidate_table_cache,
+    save_schema_cache, table_exists, has_primary_key, get_table_column_types,
+    COMPRESSED_CSV_SUFFIXES, glob_csv_parts,
 )
+from ingestion.pipelines.ingest_ledger import (
+    batch_id_of, bump_table_version, forget_table, next_table_version, pending_files, read_ledger,
+    read_table_version, record_ledger,
+)
+from ingestion.pipelines.landing_parquet import parquet_copy_of
+from ingestion.pipelines.snapshot_delta import (
+    plan_delta, snapshot_layout, snapshot_outputs, unchanged_snapshot, write_sidecar,
+)
+from ingestion.pipelines.snapshot_query import SNAPSHOT_DATE_COL, create_snapshot_views
 
 # ---------------------------
 # Paths / Config
@@ -40,28 +66,63 @@ def load_config() -> dict:
     return cfg
 
 
+def find_table_spec(tables_cfg: dict, namespace: str, table: str) -> dict | None:
+    """landing の namespace/table に対応する tables.yml の設定（folder 一致 → テーブル名）。"""
+    folder = f"namespace={namespace}/table={table}"
+    for spec in tables_cfg.values():
+        if spec.get("folder") == folder:
+            return spec
+    return tables_cfg.get(table)
+
+
 def _iter_csv_files(folder_root: Path, folder: str, pattern: str) -> list[Path]:
     base = folder_root / folder
     if not base.exists():
         print(f"[warn] base folder not found: {base}")
         return []
-    return sorted(base.glob(pattern), key=lambda p: str(p))
+    return glob_csv_parts(base, pattern)
+
+
+def _rowskip(cfg: dict) -> int:
+    """ヘッダ前に読み飛ばす行数。tables.yml の defaults は skiprows、旧キーは rowskip。"""
+    return int(cfg.get("rowskip", cfg.get("skiprows", 0)))
+
+
+def _landing_encoding(spec: dict | None, fallback: str | None = None) -> str:
+    """
+    landing のパーツを読むエンコーディング。tables.yml の encoding を先に見る
+    （manifest / land_import の --encoding は既定の utf-8 のまま記録されていることがある）。
+    """
+    return (spec or {}).get("encoding") or fallback or "utf-8"
+
+
+# DuckDB の read_csv が拡張なしで扱えるエンコーディング（codecs の正規名 → DuckDB 名）
+_DUCKDB_CSV_ENCODINGS = {"utf-8": "utf-8", "utf-8-sig": "utf-8", "iso8859-1": "latin-1", "utf-16": "utf-16"}
 
 
-def _ensure_utf8_copy(path: Path, src_encoding: str) -> Path:
-    enc = (src_encoding or "utf-8").lower()
-    if enc in ("utf-8", "utf8", "utf-8-sig"):
-        return path
-    dst = path.with_suffix(path.suffix + ".utf8.tmp")
-    with path.open("r", encoding=src_encoding, newline="") as src, dst.open("w", encoding="utf-8", newline="") as out:
-        for line in src:
-            out.write(line)
-    return dst
+def _codec_name(encoding: str | None) -> str:
+    return codecs.lookup(encoding or "utf-8").name
+
+
+def _is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSED_CSV_SUFFIXES
+
+
+def _open_part(path: Path) -> pa.NativeFile:
+    """
+    CSV パーツをバイナリストリームで開く。.gz / .zst は pyarrow がストリームで展開する
+    （展開済みコピーはディスクに作らない。pandas 単体では zstandard が要るため pyarrow に寄せる）。
+    """
+    return pa.input_stream(str(path), compression="detect")
 
 
 def _read_header_raw(path: Path, encoding: str, rowskip: int = 0) -> list[str]:
+    """
+    元のエンコーディングのままヘッダ行だけをデコードして返す。
+    テキストラッパのバッファ分（先頭数 KB）しか読まないので、巨大ファイルでも UTF-8 変換コピーは不要。
+    """
     import csv
-    with path.open("r", encoding=encoding, newline="") as f:
+    with io.TextIOWrapper(_open_part(path), encoding=encoding, newline="") as f:
         for _ in range(rowskip):
             if f.readline() == "":
                 return []
@@ -76,6 +137,10 @@ def _read_header_raw(path: Path, encoding: str, rowskip: int = 0) -> list[str]:
 
 
 def _analyze_headers(files: list[Path], encoding: str, rowskip: int) -> tuple[list[str], dict[Path, list[str]]]:
+    """
+    全ファイルのヘッダから union 列と、ファイルごとの正規化列名（重複列は _1, _2 ...）を求める。
+    生ヘッダはファイル fingerprint 単位でスキーマキャッシュに残し、変化の無いファイルは開かない。
+    """
     if not files:
         return [], {}
 
@@ -84,8 +149,13 @@ def _analyze_headers(files: list[Path], encoding: str, rowskip: int) -> tuple[li
     max_mult: dict[str, int] = {}
     per_file_raw: dict[Path, list[str]] = {}
 
+    cache_dirty = False
     for f in files:
-        hdr = _read_header_raw(f, encoding=encoding, rowskip=rowskip)
+        hdr = cached_header(f, encoding, rowskip)
+        if hdr is None:
+            hdr = _read_header_raw(f, encoding=encoding, rowskip=rowskip)
+            store_header(f, encoding, rowskip, hdr)
+            cache_dirty = True
         per_file_raw[f] = hdr
         counts: dict[str, int] = {}
         for col in hdr:
@@ -96,6 +166,8 @@ def _analyze_headers(files: list[Path], encoding: str, rowskip: int) -> tuple[li
         for col, c in counts.items():
             if c > max_mult.get(col, 0):
                 max_mult[col] = c
+    if cache_dirty:
+        save_schema_cache(tables=False)
 
     union_cols: list[str] = []
     for base in order:
@@ -121,31 +193,38 @@ def _analyze_headers(files: list[Path], encoding: str, rowskip: int) -> tuple[li
     return union_cols, norm_by_file
 
 
-def _dedupe_temp_by_pk(engine: Engine, temp_fqtn: str, pk_cols: list[str]):
+# TEMP の取り込み順（ファイル序数, ファイル内行序数）。後勝ちの判定に使い、本テーブルには入れない
+FILE_ORD = "__file_ord"
+ROW_ORD = "__row_ord"
+
+
+def _last_wins_select(
+    temp_fqtn: str, db_columns: list[str], pk_cols: list[str], col_types: dict[str, str] | None = None
+) -> str:
     """
-    TEMP 内の主キー重複を「後勝ち（最後に入った行が残る）」に正規化。
-    DuckDB では ctid ではなく rowid を使用し、MAX(rowid) を残します。
+    TEMP 内の主キー重複を「後勝ち（最後に読んだ行が残る）」で 1 行にする SELECT。
+    rowid ではなく (FILE_ORD, ROW_ORD) の明示的な読み込み順で決め、QUALIFY の 1 パスで UPSERT に渡す。
+    col_types（本テーブルの型）が TEXT 以外の列は CAST して返す。
     """
+    cols = ", ".join([_cast_expr(c, (col_types or {}).get(c)) for c in db_columns])
     if not pk_cols:
-        return
-    sql = f"""
-        DELETE FROM {temp_fqtn}
-        WHERE rowid NOT IN (
-            SELECT MAX(rowid)
-            FROM {temp_fqtn}
-            GROUP BY {", ".join([f'"{c}"' for c in pk_cols])}
-        );
+        return f"SELECT {cols} FROM {temp_fqtn}"
+    return f"""
+        SELECT {cols}
+        FROM {temp_fqtn}
+        QUALIFY row_number() OVER (
+            PARTITION BY {", ".join([f'"{c}"' for c in pk_cols])}
+            ORDER BY "{FILE_ORD}" DESC, "{ROW_ORD}" DESC
+        ) = 1
     """
-    with engine.begin() as conn:
-        conn.execute(text(sql))
 
 
 def _copy_df_to_table(engine: Engine, df: pd.DataFrame, table_fqtn: str, columns: list[str]):
     """DuckDB のネイティブ機能を利用して DataFrame を直接テーブルにインサート"""
     if df.empty:
         return
-    df2 = df.reindex(columns=columns)
-    df2 = df2.where(pd.notna(df2), None)  # DuckDB では None が NULL として扱われます
+    # 呼び出し側で列を揃えていれば reindex のコピーは不要。NaN/pd.NA は DuckDB 側で NULL になる
+    df2 = df if list(df.columns) == columns else df.reindex(columns=columns)
 
     raw_conn = engine.raw_connection()
     try:
@@ -158,15 +237,906 @@ def _copy_df_to_table(engine: Engine, df: pd.DataFrame, table_fqtn: str, columns
         raw_conn.close()
 
 
+def _peak_rss_mb() -> float | None:
+    """プロセスのピーク RSS（MiB）。resource が無い環境（Windows）では None。"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB, macOS は byte 単位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _log_chunk(table_name: str, i: int, rows: int, elapsed: float):
+    rss = _peak_rss_mb()
+    rss_txt = f", peak_rss={rss:.0f}MiB" if rss is not None else ""
+    print(f"[{table_name}]   chunk {i}: rows={rows:,} {elapsed * 1000:.0f}ms{rss_txt}")
+
+
+def _staging_select(norm_cols: list[str], db_columns: list[str], pk_cols: list[str]) -> tuple[str, str]:
+    """
+    ファイル列（正規化後）から TEMP 列への SELECT 句と、PK 欠損行を落とす WHERE 句を作る。
+    ファイルに無い列は NULL、DB に無い列（--auto-add-columns なし）は捨てる。
+    """
+    select_cols = ", ".join(
+        [f'"{c}"' if c in norm_cols else f'NULL AS "{c}"' for c in db_columns]
+    )
+    where_sql = " AND ".join(
+        [f'"{pk}" IS NOT NULL AND "{pk}" <> \'\'' for pk in pk_cols if pk in norm_cols]
+    )
+    return select_cols, (f"WHERE {where_sql}" if where_sql else "")
+
+
+def _staging_insert_cols(db_columns: list[str]) -> str:
+    return ", ".join([f'"{c}"' for c in db_columns + [FILE_ORD, ROW_ORD]])
+
+
 def _make_temp_text_table(engine: Engine, columns: list[str]) -> str:
-    """TEXT 列の TEMP TABLE を作成してテーブル名を返す。DuckDB は pg_temp 不要。"""
-    temp_name = f"stg_{int(datetime.now().timestamp())}_{os.getpid()}"
-    cols_sql = ", ".join([f'"{c}" TEXT' for c in columns])
+    """TEXT 列 + 取り込み順の列の TEMP TABLE を作成してテーブル名を返す。DuckDB は pg_temp 不要。"""
+    temp_name = f"stg_{time.time_ns()}_{os.getpid()}"
+    cols_sql = ", ".join([f'"{c}" TEXT' for c in columns] + [f'"{FILE_ORD}" INTEGER', f'"{ROW_ORD}" BIGINT'])
     with engine.begin() as conn:
         conn.execute(text(f'CREATE TEMP TABLE "{temp_name}" ({cols_sql});'))
     return f'"{temp_name}"'
 
 
+def _sql_literal(value: str) -> str:
+    """SQL 文字列リテラル化（read_csv 等のテーブル関数の引数はバインドできないため）。"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _read_workers(cfg: dict, files: list[Path]) -> int:
+    """
+    ファイル先読みのスレッド数。tables.yml の read_workers が優先。
+    未指定なら圧縮パーツを含むときだけ min(4, CPU 数)（展開が律速になるため）、それ以外は 1。
+    """
+    if cfg.get("read_workers") is not None:
+        return max(1, int(cfg["read_workers"]))
+    if any(_is_compressed(f) for f in files):
+        return min(4, os.cpu_count() or 1)
+    return 1
+
+
+_PREFETCH_DONE = object()
+
+
+def _prefetch_chunks(files: list[Path], read_chunks, workers: int, depth: int = 2):
+    """
+    files を先頭から順に (file, chunk イテレータ) で返す。workers > 1 なら後続ファイルを
+    別スレッドで並行して読み進める（gzip/zstd の展開と CSV パースは GIL を離す）。
+    各ファイルの先読みは depth チャンクまでなので、メモリは概ね workers × depth × chunksize 行で頭打ち。
+    消費側の順序（= FILE_ORD と後勝ち）は変わらない。途中で例外が出たら残りの読み込みは打ち切る。
+    """
+    if workers <= 1 or len(files) <= 1:
+        for f in files:
+            yield f, read_chunks(f)
+        return
+
+    stop = threading.Event()
+
+    def _put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(f: Path, q: queue.Queue):
+        try:
+            for chunk in read_chunks(f):
+                if not _put(q, chunk):
+                    return
+            _put(q, _PREFETCH_DONE)
+        except BaseException as e:
+            _put(q, e)
+
+    def _consume(q: queue.Queue):
+        while True:
+            item = q.get()
+            if item is _PREFETCH_DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv_prefetch")
+    try:
+        queues = []
+        for f in files:
+            q: queue.Queue = queue.Queue(maxsize=depth)
+            pool.submit(_produce, f, q)
+            queues.append(q)
+        for f, q in zip(files, queues):
+            yield f, _consume(q)
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_pandas_chunks(path: Path, chunksize: int, rowskip: int, encoding: str):
+    """pandas の chunk 読み込み。圧縮パーツも _open_part のストリームから直接読む。"""
+    with _open_part(path) as src:
+        yield from pd.read_csv(
+            src,
+            header=0,
+            dtype=str,
+            chunksize=chunksize,
+            na_filter=True,
+            keep_default_na=False,
+            na_values=[""],
+            encoding=encoding,
+            skiprows=rowskip,
+        )
+
+
+def _load_files_pandas(
+    engine: Engine,
+    table_name: str,
+    files: list[Path],
+    norm_by_file: dict[Path, list[str]],
+    temp_fqtn: str,
+    db_columns: list[str],
+    pk_cols: list[str],
+    chunksize: int,
+    rowskip: int,
+    encoding: str,
+    read_workers: int = 1,
+    file_ord_base: int = 0,
+):
+    """pandas の chunk 読み込みで TEMP へ投入（既定エンジン）。デコードは read_csv がストリームで行う。"""
+    prefetched = _prefetch_chunks(
+        files, lambda f: _iter_pandas_chunks(f, chunksize, rowskip, encoding), read_workers
+    )
+    for file_ord, (f, chunks) in enumerate(prefetched, file_ord_base):
+        print(f"[{table_name}] Loading {f}")
+        norm_cols = norm_by_file[f]
+
+        offset = 0
+        t0 = time.perf_counter()
+        for i, chunk in enumerate(chunks, 1):
+            chunk.columns = norm_cols
+            chunk[ROW_ORD] = np.arange(offset, offset + len(chunk), dtype=np.int64)
+            offset += len(chunk)
+
+            for pk in pk_cols:
+                if pk in chunk.columns:
+                    chunk = chunk[chunk[pk].notna() & (chunk[pk] != "")]
+
+            for c in db_columns:
+                if c not in chunk.columns:
+                    chunk[c] = pd.NA
+            chunk[FILE_ORD] = file_ord
+            chunk = chunk[db_columns + [FILE_ORD, ROW_ORD]]
+
+            _copy_df_to_table(engine, chunk, temp_fqtn, db_columns + [FILE_ORD, ROW_ORD])
+            _log_chunk(table_name, i, len(chunk), time.perf_counter() - t0)
+            t0 = time.perf_counter()
+
+
+def _open_arrow_csv(path: Path, norm_cols: list[str], rowskip: int, encoding: str) -> pacsv.CSVStreamingReader:
+    """
+    pyarrow のストリーミング CSV リーダを開く。全列 string・空欄（引用符付きを含む）は NULL。
+    UTF-8 以外はリーダ内部でブロック単位に UTF-8 へトランスコードされる（一時ファイルは作らない）。
+    .gz / .zst は _open_part のストリームで展開しながら読む。
+    """
+    codec = _codec_name(encoding)
+    return pacsv.open_csv(
+        _open_part(path),
+        read_options=pacsv.ReadOptions(
+            skip_rows=rowskip + 1,
+            column_names=norm_cols,
+            encoding="utf8" if codec in ("utf-8", "utf-8-sig") else encoding,
+        ),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in norm_cols},
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+
+
+def _iter_arrow_chunks(path: Path, norm_cols: list[str], rowskip: int, chunksize: int, encoding: str):
+    """
+    _open_arrow_csv のバッチを chunksize 行ずつの Arrow Table にまとめて返す。
+    末尾にファイル内の行序数 ROW_ORD（int64）を付ける。
+    """
+    reader = _open_arrow_csv(path, norm_cols, rowskip, encoding)
+    pending: list[pa.RecordBatch] = []
+    pending_rows = 0
+    offset = 0
+
+    def _flush() -> pa.Table:
+        table = pa.Table.from_batches(pending)
+        return table.append_column(ROW_ORD, pa.array(np.arange(offset, offset + table.num_rows, dtype=np.int64)))
+
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= chunksize:
+            yield _flush()
+            offset += pending_rows
+            pending, pending_rows = [], 0
+    if pending_rows:
+        yield _flush()
+
+
+def _load_files_arrow(
+    engine: Engine,
+    table_name: str,
+    files: list[Path],
+    norm_by_file: dict[Path, list[str]],
+    temp_fqtn: str,
+    db_columns: list[str],
+    pk_cols: list[str],
+    chunksize: int,
+    rowskip: int,
+    encoding: str,
+    read_workers: int = 1,
+    file_ord_base: int = 0,
+):
+    """pyarrow で chunk を読み、Arrow Table のまま DuckDB へ渡して TEMP へ投入（engine: arrow）。"""
+    def _read_chunks(f: Path):
+        if not norm_by_file[f]:
+            return iter(())
+        return _iter_arrow_chunks(f, norm_by_file[f], rowskip, chunksize, encoding)
+
+    raw_conn = engine.raw_connection()
+    try:
+        duck_conn = raw_conn.connection
+        for file_ord, (f, chunks) in enumerate(_prefetch_chunks(files, _read_chunks, read_workers), file_ord_base):
+            print(f"[{table_name}] Loading {f} (arrow)")
+            norm_cols = norm_by_file[f]
+            if not norm_cols:
+                continue
+            select_cols, where_sql = _staging_select(norm_cols, db_columns, pk_cols)
+
+            t0 = time.perf_counter()
+            for i, chunk in enumerate(chunks, 1):
+                duck_conn.register("temp_arrow", chunk)
+                duck_conn.execute(f"""
+                    INSERT INTO {temp_fqtn} ({_staging_insert_cols(db_columns)})
+                    SELECT {select_cols}, {file_ord}, "{ROW_ORD}" FROM temp_arrow {where_sql}
+                """)
+                duck_conn.unregister("temp_arrow")
+                _log_chunk(table_name, i, chunk.num_rows, time.perf_counter() - t0)
+                t0 = time.perf_counter()
+    finally:
+        raw_conn.close()
+
+
+def _group_consecutive_by_header(
+    files: list[Path], norm_by_file: dict[Path, list[str]]
+) -> list[tuple[list[str], list[Path]]]:
+    """ファイル順を保ったまま、正規化ヘッダが同じ連続ファイルをまとめる。"""
+    groups: list[tuple[list[str], list[Path]]] = []
+    for f in files:
+        norm_cols = norm_by_file[f]
+        if groups and groups[-1][0] == norm_cols:
+            groups[-1][1].append(f)
+        else:
+            groups.append((norm_cols, [f]))
+    return groups
+
+
+def _load_files_duckdb_native(
+    engine: Engine,
+    table_name: str,
+    files: list[Path],
+    norm_by_file: dict[Path, list[str]],
+    temp_fqtn: str,
+    db_columns: list[str],
+    pk_cols: list[str],
+    rowskip: int,
+    encoding: str,
+    file_ord_base: int = 0,
+):
+    """
+    DuckDB の read_csv（並列 CSV リーダ）で TEMP へ直接投入する（engine: duckdb_native）。
+    列名は _analyze_headers の正規化結果を names= で与え、全列 VARCHAR・空欄 NULL で読む。
+    後勝ちの順序を崩さないよう、正規化ヘッダが同じ「連続した」ファイル群ごとに 1 文で投入する。
+    read_csv が扱えないエンコーディング（cp932 等）は pyarrow のトランスコードストリームを
+    RecordBatchReader のまま DuckDB に渡す（UTF-8 の一時コピーは作らない）。
+    .gz / .zst は read_csv が拡張子から判定してストリーム展開し、複数ファイルは並列に読む。
+    ファイル序数は filename 列のリスト内位置、行序数は row_number() OVER ()
+    （DuckDB は既定で読み込み順を保持するのでファイル内の行順になる）。
+    """
+    duck_encoding = _DUCKDB_CSV_ENCODINGS.get(_codec_name(encoding))
+    raw_conn = engine.raw_connection()
+    try:
+        duck_conn = raw_conn.connection
+        ord_base = file_ord_base
+        for norm_cols, group_files in _group_consecutive_by_header(files, norm_by_file):
+            group_base, ord_base = ord_base, ord_base + len(group_files)
+            if not norm_cols:
+                continue
+            select_cols, where_sql = _staging_select(norm_cols, db_columns, pk_cols)
+            if duck_encoding is None:
+                for i, f in enumerate(group_files):
+                    print(f"[{table_name}] Loading {f} (duckdb_native, transcoding {encoding})")
+                    duck_conn.register("temp_csv_stream", _open_arrow_csv(f, norm_cols, rowskip, encoding))
+                    duck_conn.execute(f"""
+                        INSERT INTO {temp_fqtn} ({_staging_insert_cols(db_columns)})
+                        SELECT {select_cols}, {group_base + i}, row_number() OVER ()
+                        FROM temp_csv_stream {where_sql}
+                    """)
+                    duck_conn.unregister("temp_csv_stream")
+                continue
+
+            for f in group_files:
+                print(f"[{table_name}] Loading {f} (duckdb_native)")
+
+            file_list = "[" + ", ".join(_sql_literal(str(f)) for f in group_files) + "]"
+            names = "[" + ", ".join(_sql_literal(c) for c in norm_cols) + "]"
+            duck_conn.execute(f"""
+                INSERT INTO {temp_fqtn} ({_staging_insert_cols(db_columns)})
+                SELECT {select_cols},
+                       {group_base} + list_position({file_list}, "__src_file") - 1,
+                       row_number() OVER ()
+                FROM read_csv(
+                    {file_list},
+                    filename = '__src_file',
+                    header = false,
+                    skip = {rowskip + 1},
+                    names = {names},
+                    all_varchar = true,
+                    union_by_name = true,
+                    encoding = {_sql_literal(duck_encoding)},
+                    delim = ',',
+                    quote = '"',
+                    null_padding = true
+                )
+                {where_sql}
+            """)
+    finally:
+        raw_conn.close()
+
+
+def _load_files_parquet(
+    engine: Engine,
+    table_name: str,
+    files: list[Path],
+    norm_by_file: dict[Path, list[str]],
+    temp_fqtn: str,
+    db_columns: list[str],
+    pk_cols: list[str],
+    file_ord_base: int = 0,
+):
+    """
+    stage_table が書いた中間 Parquet（列名は正規化済み, ROW_ORD 付き）や landing の Parquet コピーを
+    read_parquet で TEMP へ投入。landing のコピーはファイル単体で重複列を正規化しているので、
+    列は位置で norm_by_file の名前に付け替える（同じグループ内はヘッダが同一 = Parquet の列も同一）。
+    """
+    raw_conn = engine.raw_connection()
+    try:
+        duck_conn = raw_conn.connection
+        ord_base = file_ord_base
+        for norm_cols, group_files in _group_consecutive_by_header(files, norm_by_file):
+            group_base, ord_base = ord_base, ord_base + len(group_files)
+            if not norm_cols:
+                continue
+            file_list = "[" + ", ".join(_sql_literal(str(f)) for f in group_files) + "]"
+            select_cols, where_sql = _staging_select(norm_cols, db_columns, pk_cols)
+            duck_conn.execute(f"""
+                INSERT INTO {temp_fqtn} ({_staging_insert_cols(db_columns)})
+                SELECT {select_cols},
+                       {group_base} + list_position({file_list}, "__src_file") - 1,
+                       "{ROW_ORD}"
+                FROM read_parquet({file_list}, filename = '__src_file')
+                     AS t({", ".join(f'"{c}"' for c in norm_cols)}, "{ROW_ORD}") {where_sql}
+            """)
+    finally:
+        raw_conn.close()
+
+
+def _parquet_copies(table_name: str, cfg: dict, files: list[Path], norm_by_file: dict[Path, list[str]]) -> dict[Path, Path]:
+    """
+    landing の Parquet コピー（land_import --parquet）が使えるファイル → コピー。
+    tables.yml の prefer_parquet: false なら常に CSV を読む。
+    """
+    if not cfg.get("prefer_parquet", True):
+        return {}
+    rowskip = _rowskip(cfg)
+    copies: dict[Path, Path] = {}
+    for f in files:
+        if norm_by_file.get(f):
+            copy = parquet_copy_of(f, cfg["folder"], len(norm_by_file[f]), rowskip)
+            if copy is not None:
+                copies[f] = copy
+    if copies:
+        print(f"[{table_name}] {len(copies)}/{len(files)} file(s) have landing Parquet copies; reading those instead")
+    return copies
+
+
+def stage_table(
+    table_name: str, cfg: dict, csv_root: Path, chunksize: int, load_files: list[Path] | None = None
+) -> dict:
+    """
+    --jobs 用のワーカ処理（別プロセスで実行）。DB には触れず、
+    ヘッダ解析と CSV パースだけを行い、正規化列名・全列 string の中間 Parquet を書き出す。
+    load_files を渡すとヘッダ解析は全ファイル、パースはその分だけ（台帳で選んだ未取り込み分）。
+    戻り値の dict を upsert_staged_table に渡すと、単一の DuckDB 接続で TEMP → UPSERT する。
+    parts は (中間 Parquet, 正規化列名, 元 CSV) のリスト。
+    """
+    started = time.perf_counter()
+    encoding = cfg.get("encoding", "utf-8")
+    rowskip = _rowskip(cfg)
+    src_files = _iter_csv_files(csv_root, cfg["folder"], cfg.get("filename_glob", "*.csv"))
+    staged = {
+        "table_name": table_name,
+        "cfg": cfg,
+        "src_files": len(src_files),
+        "union_cols": [],
+        "parts": [],
+        "col_types": {},
+        "stage_dir": None,
+        "stage_seconds": 0.0,
+    }
+    if not src_files:
+        print(f"[{table_name}] No CSV files under {(csv_root / cfg['folder'])}")
+        return staged
+
+    stage_dir = Path(tempfile.mkdtemp(prefix=f"stage_{table_name}_"))
+    try:
+        union_cols, norm_by_file = _analyze_headers(src_files, encoding=encoding, rowskip=rowskip)
+        wanted = set(src_files if load_files is None else load_files)
+        to_parse = [f for f in src_files if f in wanted and norm_by_file[f]]
+        # landing の Parquet コピーがあるファイルはパースせずそのまま渡す
+        copies = _parquet_copies(table_name, cfg, to_parse, norm_by_file)
+        staged_by_src = {f: (copy, norm_by_file[f], f) for f, copy in copies.items()}
+        to_read = [f for f in to_parse if f not in copies]
+        prefetched = _prefetch_chunks(
+            to_read,
+            lambda f: _iter_arrow_chunks(f, norm_by_file[f], rowskip, chunksize, encoding),
+            _read_workers(cfg, to_read),
+        )
+        for i, (f, chunks) in enumerate(prefetched):
+            norm_cols = norm_by_file[f]
+            out = stage_dir / f"{i:06d}.parquet"
+            schema = pa.schema([(c, pa.string()) for c in norm_cols] + [(ROW_ORD, pa.int64())])
+            with pq.ParquetWriter(out, schema, compression="snappy") as writer:
+                for chunk in chunks:
+                    writer.write_table(chunk)
+            staged_by_src[f] = (out, norm_cols, f)
+            print(f"[{table_name}] Staged {f} -> {out.name}", flush=True)
+        parts = [staged_by_src[f] for f in to_parse]
+        # typed: true なら型推論もワーカで済ませる（どの列が新規かは親が決める）
+        col_types = {}
+        if cfg.get("typed") and to_parse:
+            load_mode = cfg.get("load_mode", "upsert")
+            col_types = _infer_column_types(
+                to_parse, norm_by_file, _typed_candidates(union_cols, cfg["primary_key"], load_mode),
+                rowskip, encoding, int(cfg.get("type_sample_rows", 10_000)),
+            )
+    except BaseException:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        raise
+
+    staged.update(
+        union_cols=union_cols,
+        parts=parts,
+        col_types=col_types,
+        stage_dir=stage_dir,
+        stage_seconds=time.perf_counter() - started,
+    )
+    return staged
+
+
+def _drop_temp_table(engine: Engine, temp_fqtn: str):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {temp_fqtn};"))
+
+
+LOADER_ENGINES = ("pandas", "arrow", "duckdb_native")
+
+
+# ---------------------------
+# Typed raw（typed: true）
+# ---------------------------
+# 新しく作る列の型をサンプルから推論する。サンプルの非空値がすべて収まる最初の型を採用し、
+# どれにも収まらなければ TEXT。ロード時に収まらない値が来たら列を TEXT に戻し、値を REJECTS_TABLE に残す。
+TYPE_CANDIDATES = ("BIGINT", "DOUBLE", "DATE", "TIMESTAMP")
+# CAST が通っても元の文字列に戻らない値（'0012' → 12, '2020-01-01 10:00' → DATE 等）を避けるための表記パターン
+_TYPE_PATTERNS = {
+    "BIGINT": r"[+-]?(0|[1-9][0-9]*)",
+    "DOUBLE": r"[+-]?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?",
+    "DATE": r"[0-9]{4}-[0-9]{2}-[0-9]{2}",
+    "TIMESTAMP": r"[0-9]{4}-[0-9]{2}-[0-9]{2}[ T][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?",
+}
+REJECTS_TABLE = "_ingest_rejects"
+_REJECT_SAMPLES = 100
+
+
+def _is_text_type(col_type: str | None) -> bool:
+    return col_type is None or col_type in ("VARCHAR", "TEXT")
+
+
+def _cast_expr(col: str, col_type: str | None) -> str:
+    return f'"{col}"' if _is_text_type(col_type) else f'CAST("{col}" AS {col_type}) AS "{col}"'
+
+
+def _fits_type_sql(col: str, col_type: str) -> str:
+    """TEXT の値がその型に収まるかの SQL 式（NULL は true）。推論とロード時の衝突検査で共用。"""
+    c = f'"{col}"'
+    return (
+        f"({c} IS NULL OR (regexp_full_match({c}, {_sql_literal(_TYPE_PATTERNS[col_type])})"
+        f" AND TRY_CAST({c} AS {col_type}) IS NOT NULL))"
+    )
+
+
+def _typed_candidates(columns: list[str], pk_cols: list[str], load_mode: str) -> list[str]:
+    """型推論の対象列。upsert の PK 列は制約付きで後から ALTER できないので TEXT のまま。"""
+    return [c for c in columns if c != BATCH_ID_COL and not (load_mode == "upsert" and c in pk_cols)]
+
+
+def _infer_column_types(
+    files: list[Path],
+    norm_by_file: dict[Path, list[str]],
+    columns: list[str],
+    rowskip: int,
+    encoding: str,
+    sample_rows: int,
+) -> dict[str, str]:
+    """
+    先頭のファイルから合計 sample_rows 行（各列に非空値が現れるまでは後続ファイルも）を読み、
+    TEXT 以外に決まった列の {列: 型} を返す。判定は warehouse に触れないインメモリ DuckDB で行う。
+    """
+    wanted = set(columns)
+    fits = {c: dict.fromkeys(TYPE_CANDIDATES, True) for c in columns}
+    seen = dict.fromkeys(columns, 0)
+    sampled = 0
+    step = len(TYPE_CANDIDATES) + 1
+    con = duckdb.connect()
+    try:
+        for f in files:
+            here = [c for c in norm_by_file[f] if c in wanted]
+            if not here or (sampled >= sample_rows and all(seen[c] for c in here)):
+                continue
+            chunk = next(_iter_arrow_chunks(f, norm_by_file[f], rowskip, sample_rows, encoding), None)
+            if chunk is None or chunk.num_rows == 0:
+                continue
+            con.register("temp_sample", chunk.slice(0, sample_rows))
+            exprs = []
+            for c in here:
+                exprs.append(f'count("{c}")')
+                exprs += [f"bool_and({_fits_type_sql(c, t)})" for t in TYPE_CANDIDATES]
+            row = con.execute(f"SELECT {', '.join(exprs)} FROM temp_sample").fetchone()
+            con.unregister("temp_sample")
+            for i, c in enumerate(here):
+                seen[c] += row[i * step]
+                for t, ok in zip(TYPE_CANDIDATES, row[i * step + 1:(i + 1) * step]):
+                    fits[c][t] = fits[c][t] and bool(ok)
+            sampled += min(chunk.num_rows, sample_rows)
+            if sampled >= sample_rows and all(seen.values()):
+                break
+    finally:
+        con.close()
+
+    types: dict[str, str] = {}
+    for c in columns:
+        t = next((t for t in TYPE_CANDIDATES if fits[c][t]), None) if seen[c] else None
+        if t:
+            types[c] = t
+    return types
+
+
+def _rejects_ddl(schema: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS "{schema}"."{REJECTS_TABLE}" (
+            table_name TEXT,
+            column_name TEXT,
+            expected_type TEXT,
+            value TEXT,
+            src_file TEXT,
+            row_ord BIGINT,
+            logged_at TIMESTAMP
+        );
+    """
+
+
+def _widen_conflicting_columns(
+    engine: Engine,
+    table_name: str,
+    temp_fqtn: str,
+    target_base: str,
+    db_columns: list[str],
+    col_types: dict[str, str],
+    src_files: list[Path],
+) -> dict[str, str]:
+    """
+    TEMP の値が本テーブルの型に収まらない列を TEXT に戻し（ALTER）、収まらなかった値を
+    列ごとに最大 _REJECT_SAMPLES 件 REJECTS_TABLE に残す。戻り値は更新後の {列: 型}。
+    """
+    col_types = col_types or {}
+    typed = [c for c in db_columns if not _is_text_type(col_types.get(c))]
+    if not typed:
+        return col_types
+    counts_sql = ", ".join([f"count(*) FILTER (WHERE NOT {_fits_type_sql(c, col_types[c])})" for c in typed])
+    with engine.connect() as conn:
+        counts = conn.execute(text(f"SELECT {counts_sql} FROM {temp_fqtn}")).one()
+    bad = {c: n for c, n in zip(typed, counts) if n}
+    if not bad:
+        return col_types
+
+    schema = TARGET_SCHEMA
+    files_sql = "[" + ", ".join(_sql_literal(f.name) for f in src_files) + "]::TEXT[]"
+    with engine.begin() as conn:
+        conn.execute(text(_rejects_ddl(schema)))
+        for c in bad:
+            conn.execute(
+                text(f"""
+                    INSERT INTO "{schema}"."{REJECTS_TABLE}"
+                    SELECT :t, :c, :ty, "{c}", ({files_sql})["{FILE_ORD}" + 1], "{ROW_ORD}", now()
+                    FROM {temp_fqtn}
+                    WHERE NOT {_fits_type_sql(c, col_types[c])}
+                    LIMIT {_REJECT_SAMPLES}
+                """),
+                {"t": target_base, "c": c, "ty": col_types[c]},
+            )
+            conn.execute(text(f'ALTER TABLE "{schema}"."{target_base}" ALTER "{c}" TYPE TEXT'))
+    invalidate_table_cache(schema, target_base)
+    for c, n in bad.items():
+        print(f"[{table_name}] WARNING: {n} value(s) in {c} do not fit {col_types[c]}; widened to TEXT (see {REJECTS_TABLE})")
+    return {**col_types, **{c: "VARCHAR" for c in bad}}
+
+
+def _prepare_target_table(
+    engine: Engine,
+    table_name: str,
+    target_base: str,
+    union_cols: list[str],
+    pk_cols: list[str],
+    auto_add_columns: bool,
+    load_mode: str = "upsert",
+    infer_types=None,
+    track_loads: bool = False,
+) -> list[str]:
+    """
+    本テーブルを作成（無ければ）/ 新列を追加し、投入に使う DB 側の列リストを返す。
+    列リストはスキーマキャッシュから引き、DDL を実行したときだけ information_schema を読み直す。
+    replace は ON CONFLICT を使わず、永続化された ART 索引上の DELETE が極端に遅いので PK 制約なしで作る。
+    append も PK 制約なしで、BATCH_ID_COL を足す（戻り値の列リストには含めない）。
+    track_loads（snapshot.mode: delta）なら LOAD_SEQ_COL を足す（同じく戻り値には含めない）。
+    infer_types（typed: true のとき）は新しく作る列のリストを受けて {列: 型} を返す関数。
+    """
+    schema = TARGET_SCHEMA
+    db_columns = cached_table_columns(engine, schema, target_base)
+    if db_columns is None:
+        extra = [BATCH_ID_COL] if load_mode == "append" else []
+        col_types = infer_types(union_cols) if infer_types else None
+        if track_loads:
+            extra.append(LOAD_SEQ_COL)
+            col_types = {**(col_types or {}), LOAD_SEQ_COL: "BIGINT"}
+        create_text_table(
+            engine, schema, target_base, union_cols + extra, pk_cols if load_mode == "upsert" else [], col_types
+        )
+        typed_cols = {c: t for c, t in (col_types or {}).items() if c != LOAD_SEQ_COL}
+        if typed_cols:
+            print(f"[{table_name}] Typed columns: {', '.join(f'{c} {t}' for c, t in typed_cols.items())}")
+        return union_cols[:]
+
+    if load_mode == "append" and has_primary_key(engine, schema, target_base):
+        # upsert で作ったテーブルの PK 制約は ALTER で外せない。残したまま追記すると同じキーの行で PK 違反になる
+        raise ValueError(
+            f"[{table_name}] {schema}.{target_base} still has the primary key from load_mode: upsert; "
+            f"rebuild it for append: DROP TABLE {schema}.{target_base}, then re-run ingest "
+            f"(or make replay-table if old CSVs were cleaned)"
+        )
+    if load_mode == "append" and BATCH_ID_COL not in db_columns:
+        add_missing_text_columns(engine, schema, target_base, [BATCH_ID_COL])
+        db_columns = cached_table_columns(engine, schema, target_base)
+    if track_loads and LOAD_SEQ_COL not in db_columns:
+        add_missing_text_columns(engine, schema, target_base, [LOAD_SEQ_COL], {LOAD_SEQ_COL: "BIGINT"})
+        db_columns = cached_table_columns(engine, schema, target_base)
+
+    missing = [c for c in union_cols if c not in db_columns]
+    if missing:
+        if auto_add_columns:
+            add_missing_text_columns(engine, schema, target_base, missing, infer_types(missing) if infer_types else None)
+            db_columns = cached_table_columns(engine, schema, target_base)
+            print(f'[{table_name}] Added new columns: {", ".join(missing)}')
+        else:
+            print(f'[{table_name}] WARNING: New columns ignored (use --auto-add-columns): {", ".join(missing)}')
+    return [c for c in db_columns if c not in (BATCH_ID_COL, LOAD_SEQ_COL)]
+
+
+# TEMP の作り方。unindexed（既定）は索引なしで一括投入、indexed は従来どおり PK に INDEX を張る。
+# 後勝ちの QUALIFY も ON CONFLICT も TEMP の索引は使わないため、indexed は比較・切り戻し用。
+STAGING_MODES = ("unindexed", "indexed")
+
+
+def _staging_mode(table_name: str, cfg: dict) -> str:
+    mode = cfg.get("staging", "unindexed")
+    if mode not in STAGING_MODES:
+        raise ValueError(f"[{table_name}] unknown staging '{mode}' (choose from: {', '.join(STAGING_MODES)})")
+    return mode
+
+
+def _create_staging_table(engine: Engine, db_columns: list[str], pk_cols: list[str], staging: str = "unindexed") -> str:
+    temp_fqtn = _make_temp_text_table(engine, db_columns)
+
+    # Temp テーブルへの INDEX 作成 (DuckDBでは明示的なインデックス名が必要)
+    if pk_cols and staging == "indexed":
+        with engine.begin() as conn:
+            idx_cols = ", ".join([f'"{c}"' for c in pk_cols])
+            temp_clean_name = temp_fqtn.replace('"', '')
+            conn.execute(text(f'CREATE INDEX idx_{temp_clean_name} ON {temp_fqtn} ({idx_cols});'))
+    return temp_fqtn
+
+
+# 本テーブルへの反映方法。upsert は行単位の ON CONFLICT、replace は replace_keys 単位の差し替え
+# （今回の TEMP に現れたキーの行を一括 DELETE → ON CONFLICT なしで追記 INSERT）。
+# append は不変のイベント表向け。重複除去も衝突判定もせず追記し、各行に landing の batch_id を残す。
+LOAD_MODES = ("upsert", "replace", "append")
+
+# append の本テーブルに付ける列（プロモート済みファイル名の batch_id）。同じバッチの再取り込み検知に使う
+BATCH_ID_COL = "_batch_id"
+
+# snapshot.mode: delta のテーブルに付ける列。行を入れた・変えた反映のデータ版（ingest_ledger.VERSION_TABLE）
+LOAD_SEQ_COL = "_load_seq"
+
+
+def _tracks_loads(cfg: dict) -> bool:
+    """行ごとに反映の版を記録するか（delta スナップショットのテーブルだけ）。"""
+    return (cfg.get("snapshot") or {}).get("mode") == "delta"
+
+
+def _load_mode(table_name: str, cfg: dict) -> tuple[str, list[str]]:
+    """(load_mode, replace_keys) を返す。replace で replace_keys が無ければエラー。"""
+    mode = cfg.get("load_mode", "upsert")
+    if mode not in LOAD_MODES:
+        raise ValueError(f"[{table_name}] unknown load_mode '{mode}' (choose from: {', '.join(LOAD_MODES)})")
+    replace_keys = list(cfg.get("replace_keys") or [])
+    if mode == "replace":
+        if not replace_keys:
+            raise ValueError(f"[{table_name}] load_mode=replace requires replace_keys")
+        # 本テーブルに PK 制約を付けないので、キーの一意性は「replace_keys ⊂ primary_key」で担保する
+        outside = [k for k in replace_keys if k not in cfg["primary_key"]]
+        if outside:
+            raise ValueError(f"[{table_name}] replace_keys must be part of primary_key: {', '.join(outside)}")
+    return mode, replace_keys
+
+
+def _effective_full(table_name: str, load_mode: str, full: bool) -> bool:
+    """append は追記で冪等でないので full（台帳を無視した全ファイル再読込）を受け付けない。"""
+    if full and load_mode == "append":
+        print(f"[{table_name}] --full is ignored for load_mode=append (drop the table to rebuild)")
+        return False
+    return full
+
+
+def _check_replace_keys(table_name: str, replace_keys: list[str], columns: list[str]):
+    """replace_keys が CSV の列に無いと全行が NULL キー扱いで消し合うので、読み込み前に止める。"""
+    missing = [k for k in replace_keys if k not in columns]
+    if missing:
+        raise ValueError(
+            f"[{table_name}] replace_keys not found in CSV header: {', '.join(missing)} "
+            f"(columns: {', '.join(columns)})"
+        )
+
+
+def _merge_temp_into_target(
+    engine: Engine,
+    temp_fqtn: str,
+    target_fqtn: str,
+    db_columns: list[str],
+    pk_cols: list[str],
+    target_base: str,
+    ledger_entries: list[dict],
+    full: bool,
+    load_mode: str = "upsert",
+    replace_keys: list[str] | None = None,
+    batch_ids: list[str | None] | None = None,
+    col_types: dict[str, str] | None = None,
+    track_loads: bool = False,
+):
+    """
+    TEMP を後勝ちで重複除去しながら本テーブルへ反映。取り込んだファイルは同じトランザクションで台帳へ。
+    replace は「TEMP に含まれる replace_keys の組」を本テーブルから DELETE してから素の INSERT。
+    append は重複除去なしの素の INSERT。batch_ids（ファイル序数順）から各行の BATCH_ID_COL を埋める。
+    col_types（本テーブルの型）で TEXT 以外の列は CAST して入れる。
+    upsert は値が同じ行を更新しない。行が入った・変わったときだけテーブルのデータ版を進め、
+    track_loads なら入れた行と値が変わった行の LOAD_SEQ_COL にその版を書く（delta スナップショット用）。
+    """
+    col_types = col_types or {}
+    cols_sql = ", ".join([f'"{c}"' for c in db_columns])
+    select_sql = _last_wins_select(temp_fqtn, db_columns, pk_cols, col_types)
+    # 版はトランザクション内で決まるのでバインド変数で渡す
+    seq_col = f', "{LOAD_SEQ_COL}"' if track_loads else ""
+    seq_val = ", CAST(:load_seq AS BIGINT)" if track_loads else ""
+
+    if load_mode == "append":
+        ids_sql = "[" + ", ".join("NULL" if b is None else _sql_literal(b) for b in batch_ids or []) + "]::TEXT[]"
+        exprs_sql = ", ".join([_cast_expr(c, col_types.get(c)) for c in db_columns])
+        statements = [f"""
+            INSERT INTO {target_fqtn} ({cols_sql}, "{BATCH_ID_COL}"{seq_col})
+            SELECT {exprs_sql}, ({ids_sql})["{FILE_ORD}" + 1]{seq_val} FROM {temp_fqtn};
+        """]
+    elif load_mode == "replace":
+        keys_sql = ", ".join([_cast_expr(k, col_types.get(k)) for k in replace_keys])
+        match_sql = " AND ".join([f't."{k}" IS NOT DISTINCT FROM k."{k}"' for k in replace_keys])
+        statements = [
+            f"""
+            DELETE FROM {target_fqtn} AS t
+            USING (SELECT DISTINCT {keys_sql} FROM {temp_fqtn}) AS k
+            WHERE {match_sql};
+            """,
+            f"INSERT INTO {target_fqtn} ({cols_sql}{seq_col}) SELECT *{seq_val} FROM ({select_sql});",
+        ]
+    else:
+        non_key_cols = [c for c in db_columns if c not in pk_cols]
+        set_cols = non_key_cols + ([LOAD_SEQ_COL] if track_loads else [])
+        set_clause = (
+            "SET " + ", ".join([f'"{c}"=EXCLUDED."{c}"' for c in set_cols])
+            if non_key_cols else "DO NOTHING"
+        )
+        if non_key_cols:
+            old_sql = ", ".join([f'{target_fqtn}."{c}"' for c in non_key_cols])
+            new_sql = ", ".join([f'EXCLUDED."{c}"' for c in non_key_cols])
+            set_clause += f" WHERE ({old_sql}) IS DISTINCT FROM ({new_sql})"
+        # DuckDB の UPSERT (ON CONFLICT) 構文
+        statements = [f"""
+            INSERT INTO {target_fqtn} ({cols_sql}{seq_col})
+            SELECT *{seq_val} FROM ({select_sql})
+            ON CONFLICT ({", ".join([f'"{c}"' for c in pk_cols])})
+            DO UPDATE {set_clause};
+        """]
+
+    with engine.begin() as conn:
+        version = next_table_version(conn, TARGET_SCHEMA, target_base)
+        changed = 0
+        for sql in statements:
+            changed += conn.execute(text(sql), {"load_seq": version} if track_loads else {}).scalar() or 0
+        if changed:
+            bump_table_version(conn, TARGET_SCHEMA, target_base, version, track_loads)
+        record_ledger(conn, TARGET_SCHEMA, target_base, ledger_entries, full)
+
+
+def _select_pending(
+    engine: Engine,
+    table_name: str,
+    target_base: str,
+    src_files: list[Path],
+    csv_root: Path,
+    folder: str,
+    full: bool,
+    load_mode: str = "upsert",
+) -> tuple[list[Path], list[dict]]:
+    """
+    台帳（本テーブル単位）から未取り込みファイルを選ぶ（full なら全件）。
+    append は台帳のパスから batch_id も引いて、別名で再プロモートされたバッチも読まない
+    （台帳には記録して次回からパスだけで弾く）。
+    本テーブルが無ければ（外で DROP された）台帳とデータ版を捨てて全ファイルを読み直す。
+    """
+    if not table_exists(engine, TARGET_SCHEMA, target_base):
+        forgotten = forget_table(engine, TARGET_SCHEMA, target_base)
+        if forgotten:
+            print(f"[{table_name}] {TARGET_SCHEMA}.{target_base} is missing; cleared {forgotten} ledger entries, reloading all files")
+    ledger = {} if full else read_ledger(engine, TARGET_SCHEMA, target_base)
+    load_files, entries = pending_files(src_files, csv_root, folder, ledger)
+    skipped = len(src_files) - len(load_files)
+    if skipped:
+        hint = "" if load_mode == "append" else " (use --full to reload)"
+        print(f"[{table_name}] Skipping {skipped} already-loaded file(s){hint}")
+
+    if load_mode == "append" and load_files:
+        loaded = _loaded_batch_ids(ledger)
+        dup = sorted({b for b in map(batch_id_of, load_files) if b in loaded})
+        if dup:
+            load_files = [f for f in load_files if batch_id_of(f) not in loaded]
+            print(f"[{table_name}] Skipping batch(es) already appended: {', '.join(dup)}")
+    return load_files, entries
+
+
+def _loaded_batch_ids(ledger: dict[str, dict]) -> set[str]:
+    """台帳のパス（プロモート名 / landing の parts/）から取り込み済みの batch_id を引く（本テーブルは読まない）。"""
+    return {b for b in (batch_id_of(Path(p)) for p in ledger) if b}
+
+
 def upsert_table(
     engine: Engine,
     table_name: str,
@@ -174,127 +1144,470 @@ def upsert_table(
     csv_root: Path,
     chunksize: int,
     auto_add_columns: bool,
+    full: bool = False,
+    src_files: list[Path] | None = None,
 ):
+    """
+    CSV_ROOT/<folder> の CSV を TEMP へ読み込み、後勝ちで本テーブルへ UPSERT する。
+    既定は台帳（_ingest_ledger）に無いファイルだけを取り込むインクリメンタル。full=True で全ファイル。
+    src_files を渡すと glob の代わりにそのファイルをその順（= 後勝ちの順）で読む
+    （replay が landing の parts をコピーせずに渡す。台帳のパスは csv_root からの相対）。
+    """
     folder = cfg["folder"]
     pattern = cfg.get("filename_glob", "*.csv")
     pk_cols = cfg["primary_key"]
     encoding = cfg.get("encoding", "utf-8")
-    rowskip = int(cfg.get("rowskip", 0))
+    rowskip = _rowskip(cfg)
+    loader = cfg.get("engine", "pandas")
+    if loader not in LOADER_ENGINES:
+        raise ValueError(f"[{table_name}] unknown engine '{loader}' (choose from: {', '.join(LOADER_ENGINES)})")
+    staging = _staging_mode(table_name, cfg)
+    load_mode, replace_keys = _load_mode(table_name, cfg)
+    full = _effective_full(table_name, load_mode, full)
+    typed = bool(cfg.get("typed", False))
 
     schema = TARGET_SCHEMA
     target_base = cfg.get("target_table", table_name)
     target_fqtn = f'"{schema}"."{target_base}"'
 
-    src_files = _iter_csv_files(csv_root, folder, pattern)
+    if src_files is None:
+        src_files = _iter_csv_files(csv_root, folder, pattern)
     if not src_files:
         print(f"[{table_name}] No CSV files under {(csv_root / folder)}")
         return
 
-    processed_files: list[Path] = []
-    tmp_to_cleanup: list[Path] = []
-    for f in src_files:
-        g = _ensure_utf8_copy(f, encoding)
-        processed_files.append(g)
-        if g != f:
-            tmp_to_cleanup.append(g)
+    load_files, ledger_entries = _select_pending(
+        engine, table_name, target_base, src_files, csv_root, folder, full, load_mode
+    )
+    if not load_files:
+        if ledger_entries:
+            with engine.begin() as conn:
+                record_ledger(conn, schema, target_base, ledger_entries, full)
+        print(f"[{table_name}] No new files to load.")
+        return
 
+    started = time.perf_counter()
+    temp_fqtn: str | None = None
     try:
-        union_cols, norm_by_file = _analyze_headers(processed_files, encoding="utf-8", rowskip=rowskip)
+        # 列名の正規化（重複列の連番）は全ファイルのヘッダで決め、読み込むのは未取り込み分だけ
+        union_cols, norm_by_file = _analyze_headers(src_files, encoding=encoding, rowskip=rowskip)
         if not union_cols:
             print(f"[{table_name}] WARNING: header not found")
             return
+        _check_replace_keys(table_name, replace_keys, union_cols)
 
-        if not table_exists(engine, schema, target_base):
-            create_text_table(engine, schema, target_base, union_cols, pk_cols)
-            db_columns = union_cols[:]
-        else:
-            db_columns = get_table_columns(engine, schema, target_base)
-            missing = [c for c in union_cols if c not in db_columns]
-            if missing:
-                if auto_add_columns:
-                    add_missing_text_columns(engine, schema, target_base, missing)
-                    db_columns = get_table_columns(engine, schema, target_base)
-                    print(f'[{table_name}] Added new columns: {", ".join(missing)}')
-                else:
-                    print(f'[{table_name}] WARNING: New columns ignored (use --auto-add-columns): {", ".join(missing)}')
+        infer_types = None
+        if typed:
+            def infer_types(cols: list[str]) -> dict[str, str]:
+                return _infer_column_types(
+                    load_files, norm_by_file, _typed_candidates(cols, pk_cols, load_mode),
+                    rowskip, encoding, int(cfg.get("type_sample_rows", 10_000)),
+                )
 
-        temp_fqtn = _make_temp_text_table(engine, db_columns)
-        
-        # Temp テーブルへの INDEX 作成 (DuckDBでは明示的なインデックス名が必要)
-        if pk_cols:
-            with engine.begin() as conn:
-                idx_cols = ", ".join([f'"{c}"' for c in pk_cols])
-                temp_clean_name = temp_fqtn.replace('"', '')
-                conn.execute(text(f'CREATE INDEX idx_{temp_clean_name} ON {temp_fqtn} ({idx_cols});'))
+        track_loads = _tracks_loads(cfg)
+        db_columns = _prepare_target_table(
+            engine, table_name, target_base, union_cols, pk_cols, auto_add_columns, load_mode, infer_types,
+            track_loads,
+        )
+        temp_fqtn = _create_staging_table(engine, db_columns, pk_cols, staging)
 
-        for f in processed_files:
-            print(f"[{table_name}] Loading {f}")
-            norm_cols = norm_by_file[f]
+        # landing の Parquet コピーがあるファイルは read_parquet、残りは engine の CSV ローダ。
+        # 後勝ちの順序が崩れないよう、ファイル順のまま連続区間ごとに FILE_ORD を通しで振る
+        copies = _parquet_copies(table_name, cfg, load_files, norm_by_file)
+        file_ord = 0
+        for from_parquet, run in itertools.groupby(load_files, key=lambda f: f in copies):
+            run = list(run)
+            if from_parquet:
+                for f in run:
+                    print(f"[{table_name}] Loading {f} (parquet copy)")
+                _load_files_parquet(
+                    engine, table_name, [copies[f] for f in run], {copies[f]: norm_by_file[f] for f in run},
+                    temp_fqtn, db_columns, pk_cols, file_ord,
+                )
+            elif loader == "duckdb_native":
+                _load_files_duckdb_native(
+                    engine, table_name, run, norm_by_file,
+                    temp_fqtn, db_columns, pk_cols, rowskip, encoding, file_ord,
+                )
+            elif loader == "arrow":
+                _load_files_arrow(
+                    engine, table_name, run, norm_by_file,
+                    temp_fqtn, db_columns, pk_cols, chunksize, rowskip, encoding,
+                    _read_workers(cfg, run), file_ord,
+                )
+            else:
+                _load_files_pandas(
+                    engine, table_name, run, norm_by_file,
+                    temp_fqtn, db_columns, pk_cols, chunksize, rowskip, encoding,
+                    _read_workers(cfg, run), file_ord,
+                )
+            file_ord += len(run)
 
-            for chunk in pd.read_csv(
-                f,
-                header=0,
-                dtype=str,
-                chunksize=chunksize,
-                na_filter=True,
-                keep_default_na=False,
-                na_values=[""],
-                encoding="utf-8",
-                skiprows=rowskip,
-            ):
-                chunk.columns = norm_cols
+        col_types = _widen_conflicting_columns(
+            engine, table_name, temp_fqtn, target_base, db_columns,
+            cached_table_types(engine, schema, target_base), load_files,
+        )
+        _merge_temp_into_target(
+            engine, temp_fqtn, target_fqtn, db_columns, pk_cols, target_base, ledger_entries, full,
+            load_mode, replace_keys, [batch_id_of(f) for f in load_files], col_types, track_loads,
+        )
 
-                for pk in pk_cols:
-                    if pk in chunk.columns:
-                        chunk = chunk[chunk[pk].notna() & (chunk[pk] != "")]
+        rss = _peak_rss_mb()
+        rss_txt = f", peak_rss={rss:.0f}MiB" if rss is not None else ""
+        print(f"[{table_name}] Upsert completed. (engine={loader}, staging={staging}, mode={load_mode}, files={len(load_files)}/{len(src_files)}, {time.perf_counter() - started:.2f}s{rss_txt})")
 
-                for c in db_columns:
-                    if c not in chunk.columns:
-                        chunk[c] = pd.NA
-                chunk = chunk[db_columns]
+    except Exception:
+        # キャッシュの列リストが実テーブルとずれていた可能性があるので次回は読み直す
+        invalidate_table_cache(schema, target_base)
+        raise
+    finally:
+        if temp_fqtn is not None:
+            _drop_temp_table(engine, temp_fqtn)
 
-                _copy_df_to_table(engine, chunk, temp_fqtn, db_columns)
 
-        _dedupe_temp_by_pk(engine, temp_fqtn, pk_cols)
+def upsert_staged_table(
+    engine: Engine, staged: dict, auto_add_columns: bool, ledger_entries: list[dict], full: bool
+):
+    """stage_table の結果（中間 Parquet）を単一の DuckDB 接続で TEMP → 後勝ち → UPSERT。"""
+    table_name = staged["table_name"]
+    cfg = staged["cfg"]
+    pk_cols = cfg["primary_key"]
+    target_base = cfg.get("target_table", table_name)
+    target_fqtn = f'"{TARGET_SCHEMA}"."{target_base}"'
+    load_mode, replace_keys = _load_mode(table_name, cfg)
 
-        non_key_cols = [c for c in db_columns if c not in pk_cols]
-        set_clause = (
-            "SET " + ", ".join([f'"{c}"=EXCLUDED."{c}"' for c in non_key_cols])
-            if non_key_cols else "DO NOTHING"
+    temp_fqtn: str | None = None
+    try:
+        if not staged["src_files"]:
+            return
+        if not staged["union_cols"]:
+            print(f"[{table_name}] WARNING: header not found")
+            return
+        _check_replace_keys(table_name, replace_keys, staged["union_cols"])
+
+        started = time.perf_counter()
+        inferred = staged["col_types"]
+        db_columns = _prepare_target_table(
+            engine, table_name, target_base, staged["union_cols"], pk_cols, auto_add_columns, load_mode,
+            (lambda cols: {c: inferred[c] for c in cols if c in inferred}) if cfg.get("typed") else None,
+            _tracks_loads(cfg),
         )
-        
-        # DuckDB の UPSERT (ON CONFLICT) 構文
-        upsert_sql = f"""
-            INSERT INTO {target_fqtn} ({", ".join([f'"{c}"' for c in db_columns])})
-            SELECT {", ".join([f'"{c}"' for c in db_columns])} FROM {temp_fqtn}
-            ON CONFLICT ({", ".join([f'"{c}"' for c in pk_cols])})
-            DO UPDATE {set_clause};
-        """
-        with engine.begin() as conn:
-            conn.execute(text(upsert_sql))
+        temp_fqtn = _create_staging_table(engine, db_columns, pk_cols, _staging_mode(table_name, cfg))
+        files = [path for path, _, _ in staged["parts"]]
+        norm_by_file = {path: cols for path, cols, _ in staged["parts"]}
+        _load_files_parquet(engine, table_name, files, norm_by_file, temp_fqtn, db_columns, pk_cols)
+        src_files = [src for _, _, src in staged["parts"]]
+        col_types = _widen_conflicting_columns(
+            engine, table_name, temp_fqtn, target_base, db_columns,
+            cached_table_types(engine, TARGET_SCHEMA, target_base), src_files,
+        )
+        _merge_temp_into_target(
+            engine, temp_fqtn, target_fqtn, db_columns, pk_cols, target_base, ledger_entries, full,
+            load_mode, replace_keys, [batch_id_of(src) for src in src_files], col_types, _tracks_loads(cfg),
+        )
+        print(
+            f"[{table_name}] Upsert completed. (jobs, mode={load_mode}, files={len(files)}/{staged['src_files']}, "
+            f"stage={staged['stage_seconds']:.2f}s, load={time.perf_counter() - started:.2f}s)"
+        )
+    except Exception:
+        invalidate_table_cache(TARGET_SCHEMA, target_base)
+        raise
+    finally:
+        if temp_fqtn is not None:
+            _drop_temp_table(engine, temp_fqtn)
+        if staged["stage_dir"] is not None:
+            shutil.rmtree(staged["stage_dir"], ignore_errors=True)
 
-        print(f"[{table_name}] Upsert completed.")
 
-    finally:
-        for p in tmp_to_cleanup:
+def ingest_tables_parallel(
+    engine: Engine,
+    specs: dict[str, dict],
+    csv_root: Path,
+    chunksize: int,
+    auto_add_columns: bool,
+    jobs: int,
+    full: bool = False,
+) -> dict[str, Exception | None]:
+    """
+    複数テーブルの CSV パースをプロセスプールで並列に行い、書き込みは呼び出し元の
+    1 本の DuckDB 接続で完了順に直列実行する（DuckDB はファイルあたり 1 writer）。
+    テーブル単位で例外を握り、他テーブルは続行する。戻り値: {table: None | 例外}
+    """
+    results: dict[str, Exception | None] = {}
+    ledger_by_table: dict[str, list[dict]] = {}
+    full_by_table: dict[str, bool] = {}
+    jobs_to_submit: dict[str, list[Path]] = {}
+    for name, spec in specs.items():
+        try:
+            load_mode = _load_mode(name, spec)[0]
+            table_full = _effective_full(name, load_mode, full)
+            src_files = _iter_csv_files(csv_root, spec["folder"], spec.get("filename_glob", "*.csv"))
+            load_files, entries = _select_pending(
+                engine, name, spec.get("target_table", name), src_files, csv_root, spec["folder"], table_full,
+                load_mode,
+            )
+        except Exception as e:
+            print(f"[ingest][jobs] error for {name}: {e}")
+            results[name] = e
+            continue
+        if src_files and not load_files:
+            if entries:
+                with engine.begin() as conn:
+                    record_ledger(conn, TARGET_SCHEMA, spec.get("target_table", name), entries, table_full)
+            print(f"[{name}] No new files to load.")
+            results[name] = None
+            continue
+        ledger_by_table[name] = entries
+        full_by_table[name] = table_full
+        jobs_to_submit[name] = load_files
+
+    # DuckDB / pyarrow のスレッドを抱えた親を fork しないよう spawn を使う
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(
+                stage_table, name, specs[name], csv_root, specs[name].get("chunksize", chunksize), load_files
+            ): name
+            for name, load_files in jobs_to_submit.items()
+        }
+        for fut in as_completed(futures):
+            name = futures[fut]
             try:
-                p.unlink()
-            except Exception:
-                pass
+                upsert_staged_table(
+                    engine, fut.result(), auto_add_columns, ledger_by_table[name], full_by_table[name]
+                )
+                results[name] = None
+            except Exception as e:
+                print(f"[ingest][jobs] error for {name}: {e}")
+                results[name] = e
+    return results
+
+
+# tables.yml の snapshot: で指定できるテーブル別のスナップショット設定（未指定なら従来どおり 1 ファイル）
+#   mode              : full（既定。毎回全件） / delta（前回以降に入った・変わった行だけ。snapshot_delta を参照）
+#   full_every        : delta で、直近の base から何日経ったら全件の base を書き直すか（既定 7）
+#   partition_by      : hive パーティション列（<table>/<col>=<値>/data_N.parquet）。読み手はディレクトリ単位で絞れる
+#   order_by          : 書き出し前の並び順（行グループの min/max 統計が効くようにする）
+#   row_group_size    : 行グループの行数（DuckDB 既定 122880）
+#   compression       : zstd / snappy / gzip / lz4 / brotli / uncompressed（DuckDB 既定 snappy）
+#   compression_level : zstd のレベル
+#   per_thread_output : DuckDB のスレッドごとに別ファイルへ並列に書く（<table>/data_N.parquet）
+SNAPSHOT_MODES = ("full", "delta")
+SNAPSHOT_COMPRESSIONS = ("zstd", "snappy", "gzip", "lz4", "brotli", "uncompressed")
+_SNAPSHOT_KEYS = (
+    "mode", "full_every",
+    "partition_by", "order_by", "row_group_size", "compression", "compression_level", "per_thread_output",
+)
+
+
+def _snapshot_options(table_name: str, opts: dict | None) -> dict:
+    """snapshot: の設定を検査して正規化する（列指定は文字列でもリストでも可）。"""
+    opts = dict(opts or {})
+    unknown = sorted(set(opts) - set(_SNAPSHOT_KEYS))
+    if unknown:
+        raise ValueError(
+            f"[{table_name}] unknown snapshot option(s): {', '.join(unknown)} (choose from: {', '.join(_SNAPSHOT_KEYS)})"
+        )
+    opts["mode"] = opts.get("mode") or "full"
+    if opts["mode"] not in SNAPSHOT_MODES:
+        raise ValueError(
+            f"[{table_name}] unknown snapshot mode '{opts['mode']}' (choose from: {', '.join(SNAPSHOT_MODES)})"
+        )
+    opts["full_every"] = int(opts.get("full_every") or 7)
+    for key in ("partition_by", "order_by"):
+        cols = opts.get(key) or []
+        opts[key] = [cols] if isinstance(cols, str) else list(cols)
+    compression = opts.get("compression")
+    if compression is not None and compression not in SNAPSHOT_COMPRESSIONS:
+        raise ValueError(
+            f"[{table_name}] unknown snapshot compression '{compression}' "
+            f"(choose from: {', '.join(SNAPSHOT_COMPRESSIONS)})"
+        )
+    if opts.get("compression_level") is not None and compression != "zstd":
+        raise ValueError(f"[{table_name}] snapshot compression_level requires compression: zstd")
+    return opts
+
+
+def _snapshot_copy_sql(fqtn: str, out_path: Path, opts: dict, since: int | None = None) -> str:
+    """COPY ... TO ... (FORMAT PARQUET, ...) 文を組み立てる。since があれば LOAD_SEQ_COL がそれより新しい行だけ。"""
+    source = fqtn
+    if opts["order_by"] or since is not None:
+        where = f' WHERE "{LOAD_SEQ_COL}" > {int(since)}' if since is not None else ""
+        order = " ORDER BY " + ", ".join(f'"{c}"' for c in opts["order_by"]) if opts["order_by"] else ""
+        source = f"(SELECT * FROM {fqtn}{where}{order})"
+    copy_opts = ["FORMAT PARQUET"]
+    if opts["partition_by"]:
+        parts = ", ".join(f'"{c}"' for c in opts["partition_by"])
+        copy_opts.append(f"PARTITION_BY ({parts})")
+    if opts.get("per_thread_output"):
+        copy_opts.append("PER_THREAD_OUTPUT")
+    if opts.get("row_group_size"):
+        copy_opts.append(f"ROW_GROUP_SIZE {int(opts['row_group_size'])}")
+    if opts.get("compression"):
+        copy_opts.append(f"COMPRESSION {opts['compression']}")
+    if opts.get("compression_level") is not None:
+        copy_opts.append(f"COMPRESSION_LEVEL {int(opts['compression_level'])}")
+    return f"COPY {source} TO '{out_path}' ({', '.join(copy_opts)})"
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def _replace_path(src: Path, dst: Path) -> None:
+    """src（ファイル or ディレクトリ）で dst を置き換える。ディレクトリは退避 → rename → 退避分を削除。"""
+    if dst.is_dir() and not dst.is_symlink():
+        old = dst.with_name(f".{dst.name}.old")
+        _remove_path(old)
+        os.replace(dst, old)
+        os.replace(src, dst)
+        shutil.rmtree(old)
+    else:
+        os.replace(src, dst)
+
+
+def _link_tree(src: Path, dst: Path) -> None:
+    """src（ファイル or ディレクトリ）をハードリンクで dst に作る。リンクできない（別ファイルシステム等）ならコピー。"""
+    if src.is_dir():
+        dst.mkdir()
+        for child in src.iterdir():
+            _link_tree(child, dst / child.name)
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _reuse_unchanged_snapshot(
+    table_name: str, out_root: Path, today: str, state: dict | None, opts: dict
+) -> tuple[bool, Path | None]:
+    """
+    前回のスナップショットからデータ版も書き方も変わっていなければ、書き出さずに済ませる。
+      今日のもの          → そのまま（撮り直さない）
+      前日までの base     → 今日のフォルダへハードリンク（サイドカーも写す）
+      前日までの delta    → 差分が空なので何も書かない（base を書き直す日なら書き出しへ）
+    戻り値: (済んだか, 今日のパス)
+    """
+    fqtn = f'"{TARGET_SCHEMA}"."{table_name}"'
+    prev = unchanged_snapshot(out_root, table_name, today, state, snapshot_layout(opts))
+    if prev is None:
+        return False, None
+    version = state["version"]
+    if prev["date"] == today:
+        print(f"[snapshot] {fqtn}: unchanged since today's snapshot (version {version}); skip")
+        return True, prev["path"]
+    if prev["kind"] == "delta":
+        since, _ = plan_delta(out_root, table_name, today, state, opts["full_every"])
+        if since is None:
+            return False, None
+        print(f"[snapshot] {fqtn}: no changes since {prev['date']} (version {version}); no delta written")
+        return True, None
+
+    date_folder = out_root / today
+    dst = date_folder / prev["path"].name
+    tmp_path = date_folder / f".{dst.name}.tmp"
+    _remove_path(tmp_path)
+    try:
+        _link_tree(prev["path"], tmp_path)
+        _replace_path(tmp_path, dst)
+    except BaseException:
+        _remove_path(tmp_path)
+        raise
+    for path in snapshot_outputs(date_folder, table_name).values():
+        if path != dst:
+            _remove_path(path)
+    meta = {k: v for k, v in prev.items() if k not in ("date", "path")}
+    write_sidecar(date_folder, table_name, {
+        **meta, "path": dst.name, "linked_from": prev["date"], "written_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    print(f"[snapshot] {fqtn}: unchanged since {prev['date']} (version {version}); hardlinked -> {dst}")
+    return True, dst
 
 
-def snapshot_table_to_parquet(engine: Engine, table_name: str, out_root: Path):
-    """Pandas を経由せず、DuckDB の機能で直接 Parquet に書き出すよう高速化"""
+def snapshot_table_to_parquet(
+    engine: Engine, table_name: str, out_root: Path, cfg: dict | None = None, full: bool = False
+) -> Path | None:
+    """
+    Pandas を経由せず、DuckDB の COPY で直接 Parquet に書き出す。
+    cfg（tables.yml のテーブル設定）の snapshot: で partition_by / per_thread_output を指定すると
+    PARQUET_ROOT/YYYYMMDD/<table>/ 以下に複数ファイルで書く（無指定なら YYYYMMDD/<table>.parquet）。
+    snapshot.mode: delta なら、前回スナップショット以降に入った・変わった行だけを <table>.delta.parquet に書き、
+    full_every 日ごと（と full=True のとき）に全件の base を書き直す。隣にサイドカー（.snapshot.json）を置く。
+    前回からデータ版も書き方も変わっていなければ書き出さない（_reuse_unchanged_snapshot。full=True なら必ず書く）。
+    一時パスに書いてから置き換えるので、途中で落ちても前回のスナップショットは壊れない。
+    戻り値: 今日のファイル or ディレクトリ（テーブルが無い・空の delta を省いたときは None）
+    """
+    cfg = cfg or {}
+    opts = _snapshot_options(table_name, cfg.get("snapshot"))
+    load_mode, replace_keys = _load_mode(table_name, cfg) if cfg else ("upsert", [])
     schema = TARGET_SCHEMA
     fqtn = f'"{schema}"."{table_name}"'
-    date_folder = out_root / datetime.now().strftime("%Y%m%d")
+    if not table_exists(engine, schema, table_name):
+        print(f"[snapshot] {fqtn}: table not found (not loaded yet?); skip")
+        return None
+    today = datetime.now().strftime("%Y%m%d")
+    date_folder = out_root / today
     date_folder.mkdir(parents=True, exist_ok=True)
-    out_path = date_folder / f"{table_name}.parquet"
 
-    print(f"[snapshot] {fqtn} -> {out_path}")
-    with engine.begin() as conn:
-        conn.execute(text(f"COPY {fqtn} TO '{out_path}' (FORMAT PARQUET)"))
-    print(f"[snapshot] Wrote {out_path}")
+    state = read_table_version(engine, schema, table_name)
+    if not full:
+        done, path = _reuse_unchanged_snapshot(table_name, out_root, today, state, opts)
+        if done:
+            return path
+    since = None
+    if opts["mode"] == "delta":
+        if full:
+            print(f"[snapshot] {fqtn}: full base requested")
+        else:
+            since, reason = plan_delta(out_root, table_name, today, state, opts["full_every"])
+            if since is None:
+                print(f"[snapshot] {fqtn}: writing a full base ({reason})")
+    kind = "base" if since is None else "delta"
+    as_dir = bool(opts["partition_by"]) or bool(opts.get("per_thread_output"))
+    outputs = snapshot_outputs(date_folder, table_name)
+    out_path = outputs[(kind, as_dir)]
+    tmp_path = date_folder / f".{out_path.name}.tmp"
+    _remove_path(tmp_path)
+
+    print(f"[snapshot] {fqtn} -> {out_path}" + (f" (changes since version {since})" if since is not None else ""))
+    started = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            rows = conn.execute(text(_snapshot_copy_sql(fqtn, tmp_path, opts, since))).scalar()
+        _replace_path(tmp_path, out_path)
+    except BaseException:
+        _remove_path(tmp_path)
+        raise
+    # 1 日 1 スナップショット。種類やレイアウトが変わった日は、ほかの形式の古い出力を消す（読み手が二重に読まないように）
+    for path in outputs.values():
+        if path != out_path:
+            _remove_path(path)
+    write_sidecar(date_folder, table_name, {
+        "table": table_name,
+        "kind": kind,
+        "path": out_path.name,
+        "version": (state or {}).get("version", 0),
+        "since": since,
+        "lineage": (state or {}).get("lineage"),
+        "load_mode": load_mode,
+        "primary_key": list(cfg.get("primary_key") or []),
+        "replace_keys": replace_keys,
+        "layout": snapshot_layout(opts),
+        "rows": rows,
+        "written_at": datetime.now().isoformat(timespec="seconds"),
+    })
+
+    files = sorted(out_path.rglob("*.parquet")) if as_dir else [out_path]
+    size = sum(f.stat().st_size for f in files)
+    print(
+        f"[snapshot] Wrote {out_path} ({kind}, rows={rows}, files={len(files)}, {size / 1024**2:.1f} MiB, "
+        f"{time.perf_counter() - started:.2f}s)"
+    )
+    return out_path
 
 
 def clean_old_csvs(csv_root: Path, archive_root: Path | None, retention_days: int, dry_run: bool = True):
@@ -332,6 +1645,23 @@ def cmd_ingest(args):
         if name not in tables:
             print(f"Unknown table '{name}'. Available: {', '.join(tables.keys())}")
             sys.exit(1)
+
+    if args.jobs > 1:
+        started = time.perf_counter()
+        results = ingest_tables_parallel(
+            engine,
+            {name: tables[name] for name in targets},
+            csv_root=PATHS["CSV_ROOT"],
+            chunksize=args.chunksize,
+            auto_add_columns=args.auto_add_columns,
+            jobs=args.jobs,
+            full=args.full,
+        )
+        failed = [name for name, err in results.items() if err is not None]
+        print(f"[ingest][jobs] done: ok={len(results) - len(failed)} failed={len(failed)} ({time.perf_counter() - started:.2f}s)")
+        return
+
+    for name in targets:
         spec = tables[name]
         upsert_table(
             engine=engine,
@@ -340,6 +1670,46 @@ def cmd_ingest(args):
             csv_root=PATHS["CSV_ROOT"],
             chunksize=spec.get("chunksize", args.chunksize),
             auto_add_columns=args.auto_add_columns,
+            full=args.full,
+        )
+
+
+def table_storage(engine: Engine, schema: str, table: str) -> dict:
+    """
+    本テーブルの行数・推定ディスク使用量（使用ブロック数 × ブロックサイズ）・型付き列数を返す。
+    CHECKPOINT 後の永続ブロックで数えるので、呼ぶ前に WAL が反映される。
+    """
+    types = get_table_column_types(engine, schema, table)
+    with engine.begin() as conn:
+        conn.execute(text("CHECKPOINT"))
+        block_size = conn.execute(text("SELECT block_size FROM pragma_database_size()")).scalar()
+        blocks = conn.execute(text(f"""
+            SELECT count(DISTINCT block_id) FROM pragma_storage_info('{schema}.{table}')
+            WHERE persistent AND block_id >= 0
+        """)).scalar()
+        rows = conn.execute(text(f'SELECT count(*) FROM "{schema}"."{table}"')).scalar()
+    return {
+        "rows": rows,
+        "bytes": blocks * block_size,
+        "columns": len(types),
+        "typed_columns": sum(1 for t in types.values() if not _is_text_type(t)),
+    }
+
+
+def cmd_storage_report(args):
+    engine = get_engine()
+    cfg = load_config()
+    targets = [args.table] if args.table else list(cfg["tables"].keys())
+    for name in targets:
+        spec = cfg["tables"][name]
+        target = spec.get("target_table", name)
+        if not table_exists(engine, TARGET_SCHEMA, target):
+            print(f"[storage] {target}: not loaded yet")
+            continue
+        st = table_storage(engine, TARGET_SCHEMA, target)
+        print(
+            f"[storage] {target:<20} rows={st['rows']:>12,}  size={st['bytes'] / 1024 / 1024:9.1f}MiB  "
+            f"typed={st['typed_columns']}/{st['columns']}  (typed: {bool(spec.get('typed', False))})"
         )
 
 
@@ -349,7 +1719,35 @@ def cmd_snapshot(args):
     targets = [args.table] if args.table else list(cfg["tables"].keys())
     for name in targets:
         spec = cfg["tables"][name]
-        snapshot_table_to_parquet(engine, spec.get("target_table", name), PATHS["PARQUET_ROOT"])
+        snapshot_table_to_parquet(engine, spec.get("target_table", name), PATHS["PARQUET_ROOT"], spec, args.full)
+
+
+def cmd_query(args):
+    """スナップショットのビューを張って --sql を実行する（--sql 無しならビューの一覧だけ出す）。"""
+    conn = duckdb.connect()
+    views = create_snapshot_views(
+        conn, PATHS["PARQUET_ROOT"], args.as_of, args.date_from, args.date_to, args.table or None
+    )
+    if not views:
+        print("[query] no tables have snapshots for the requested date(s)")
+        return
+    ranged = args.date_from is not None or args.date_to is not None
+    for name, dates in views.items():
+        span = f"{dates[0]}..{dates[-1]} ({len(dates)} day(s), column {SNAPSHOT_DATE_COL})" if ranged else (
+            f"as of {dates[-1]} (" + " + ".join(dates) + ")"
+        )
+        print(f"[query] view {name}: {span}")
+    if not args.sql:
+        return
+    t0 = time.perf_counter()
+    if args.out:
+        fmt = "CSV, HEADER" if args.out.endswith(".csv") else "PARQUET"
+        out = args.out.replace("'", "''")
+        rows = conn.execute(f"COPY ({args.sql}) TO '{out}' (FORMAT {fmt})").fetchone()[0]
+        print(f"[query] Wrote {args.out} (rows={rows}, {time.perf_counter() - t0:.2f}s)")
+        return
+    conn.sql(args.sql).show(max_rows=args.limit)
+    print(f"[query] {time.perf_counter() - t0:.2f}s")
 
 
 def cmd_clean(args):
@@ -370,12 +1768,32 @@ def main():
     p_ing.add_argument("--chunksize", type=int, default=200_000, help="pandas read_csv chunksize (fallback)")
     p_ing.add_argument("--auto-add-columns", action="store_true",
                        help="if CSV has new columns, ALTER TABLE ADD COLUMN (TEXT)")
+    p_ing.add_argument("--jobs", type=int, default=1,
+                       help="parse/stage tables in N worker processes; writes stay on one DuckDB connection")
+    p_ing.add_argument("--full", action="store_true",
+                       help="reload every CSV and rebuild the ingest ledger (default: only files not yet loaded)")
     p_ing.set_defaults(func=cmd_ingest)
 
     p_snap = sub.add_parser("snapshot", help="export tables from DuckDB to Parquet")
     p_snap.add_argument("--table", help="single table to snapshot (default: all)")
+    p_snap.add_argument("--full", action="store_true",
+                        help="always export (no hardlink/skip for unchanged tables); full base for snapshot.mode: delta")
     p_snap.set_defaults(func=cmd_snapshot)
 
+    p_query = sub.add_parser("query", help="query Parquet snapshots as of a date (or over a date range) with DuckDB")
+    p_query.add_argument("--as-of", help="YYYYMMDD: one view per table with its state on that date (default: latest)")
+    p_query.add_argument("--from", dest="date_from", help=f"YYYYMMDD: stack every snapshot day from here, adds {SNAPSHOT_DATE_COL}")
+    p_query.add_argument("--to", dest="date_to", help="YYYYMMDD: end of the range (inclusive)")
+    p_query.add_argument("--table", action="append", help="only these tables (repeatable; default: all snapshotted)")
+    p_query.add_argument("--sql", help='SQL over the views, e.g. "SELECT count(*) FROM movies"')
+    p_query.add_argument("--out", help="write the result to .parquet / .csv instead of printing")
+    p_query.add_argument("--limit", type=int, default=40, help="rows to print")
+    p_query.set_defaults(func=cmd_query)
+
+    p_stor = sub.add_parser("storage-report", help="rows / on-disk size / typed columns per raw table")
+    p_stor.add_argument("--table", help="single table (default: all)")
+    p_stor.set_defaults(func=cmd_storage_report)
+
     p_clean = sub.add_parser("clean", help="delete or archive old CSV files under db_ingestion")
     p_clean.add_argument("--archive", action="store_true", help="move files to archive instead of deleting")
     p_clean.add_argument("--dry-run", action="store_true", help="only print targets")
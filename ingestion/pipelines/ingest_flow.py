@@ -4,41 +4,49 @@ import argparse
 from pathlib import Path
 from typing import Iterable
 
-from ingestion.utils import get_paths, get_engine, ensure_schema
+from ingestion.utils import get_paths, get_engine, ensure_schema, glob_csv_parts
 from ingestion.pipelines.land_import import import_manual
-from ingestion.pipelines.promote import resolve_batch_dir
+from ingestion.pipelines.promote import promote_batch, resolve_batch_dir
+from ingestion.pipelines.landing_catalog import latest_run_date
 from ingestion.pipelines.validate import validate_landing
 from ingestion.pipelines.csv_to_db import (
+    find_table_spec,
     load_config,
     upsert_table,
+    ingest_tables_parallel,
     snapshot_table_to_parquet,
     TARGET_SCHEMA,
 )
 
 def _has_csv(p: Path, patterns: Iterable[str] = ("*.csv",)) -> bool:
     for pat in patterns:
-        if any(p.glob(pat)):
+        if glob_csv_parts(p, pat):
             return True
     return False
 
-def run_one(
+# run_one / run_auto の landing 検査範囲
+#   batch   : 今回取り込んだバッチだけ（既定。過去の壊れたバッチで他テーブルが止まらない）
+#   pending : その namespace/table の未検証バッチ（.validated マーカーが無いもの）
+#   all     : landing 全体（従来の挙動）
+VALIDATE_SCOPES = ("batch", "pending", "all")
+
+def _land_and_promote(
     namespace: str,
     table: str,
-    src: Path | None = None,
-    run_date: str | None = None,
-    encoding: str = "utf-8",
-    pattern: str = "*.csv",
-    move: bool = True,
-    dry_run: bool = False,
-    auto_add_columns: bool = True,
-    chunksize: int | None = None,
-):
+    src: Path | None,
+    run_date: str | None,
+    encoding: str,
+    pattern: str,
+    move: bool,
+    dry_run: bool,
+    validate_scope: str = "batch",
+    deep_validate: bool = False,
+) -> Path | None:
     """
-    manual_drop から landing 取り込み → validate → promote → UPSERT → snapshot を1発で。
+    run_one の前半（land-import → validate → promote）。DB には触れない。
+    戻り値: プロモート先の CSV_ROOT（dry-run なら None）
     """
     paths = get_paths()
-    engine = get_engine()
-    ensure_schema(engine, TARGET_SCHEMA)
 
     # 1) manual_drop の推定（未指定なら既定パス）
     if src is None:
@@ -58,47 +66,71 @@ def run_one(
     )
     if dry_run:
         print("[ingest-flow] dry-run: stop after land-import")
-        return
+        return None
 
-    # 3) validate（軽検査）。問題があれば中断
-    problems = validate_landing(get_paths()["LANDING_ROOT"])
-    if problems:
-        raise SystemExit(f"[ingest-flow] landing validation failed (problems={problems})")
-
-    # 4) promote: landing の “latest” を db_ingestion へコピー
-    #    latest を解決（run_date 必須）。run_date未指定の場合は import_manual が today を使うため、
-    #    最新 run_date を推測する
+    # 3) 今回のバッチ（“latest”）を解決（run_date 必須）。run_date未指定の場合は import_manual が
+    #    today を使うため、最新 run_date を推測する
     landing_root = paths["LANDING_ROOT"]
     ns_dir = landing_root / f"namespace={namespace}" / f"table={table}"
     if run_date is None:
-        # namespace/table 配下の run_date=YYYYMMDD をソートし最後を採用
-        run_dirs = sorted([p for p in ns_dir.glob("run_date=*") if p.is_dir()], key=lambda p: str(p))
-        if not run_dirs:
+        # namespace/table の最新 run_date をカタログから採用
+        run_date = latest_run_date(landing_root, namespace, table)
+        if run_date is None:
             raise FileNotFoundError(f"[ingest-flow] no run_date dir under {ns_dir}")
-        run_date = run_dirs[-1].name.split("=", 1)[1]
 
     batch_dir = resolve_batch_dir(landing_root, namespace, table, run_date, "latest")
-    parts_dir = batch_dir / "parts"
-    if not parts_dir.exists():
-        raise FileNotFoundError(f"[ingest-flow] parts not found: {parts_dir}")
 
+    # 4) validate（軽検査。deep_validate ならパーツの内容まで）。範囲は validate_scope。問題があれば中断
+    if validate_scope == "batch":
+        problems = validate_landing(landing_root, batches=[batch_dir], deep=deep_validate)
+    elif validate_scope == "pending":
+        problems = validate_landing(
+            landing_root, namespace=namespace, table=table, unvalidated_only=True, deep=deep_validate
+        )
+    else:
+        problems = validate_landing(landing_root, deep=deep_validate)
+    if problems:
+        raise SystemExit(f"[ingest-flow] landing validation failed (problems={problems})")
+
+    # 5) promote: 今回のバッチを db_ingestion へ置く（reflink / hardlink / コピー）
     csv_root = paths["CSV_ROOT"]
     dest_dir = csv_root / f"namespace={namespace}" / f"table={table}"
-    dest_dir.mkdir(parents=True, exist_ok=True)
+    promote_batch(batch_dir, dest_dir, table, run_date, tag="[ingest-flow][promote]")
+    return csv_root
+
+def run_one(
+    namespace: str,
+    table: str,
+    src: Path | None = None,
+    run_date: str | None = None,
+    encoding: str = "utf-8",
+    pattern: str = "*.csv",
+    move: bool = True,
+    dry_run: bool = False,
+    auto_add_columns: bool = True,
+    chunksize: int | None = None,
+    full: bool = False,
+    validate_scope: str = "batch",
+    deep_validate: bool = False,
+):
+    """
+    manual_drop から landing 取り込み → validate → promote → UPSERT → snapshot を1発で。
+    """
+    paths = get_paths()
+    engine = get_engine()
+    ensure_schema(engine, TARGET_SCHEMA)
 
-    copied = 0
-    for src_file in sorted(parts_dir.glob("*.csv"), key=lambda p: str(p)):
-        dest = dest_dir / f"{table}_{run_date}_{batch_dir.name}_{src_file.name}"
-        dest.write_bytes(src_file.read_bytes())
-        copied += 1
-        print(f"[ingest-flow][promote] {src_file} -> {dest}")
-    print(f"[ingest-flow][promote] copied={copied}, to={dest_dir}")
+    csv_root = _land_and_promote(
+        namespace, table, src, run_date, encoding, pattern, move, dry_run, validate_scope, deep_validate
+    )
+    if csv_root is None:
+        return
 
-    # 5) UPSERT（テーブル単位）
+    # 6) UPSERT（テーブル単位）
     cfg = load_config()
     spec = cfg["tables"][table]  # tables.yml に必須
     if chunksize is None:
-        chunksize = spec.get("chunksize", 200_000)
+        chunksize = _chunksize(spec)
 
     upsert_table(
         engine=engine,
@@ -107,10 +139,11 @@ def run_one(
         csv_root=csv_root,
         chunksize=chunksize,
         auto_add_columns=auto_add_columns,
+        full=full,
     )
 
-    # 6) snapshot（対象テーブルのみ）
-    snapshot_table_to_parquet(engine, spec.get("target_table", table), paths["PARQUET_ROOT"])
+    # 7) snapshot（対象テーブルのみ）
+    snapshot_table_to_parquet(engine, spec.get("target_table", table), paths["PARQUET_ROOT"], spec)
     print("[ingest-flow] DONE")
 
 def run_auto(
@@ -119,9 +152,15 @@ def run_auto(
     move: bool = True,
     dry_run: bool = False,
     auto_add_columns: bool = True,
+    jobs: int = 1,
+    full: bool = False,
+    validate_scope: str = "batch",
+    deep_validate: bool = False,
 ):
     """
     manual_drop 以下の namespace=*/table=* で、CSVがある場所だけを自動検出し、順に run_one 実行。
+    jobs > 1 のときは landing → promote を順に行ったあと、CSV パースを jobs プロセスで並列化し、
+    UPSERT と snapshot は 1 本の DuckDB 接続で直列に行う。
     """
     paths = get_paths()
     manual_root = paths["LANDING_ROOT"].parent / "manual_drop"
@@ -142,6 +181,12 @@ def run_auto(
         print("[ingest-flow][auto] nothing to ingest under manual_drop")
         return
 
+    if jobs > 1:
+        _run_auto_parallel(
+            pairs, encoding, pattern, move, dry_run, auto_add_columns, jobs, full, validate_scope, deep_validate
+        )
+        return
+
     for namespace, table, src in pairs:
         print(f"[ingest-flow][auto] start: {namespace}.{table} (src={src})")
         try:
@@ -156,12 +201,86 @@ def run_auto(
                 dry_run=dry_run,
                 auto_add_columns=auto_add_columns,
                 chunksize=None,
+                full=full,
+                validate_scope=validate_scope,
+                deep_validate=deep_validate,
             )
         except SystemExit as e:
             print(f"[ingest-flow][auto] aborted for {namespace}.{table}: {e}")
         except Exception as e:
             print(f"[ingest-flow][auto] error for {namespace}.{table}: {e}")
 
+def _chunksize(spec: dict) -> int:
+    return spec.get("chunksize", 200_000)
+
+
+def _run_auto_parallel(
+    pairs: list[tuple[str, str, Path]],
+    encoding: str,
+    pattern: str,
+    move: bool,
+    dry_run: bool,
+    auto_add_columns: bool,
+    jobs: int,
+    full: bool,
+    validate_scope: str = "batch",
+    deep_validate: bool = False,
+):
+    paths = get_paths()
+    engine = get_engine()
+    ensure_schema(engine, TARGET_SCHEMA)
+    tables_cfg = load_config()["tables"]
+
+    # land-import → validate → promote はテーブルごとに直列（失敗は run_one と同じく握って続行）
+    # namespace が違えば同じ table 名でも別物なので (namespace, table) で持つ。値は tables.yml のテーブル名
+    ready: dict[tuple[str, str], str] = {}
+    for namespace, table, src in pairs:
+        print(f"[ingest-flow][auto] start: {namespace}.{table} (src={src})")
+        try:
+            csv_root = _land_and_promote(
+                namespace, table, src, None, encoding, pattern, move, dry_run, validate_scope, deep_validate
+            )
+            if csv_root is None:
+                continue
+            spec = find_table_spec(tables_cfg, namespace, table)
+            if spec is None:
+                raise KeyError(f"{namespace}.{table} is not in tables.yml")
+            ready[(namespace, table)] = next(name for name, s in tables_cfg.items() if s is spec)
+        except SystemExit as e:
+            print(f"[ingest-flow][auto] aborted for {namespace}.{table}: {e}")
+        except Exception as e:
+            print(f"[ingest-flow][auto] error for {namespace}.{table}: {e}")
+
+    if not ready:
+        return
+
+    # chunksize は run_one と同じくテーブル設定から（1 つの tables.yml エントリは 1 回だけ取り込む）
+    specs = {name: {**tables_cfg[name], "chunksize": _chunksize(tables_cfg[name])} for name in ready.values()}
+    results = ingest_tables_parallel(
+        engine,
+        specs,
+        csv_root=paths["CSV_ROOT"],
+        chunksize=_chunksize({}),
+        auto_add_columns=auto_add_columns,
+        jobs=jobs,
+        full=full,
+    )
+    snapshotted: set[str] = set()
+    for (namespace, table), name in ready.items():
+        err = results.get(name)
+        if err is not None:
+            print(f"[ingest-flow][auto] error for {namespace}.{table}: {err}")
+            continue
+        if name in snapshotted:
+            continue
+        try:
+            spec = specs[name]
+            snapshot_table_to_parquet(engine, spec.get("target_table", name), paths["PARQUET_ROOT"], spec)
+            snapshotted.add(name)
+        except Exception as e:
+            print(f"[ingest-flow][auto] error for {namespace}.{table}: {e}")
+    print("[ingest-flow][auto] DONE")
+
 def main():
     ap = argparse.ArgumentParser(description="One-shot flow: manual_drop -> landing -> promote -> upsert -> snapshot")
     sub = ap.add_subparsers(dest="cmd", required=True)
@@ -177,6 +296,11 @@ def main():
     p1.add_argument("--dry-run", action="store_true")
     p1.add_argument("--no-auto-add-columns", action="store_true")
     p1.add_argument("--chunksize", type=int, help="override chunksize")
+    p1.add_argument("--full", action="store_true", help="reload every CSV, ignoring the ingest ledger")
+    p1.add_argument("--validate", choices=VALIDATE_SCOPES, default="batch",
+                    help="landing validation scope: the imported batch (default), unvalidated batches, or everything")
+    p1.add_argument("--deep-validate", action="store_true",
+                    help="also verify part size / hash / rows / columns / primary keys before loading")
 
     p2 = sub.add_parser("auto", help="ingest all namespace/table under manual_drop")
     p2.add_argument("--encoding", default="utf-8")
@@ -184,6 +308,12 @@ def main():
     p2.add_argument("--no-move", action="store_true")
     p2.add_argument("--dry-run", action="store_true")
     p2.add_argument("--no-auto-add-columns", action="store_true")
+    p2.add_argument("--jobs", type=int, default=1, help="parse tables in N worker processes")
+    p2.add_argument("--full", action="store_true", help="reload every CSV, ignoring the ingest ledger")
+    p2.add_argument("--validate", choices=VALIDATE_SCOPES, default="batch",
+                    help="landing validation scope: the imported batch (default), unvalidated batches, or everything")
+    p2.add_argument("--deep-validate", action="store_true",
+                    help="also verify part size / hash / rows / columns / primary keys before loading")
 
     args = ap.parse_args()
 
@@ -199,6 +329,9 @@ def main():
             dry_run=args.dry_run,
             auto_add_columns=not args.no_auto_add_columns,
             chunksize=args.chunksize,
+            full=args.full,
+            validate_scope=args.validate,
+            deep_validate=args.deep_validate,
         )
     else:
         run_auto(
@@ -207,6 +340,10 @@ def main():
             move=not args.no_move,
             dry_run=args.dry_run,
             auto_add_columns=not args.no_auto_add_columns,
+            jobs=args.jobs,
+            full=args.full,
+            validate_scope=args.validate,
+            deep_validate=args.deep_validate,
         )
 
 if __name__ == "__main__":
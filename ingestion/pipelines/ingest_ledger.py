@@ -0,0 +1,270 @@
+# ingestion/pipelines/ingest_ledger.py
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from ingestion.utils import COMPRESSED_CSV_SUFFIXES, get_paths, new_batch_id
+from ingestion.pipelines.content_hash import LEGACY_HASH_ALGO, manifest_hash
+
+# upsert_table が取り込み済みのファイルを記録する台帳（<TARGET_SCHEMA>._ingest_ledger）
+# キーは (本テーブル名, CSV_ROOT からの相対パス)。size / mtime が変われば再取り込み対象。
+# md5 列は manifest のコンテンツハッシュ。md5 以外のアルゴリズムなら "<algo>:<hexdigest>" で入れる。
+LEDGER_TABLE = "_ingest_ledger"
+
+# promote / ingest_flow が付けるファイル名: <table>_<run_date>_batch_id=<id>_<元ファイル名>
+_PROMOTED_NAME = re.compile(r"^.+?_(?P<run_date>\d{8})_batch_id=(?P<batch_id>\d{8}T\d{6}Z_[0-9a-f]+)_(?P<name>.+)$")
+
+
+def _ledger_ddl(schema: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS "{schema}"."{LEDGER_TABLE}" (
+            table_name TEXT,
+            path TEXT,
+            size BIGINT,
+            mtime_ns BIGINT,
+            md5 TEXT,
+            loaded_at TIMESTAMP,
+            PRIMARY KEY (table_name, path)
+        );
+    """
+
+
+def ensure_ledger(engine: Engine, schema: str):
+    with engine.begin() as conn:
+        conn.execute(text(_ledger_ddl(schema)))
+
+
+def read_ledger(engine: Engine, schema: str, table_name: str) -> dict[str, dict]:
+    """{相対パス: {size, mtime_ns, md5}} を返す。"""
+    ensure_ledger(engine, schema)
+    sql = f'SELECT path, size, mtime_ns, md5 FROM "{schema}"."{LEDGER_TABLE}" WHERE table_name = :t'
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql), {"t": table_name}).all()
+    return {r.path: {"size": r.size, "mtime_ns": r.mtime_ns, "md5": r.md5} for r in rows}
+
+
+def _landing_batch_dir(path: Path) -> Path | None:
+    """landing の parts を直接読んでいる（replay）なら batch_id=... ディレクトリを返す。"""
+    if path.parent.name == "parts" and path.parent.parent.name.startswith("batch_id="):
+        return path.parent.parent
+    return None
+
+
+def batch_id_of(path: Path) -> str | None:
+    """プロモート済みファイル名（または landing のパーツの位置）から batch_id を返す（命名規則外なら None）。"""
+    m = _PROMOTED_NAME.match(path.name)
+    if m:
+        return m["batch_id"]
+    batch_dir = _landing_batch_dir(path)
+    return batch_dir.name.split("=", 1)[1] if batch_dir else None
+
+
+def _part_key(path: Path) -> tuple[str, str] | None:
+    """
+    landing のどのパーツか (batch_id, parts 内のファイル名) を返す（命名規則外なら None）。
+    プロモート済みと landing 直読み（replay）、clean_landing の圧縮前後で同じになる。
+    """
+    m = _PROMOTED_NAME.match(path.name)
+    if m:
+        batch_id, name = m["batch_id"], m["name"]
+    elif (batch_dir := _landing_batch_dir(path)) is not None:
+        batch_id, name = batch_dir.name.split("=", 1)[1], path.name
+    else:
+        return None
+    for suffix in COMPRESSED_CSV_SUFFIXES:
+        name = name.removesuffix(suffix)
+    return batch_id, name
+
+
+def landing_source(path: Path, folder: str) -> tuple[Path, str] | None:
+    """
+    プロモート済みファイル名（または landing のパーツの位置）から、元の landing バッチと parts 内のファイル名を返す。
+    命名規則外なら None（バッチがもう landing に無いかどうかは見ない）。
+    """
+    batch_dir = _landing_batch_dir(path)
+    if batch_dir is not None:
+        return batch_dir, path.name
+    m = _PROMOTED_NAME.match(path.name)
+    if not m:
+        return None
+    batch_dir = get_paths()["LANDING_ROOT"] / folder / f"run_date={m['run_date']}" / f"batch_id={m['batch_id']}"
+    return batch_dir, m["name"]
+
+
+def _read_manifest(batch_dir: Path, manifests: dict[Path, dict | None] | None) -> dict | None:
+    """batch の manifest.json（読めなければ None）。manifests を渡すとバッチごとに 1 回だけ読む。"""
+    if manifests is not None and batch_dir in manifests:
+        return manifests[batch_dir]
+    try:
+        meta = json.loads((batch_dir / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        meta = None
+    if manifests is not None:
+        manifests[batch_dir] = meta
+    return meta
+
+
+def _manifest_digest(path: Path, folder: str, manifests: dict[Path, dict | None] | None = None) -> str | None:
+    """
+    プロモート済みファイル名（または landing のパーツの位置）から manifest を引き、
+    land_import が計算済みのハッシュを返す。（ここでファイル本体を読み直さないため。見つからなければ None）
+    プロモート済みと landing 直読みで同じハッシュ・size になるので、replay 後の再プロモートも二重に読まない。
+    """
+    source = landing_source(path, folder)
+    if source is None:
+        return None
+    batch_dir, name = source
+    meta = _read_manifest(batch_dir, manifests)
+    if meta is None:
+        return None
+    # clean_landing が圧縮したパーツも manifest 上は元の名前（ハッシュも圧縮前の内容）
+    names = {f"parts/{name}"} | {f"parts/{name[:-len(s)]}" for s in COMPRESSED_CSV_SUFFIXES if name.endswith(s)}
+    for fm in meta.get("files", []):
+        if fm.get("path") in names:
+            found = manifest_hash(meta, fm)
+            if found is None:
+                return None
+            algo, digest = found
+            return digest if algo == LEGACY_HASH_ALGO else f"{algo}:{digest}"
+    return None
+
+
+def fingerprint(
+    path: Path, csv_root: Path, folder: str, manifests: dict[Path, dict | None] | None = None
+) -> dict:
+    st = path.stat()
+    return {
+        "path": path.relative_to(csv_root).as_posix(),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "md5": _manifest_digest(path, folder, manifests),
+    }
+
+
+def pending_files(
+    files: list[Path], csv_root: Path, folder: str, ledger: dict[str, dict]
+) -> tuple[list[Path], list[dict]]:
+    """
+    台帳に無い（または size/mtime が変わった）ファイルだけを返す。
+    台帳と size/mtime が合うファイルは stat だけで飛ばし、manifest（ハッシュ）は外れたファイルの分だけ読む。
+    同じ landing パーツが同じ md5 で別パスから取り込み済みなら（再プロモート・replay の直読み等）それもスキップ。
+    別バッチの同じ内容は読む（A → B → A と戻ったフィードで、後勝ちを A に戻すため）。
+    戻り値: (未取り込みファイル, その fingerprint)
+    """
+    loaded_parts = {
+        key: v["md5"] for p, v in ledger.items() if v["md5"] and (key := _part_key(Path(p))) is not None
+    }
+    pending: list[Path] = []
+    entries: list[dict] = []
+    manifests: dict[Path, dict | None] = {}
+    for f in files:
+        st = f.stat()
+        seen = ledger.get(f.relative_to(csv_root).as_posix())
+        if seen and seen["size"] == st.st_size and seen["mtime_ns"] == st.st_mtime_ns:
+            continue
+        fp = fingerprint(f, csv_root, folder, manifests)
+        key = _part_key(f)
+        if fp["md5"] and key is not None and loaded_parts.get(key) == fp["md5"]:
+            continue
+        pending.append(f)
+        entries.append(fp)
+    return pending, entries
+
+
+def record_ledger(conn: Connection, schema: str, table_name: str, entries: list[dict], full: bool):
+    """取り込み完了したファイルを記録（UPSERT と同じトランザクションで呼ぶ）。full なら台帳を作り直す。"""
+    fqtn = f'"{schema}"."{LEDGER_TABLE}"'
+    conn.execute(text(_ledger_ddl(schema)))
+    if full:
+        conn.execute(text(f"DELETE FROM {fqtn} WHERE table_name = :t"), {"t": table_name})
+    for e in entries:
+        conn.execute(
+            text(f"""
+                INSERT INTO {fqtn} (table_name, path, size, mtime_ns, md5, loaded_at)
+                VALUES (:t, :path, :size, :mtime_ns, :md5, now())
+                ON CONFLICT (table_name, path) DO UPDATE SET
+                    size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns,
+                    md5 = EXCLUDED.md5, loaded_at = EXCLUDED.loaded_at
+            """),
+            {"t": table_name, **e},
+        )
+
+
+def forget_table(engine: Engine, schema: str, table_name: str) -> int:
+    """
+    本テーブルが DB から消えた（dbt や手作業で DROP された）ときに、その台帳とデータ版を消す。
+    残したままだと台帳が全ファイル取り込み済みと答え、テーブルが作り直されない。戻り値: 消した台帳の行数
+    """
+    ensure_ledger(engine, schema)
+    with engine.begin() as conn:
+        conn.execute(text(_versions_ddl(schema)))
+        [(n,)] = conn.execute(
+            text(f'DELETE FROM "{schema}"."{LEDGER_TABLE}" WHERE table_name = :t'), {"t": table_name}
+        ).fetchall()
+        conn.execute(text(f'DELETE FROM "{schema}"."{VERSION_TABLE}" WHERE table_name = :t'), {"t": table_name})
+    return n
+
+
+# 本テーブルごとのデータ版（<TARGET_SCHEMA>._table_versions）。upsert_table の反映で行が入った・変わったときだけ、
+# UPSERT と同じトランザクションで +1 する（同じ内容の再送では進まない）。
+# delta スナップショットは行ごとに記録した版（csv_to_db.LOAD_SEQ_COL）で「前回スナップショット以降」の行を選び、
+# 日次スナップショットは版が前回と同じなら書き出しを省く。
+#   tracked_from : 行への版の記録が途切れずに続いている最初の版（記録しない反映があれば NULL に戻る）
+#   lineage      : 版の系列 ID。DB を作り直すと版は 1 からやり直すので、スナップショット側と突き合わせる
+VERSION_TABLE = "_table_versions"
+
+
+def _versions_ddl(schema: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS "{schema}"."{VERSION_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            version BIGINT,
+            tracked_from BIGINT,
+            lineage TEXT,
+            updated_at TIMESTAMP
+        );
+    """
+
+
+def read_table_version(engine: Engine, schema: str, table_name: str) -> dict | None:
+    """{version, tracked_from, lineage} を返す（一度も反映していなければ None）。"""
+    with engine.begin() as conn:
+        conn.execute(text(_versions_ddl(schema)))
+        row = conn.execute(
+            text(f'SELECT version, tracked_from, lineage FROM "{schema}"."{VERSION_TABLE}" WHERE table_name = :t'),
+            {"t": table_name},
+        ).first()
+    return None if row is None else {"version": row.version, "tracked_from": row.tracked_from, "lineage": row.lineage}
+
+
+def next_table_version(conn: Connection, schema: str, table_name: str) -> int:
+    """この反映に使う版（現在の版 + 1）。記録は行が変わったあとに bump_table_version で行う。"""
+    conn.execute(text(_versions_ddl(schema)))
+    current = conn.execute(
+        text(f'SELECT version FROM "{schema}"."{VERSION_TABLE}" WHERE table_name = :t'), {"t": table_name}
+    ).scalar()
+    return (current or 0) + 1
+
+
+def bump_table_version(conn: Connection, schema: str, table_name: str, version: int, tracked: bool):
+    """版を version に進める（UPSERT と同じトランザクションで呼ぶ）。tracked は行に版を記録したか。"""
+    fqtn = f'"{schema}"."{VERSION_TABLE}"'
+    row = conn.execute(text(f"SELECT tracked_from FROM {fqtn} WHERE table_name = :t"), {"t": table_name}).first()
+    if row is None:
+        conn.execute(
+            text(f"""
+                INSERT INTO {fqtn} (table_name, version, tracked_from, lineage, updated_at)
+                VALUES (:t, :v, :tf, :lineage, now())
+            """),
+            {"t": table_name, "v": version, "tf": version if tracked else None, "lineage": new_batch_id()},
+        )
+        return
+    conn.execute(
+        text(f"UPDATE {fqtn} SET version = :v, tracked_from = :tf, updated_at = now() WHERE table_name = :t"),
+        {"t": table_name, "v": version, "tf": (row.tracked_from or version) if tracked else None},
+    )
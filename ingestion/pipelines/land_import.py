@@ -1,13 +1,23 @@
 from __future__ import annotations
 
 import argparse
-import hashlib
+import codecs
+import contextlib
+import errno
 import json
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
 from ingestion.utils import get_paths, today_stamp, new_batch_id, landing_batch_dir
+from ingestion.pipelines.content_hash import HASH_ALGOS, new_hasher, resolve_hash_algo
+from ingestion.pipelines.landing_catalog import register_batch
+from ingestion.pipelines.landing_parquet import PARQUET_DIR, parquet_enabled, parquet_name, write_parquet_copy
+
+# コピー・ハッシュ・行数カウントで共有する読み込みバッファ
+_CHUNK_SIZE = 4 * 1024 * 1024
 
 
 def _iter_files(src: Path, pattern: str) -> list[Path]:
@@ -17,14 +27,6 @@ def _iter_files(src: Path, pattern: str) -> list[Path]:
     return [p for p in files if p.is_file()]
 
 
-def _md5(path: Path, chunk_size: int = 1024 * 1024) -> str:
-    h = hashlib.md5()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-
 def _count_rows_csv(path: Path, encoding: str = "utf-8") -> int:
     # ヘッダ1行 + データ行N → データ行だけ数える
     try:
@@ -38,6 +40,72 @@ def _count_rows_csv(path: Path, encoding: str = "utf-8") -> int:
             return max(0, sum(1 for _ in f) - 1)
 
 
+def _newline_is_byte(encoding: str) -> bool:
+    """改行が 0x0A の 1 バイトで、他の文字のバイト列に 0x0A / 0x22 が現れないエンコーディングか。"""
+    return not codecs.lookup(encoding).name.startswith(("utf-16", "utf-32"))
+
+
+def _count_newlines(chunk: bytes, quote_aware: bool, in_quote: bool) -> tuple[int, bool]:
+    """
+    チャンク中の行区切り（0x0A）を数える。quote_aware なら引用符内の改行は数えない
+    （"" のエスケープは 2 回反転で相殺）。戻り値: (改行数, チャンク末尾で引用符内か)
+    """
+    if not quote_aware or (not in_quote and b'"' not in chunk):
+        return chunk.count(b"\n"), in_quote
+    segments = chunk.split(b'"')
+    newlines = sum(seg.count(b"\n") for i, seg in enumerate(segments) if not (in_quote ^ (i % 2 == 1)))
+    return newlines, in_quote ^ ((len(segments) - 1) % 2 == 1)
+
+
+def _scan_file(src: Path, dst: Path | None, quote_aware: bool, hash_algo: str) -> tuple[str, int]:
+    """
+    src を 1 回だけ読み、同じバッファでハッシュと行数を計算する（dst を渡せばそこへ書き出す）。
+    戻り値: (hexdigest, データ行数)
+    """
+    h = new_hasher(hash_algo)
+    newlines, in_quote, last = 0, False, b""
+    with src.open("rb") as fsrc, (dst.open("wb") if dst is not None else contextlib.nullcontext()) as fdst:
+        while chunk := fsrc.read(_CHUNK_SIZE):
+            h.update(chunk)
+            n, in_quote = _count_newlines(chunk, quote_aware, in_quote)
+            newlines += n
+            last = chunk[-1:]
+            if fdst is not None:
+                fdst.write(chunk)
+    if dst is not None:
+        shutil.copystat(src, dst)
+    # ヘッダ1行 + データ行N（最終行に改行が無ければそれも 1 行）
+    lines = newlines + (1 if last and last != b"\n" else 0)
+    return h.hexdigest(), max(0, lines - 1)
+
+
+def _import_file(src: Path, dst: Path, move: bool, encoding: str, quote_aware: bool, hash_algo: str) -> dict:
+    """
+    1 ファイルを landing へ収め、manifest 用のメタ情報を返す（ハッシュは hash_algo 名のキー）。
+    move で同じファイルシステムなら rename してから 1 回読む。それ以外はコピーしながらハッシュと行数を取る。
+    UTF-16/32 は改行がバイト単位で数えられないので、行数だけ従来どおりデコードして数える。
+    """
+    renamed = False
+    if move:
+        try:
+            os.rename(src, dst)
+            renamed = True
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    digest, rows = _scan_file(dst if renamed else src, None if renamed else dst, quote_aware, hash_algo)
+    if move and not renamed:
+        src.unlink()
+    if not _newline_is_byte(encoding):
+        rows = _count_rows_csv(dst, encoding=encoding)
+    return {
+        "path": f"parts/{dst.name}",
+        "size": dst.stat().st_size,
+        hash_algo: digest,
+        "rows": rows,
+    }
+
+
 def import_manual(
     src: Path,
     namespace: str,
@@ -48,11 +116,23 @@ def import_manual(
     move: bool,
     dry_run: bool,
     make_latest_symlink: bool,
+    workers: int | None = None,
+    quote_aware: bool = False,
+    hash_algo: str | None = None,
+    parquet: bool | None = None,
 ):
     """
     手動でドロップした CSV を landing へ収め、manifest.json を生成する。
+    各ファイルはコピー・ハッシュ・行数を 1 回の読み込みで済ませ、workers 本のスレッドで並行に処理する。
+    quote_aware なら引用符内の改行を含む行も 1 行として数える。
+    hash_algo（未指定なら LANDING_HASH_ALGO → auto）は manifest の hash_algo に記録する。
+    parquet（未指定なら LANDING_PARQUET）なら各パーツの Parquet コピーも parquet/ に書く（ローダが優先して読む）。
+    Parquet コピーは rowskip / encoding を tables.yml から取る。書けなければ警告してそのパーツのコピーだけ省く。
+    途中で失敗したら一時ディレクトリを消し、move したファイルは元の場所へ戻す。
     """
     paths = get_paths()
+    hash_algo = resolve_hash_algo(hash_algo)
+    parquet = parquet_enabled(parquet)
     landing_root = paths["LANDING_ROOT"]
 
     run_date = run_date or today_stamp()
@@ -77,23 +157,46 @@ def import_manual(
             print(f"  [dry] {i:02d}: {p.name}")
         return
 
-    tmp_parts.mkdir(parents=True, exist_ok=True)
+    rowskip, parquet_encoding = 0, encoding
+    if parquet:
+        from ingestion.pipelines.csv_to_db import _landing_encoding, _rowskip, find_table_spec, load_config
+        spec = find_table_spec(load_config()["tables"], namespace, table) or {}
+        rowskip, parquet_encoding = _rowskip(spec), _landing_encoding(spec, encoding)
 
-    files_meta = []
-    for p in csvs:
-        dst = tmp_parts / p.name
+    def _one(p: Path) -> dict:
+        meta = _import_file(p, tmp_parts / p.name, move, encoding, quote_aware, hash_algo)
+        print(f"[land-import] {'moved' if move else 'copied'}: {p} -> {tmp_parts / p.name} (rows={meta['rows']})")
+        if parquet:
+            out = tmp_dir / PARQUET_DIR / parquet_name(p.name)
+            try:
+                info = write_parquet_copy(tmp_parts / p.name, out, parquet_encoding, rowskip)
+            except Exception as e:
+                # コピーは読み込みの高速化だけなので、書けなくても取り込みは続ける（ローダは CSV を読む）
+                out.unlink(missing_ok=True)
+                print(f"[land-import][warn] parquet copy skipped for {p.name}: {e}")
+                return meta
+            if info is not None:
+                meta.update(info)
+                print(f"[land-import] parquet copy: {out.name} (rows={info['parquet_rows']})")
+        return meta
+
+    def _rollback():
         if move:
-            shutil.move(str(p), str(dst))
-        else:
-            shutil.copy2(str(p), str(dst))
-        meta = {
-            "path": f"parts/{p.name}",
-            "size": dst.stat().st_size,
-            "md5": _md5(dst),
-            "rows": _count_rows_csv(dst, encoding=encoding),
-        }
-        files_meta.append(meta)
-        print(f"[land-import] {'moved' if move else 'copied'}: {p} -> {dst}")
+            for p in csvs:
+                if not p.exists() and (tmp_parts / p.name).exists():
+                    shutil.move(str(tmp_parts / p.name), str(p))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        with contextlib.suppress(OSError):
+            tmp_dir.parent.rmdir()  # 今回作った空の run_date=... だけ消える
+
+    tmp_parts.mkdir(parents=True, exist_ok=True)
+    try:
+        workers = workers or min(4, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            files_meta = list(pool.map(_one, csvs))
+    except BaseException:
+        _rollback()
+        raise
 
     manifest = {
         "namespace": namespace,
@@ -103,16 +206,22 @@ def import_manual(
         "source": "manual",
         "extracted_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "encoding": encoding,
+        "hash_algo": hash_algo,
+        "quote_aware_rows": quote_aware,
         "files": files_meta,
         "notes": "manual drop import",
     }
-    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    final_dir.parent.mkdir(parents=True, exist_ok=True)
-    if final_dir.exists():
-        bak = final_dir.with_name(final_dir.name + ".bak")
-        shutil.move(str(final_dir), str(bak))
-    shutil.move(str(tmp_dir), str(final_dir))
+    try:
+        (tmp_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        final_dir.parent.mkdir(parents=True, exist_ok=True)
+        if final_dir.exists():
+            bak = final_dir.with_name(final_dir.name + ".bak")
+            shutil.move(str(final_dir), str(bak))
+        shutil.move(str(tmp_dir), str(final_dir))
+    except BaseException:
+        _rollback()
+        raise
+    register_batch(landing_root, final_dir, manifest)
     print(f"[land-import] committed: {final_dir}")
 
     if make_latest_symlink:
@@ -134,6 +243,13 @@ def main():
     ap.add_argument("--move", action="store_true", help="move files instead of copy")
     ap.add_argument("--dry-run", action="store_true", help="show what would happen")
     ap.add_argument("--latest", action="store_true", help="create/refresh 'latest' symlink in run_date folder")
+    ap.add_argument("--workers", type=int, help="files imported concurrently (default: min(4, CPU count))")
+    ap.add_argument("--quote-aware-rows", action="store_true",
+                    help="do not count newlines inside quoted fields when counting rows")
+    ap.add_argument("--hash-algo", choices=("auto",) + HASH_ALGOS,
+                    help="manifest content hash (default: LANDING_HASH_ALGO or auto)")
+    ap.add_argument("--parquet", action="store_true", default=None,
+                    help="also write a Parquet copy of each part (default: LANDING_PARQUET)")
     args = ap.parse_args()
 
     # namespace/table をパスから推測（src が .../namespace=<ns>/table=<table>/ なら拾う）
@@ -158,6 +274,10 @@ def main():
         move=args.move,
         dry_run=args.dry_run,
         make_latest_symlink=args.latest,
+        workers=args.workers,
+        quote_aware=args.quote_aware_rows,
+        hash_algo=args.hash_algo,
+        parquet=args.parquet,
     )
 
 
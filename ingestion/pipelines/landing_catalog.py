@@ -0,0 +1,296 @@
+# ingestion/pipelines/landing_catalog.py
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ingestion.utils import COMPRESSED_CSV_SUFFIXES, get_paths, glob_csv_parts
+
+# landing のバッチ一覧（LANDING_ROOT/_catalog.sqlite）
+# validate / clean_landing / replay / promote / ingest_flow はディレクトリを glob せずここを引く。
+# import_manual が landing へのコミット直後に 1 トランザクションで登録し、clean_landing が削除・圧縮を反映する。
+# landing に直接書き込むスクリプトは register_batch を呼ぶ（忘れたら rebuild-catalog で作り直す）。
+# 倉庫の DuckDB ではなく SQLite なのは、取り込み中（DuckDB は単一ライタ）でも landing 側を更新できるようにするため。
+CATALOG_NAME = "_catalog.sqlite"
+# 検証済みバッチに validate が置くマーカー（rebuild-catalog で validated_at を復元する元）
+VALIDATED_MARKER = ".validated"
+
+_DDL = """
+    CREATE TABLE IF NOT EXISTS batches (
+        namespace TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        run_date TEXT NOT NULL,
+        batch_id TEXT NOT NULL,
+        path TEXT NOT NULL,
+        source TEXT,
+        extracted_at TEXT,
+        encoding TEXT,
+        hash_algo TEXT,
+        files INTEGER,
+        rows INTEGER,
+        bytes INTEGER,
+        compressed INTEGER NOT NULL DEFAULT 0,
+        manifest TEXT,
+        registered_at TEXT NOT NULL,
+        validated_at TEXT,
+        validated_deep INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (namespace, table_name, run_date, batch_id)
+    )
+"""
+
+_COLUMNS = (
+    "namespace", "table_name", "run_date", "batch_id", "path", "source", "extracted_at",
+    "encoding", "hash_algo", "files", "rows", "bytes", "compressed", "manifest", "registered_at",
+    "validated_at", "validated_deep",
+)
+
+# 後から足した列（既存のカタログには接続時に ALTER TABLE で追加する）
+_ADDED_COLUMNS = {
+    "validated_at": "TEXT",
+    "validated_deep": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def catalog_path(landing_root: Path) -> Path:
+    return landing_root / CATALOG_NAME
+
+
+def _connect(landing_root: Path, build_if_missing: bool = True) -> sqlite3.Connection:
+    """カタログに接続する。まだ無ければ landing を 1 回だけ走査して作る（既存の landing 向け）。"""
+    path = catalog_path(landing_root)
+    exists = path.exists()
+    landing_root.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute(_DDL)
+    existing = {r["name"] for r in conn.execute("PRAGMA table_info(batches)")}
+    for col, decl in _ADDED_COLUMNS.items():
+        if col not in existing:
+            conn.execute(f"ALTER TABLE batches ADD COLUMN {col} {decl}")
+    if not exists and build_if_missing:
+        print(f"[catalog] {path} not found; building it from the landing tree")
+        _rebuild(conn, landing_root)
+    return conn
+
+
+def _parse_batch_dir(landing_root: Path, batch_dir: Path) -> tuple[str, str, str, str] | None:
+    """.../namespace=<ns>/table=<t>/run_date=<d>/batch_id=<id> → (ns, t, d, id)。階層外なら None。"""
+    try:
+        parts = batch_dir.relative_to(landing_root).parts
+    except ValueError:
+        return None
+    keys = ("namespace=", "table=", "run_date=", "batch_id=")
+    if len(parts) != 4 or not all(p.startswith(k) for p, k in zip(parts, keys)):
+        return None
+    return tuple(p.split("=", 1)[1] for p in parts)
+
+
+def _batch_row(landing_root: Path, batch_dir: Path, meta: dict | None) -> dict | None:
+    key = _parse_batch_dir(landing_root, batch_dir)
+    if key is None:
+        return None
+    ns, table, run_date, batch_id = key
+    files = (meta or {}).get("files", [])
+    parts_dir = batch_dir / "parts"
+    return {
+        "namespace": ns,
+        "table_name": table,
+        "run_date": run_date,
+        "batch_id": batch_id,
+        "path": batch_dir.relative_to(landing_root).as_posix(),
+        "source": (meta or {}).get("source"),
+        "extracted_at": (meta or {}).get("extracted_at"),
+        "encoding": (meta or {}).get("encoding"),
+        "hash_algo": (meta or {}).get("hash_algo", "md5" if meta else None),
+        "files": len(files) if meta else None,
+        "rows": sum(int(f.get("rows") or 0) for f in files) if meta else None,
+        "bytes": sum(int(f.get("size") or 0) for f in files) if meta else None,
+        "compressed": int(any(p.suffix in COMPRESSED_CSV_SUFFIXES for p in glob_csv_parts(parts_dir))),
+        "manifest": json.dumps(meta, ensure_ascii=False) if meta is not None else None,
+        "registered_at": _utc_now(),
+        **_read_validated(batch_dir),
+    }
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _read_validated(batch_dir: Path) -> dict:
+    try:
+        marker = json.loads((batch_dir / VALIDATED_MARKER).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        marker = {}
+    return {"validated_at": marker.get("validated_at"), "validated_deep": int(bool(marker.get("deep")))}
+
+
+def _upsert_row(conn: sqlite3.Connection, row: dict):
+    cols = ", ".join(_COLUMNS)
+    marks = ", ".join(f":{c}" for c in _COLUMNS)
+    conn.execute(f"INSERT OR REPLACE INTO batches ({cols}) VALUES ({marks})", row)
+
+
+def register_batch(landing_root: Path, batch_dir: Path, meta: dict | None = None):
+    """バッチを 1 トランザクションで登録（既存なら置き換え）。meta 省略時は manifest.json を読む。"""
+    if meta is None:
+        meta = _read_manifest(batch_dir)
+    row = _batch_row(landing_root, batch_dir, meta)
+    if row is None:
+        raise ValueError(f"not a landing batch dir: {batch_dir}")
+    with closing(_connect(landing_root)) as conn, conn:
+        _upsert_row(conn, row)
+
+
+def unregister_batch(landing_root: Path, batch_dir: Path):
+    key = _parse_batch_dir(landing_root, batch_dir)
+    if key is None:
+        return
+    with closing(_connect(landing_root)) as conn, conn:
+        conn.execute(
+            "DELETE FROM batches WHERE namespace = ? AND table_name = ? AND run_date = ? AND batch_id = ?", key
+        )
+
+
+def mark_compressed(landing_root: Path, batch_dir: Path):
+    key = _parse_batch_dir(landing_root, batch_dir)
+    if key is None:
+        return
+    with closing(_connect(landing_root)) as conn, conn:
+        conn.execute(
+            "UPDATE batches SET compressed = 1 "
+            "WHERE namespace = ? AND table_name = ? AND run_date = ? AND batch_id = ?", key
+        )
+
+
+def mark_validated(landing_root: Path, batch_dir: Path, checks: dict):
+    """検証に通ったバッチにマーカーを置き、カタログの validated_at を埋める。checks は実施した検査の記録。"""
+    validated_at = _utc_now()
+    marker = {"validated_at": validated_at, **checks}
+    (batch_dir / VALIDATED_MARKER).write_text(json.dumps(marker, ensure_ascii=False), encoding="utf-8")
+    key = _parse_batch_dir(landing_root, batch_dir)
+    if key is None:
+        return
+    with closing(_connect(landing_root)) as conn, conn:
+        conn.execute(
+            "UPDATE batches SET validated_at = ?, validated_deep = ? "
+            "WHERE namespace = ? AND table_name = ? AND run_date = ? AND batch_id = ?",
+            (validated_at, int(bool(checks.get("deep"))), *key),
+        )
+
+
+def _read_manifest(batch_dir: Path) -> dict | None:
+    try:
+        return json.loads((batch_dir / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def list_batches(
+    landing_root: Path,
+    namespace: str | None = None,
+    table: str | None = None,
+    run_date: str | None = None,
+    since: str | None = None,
+    unvalidated_only: bool = False,
+    deep: bool = False,
+) -> list[dict]:
+    """
+    条件に合うバッチを namespace → table → run_date → batch_id の順（= 時系列昇順）で返す。
+    unvalidated_only なら validate に通っていない（validated_at が空の）バッチだけ。deep も付ければ deep 検査前のものも含む。
+    各 dict は catalog の列（manifest 本文を除く）と、絶対パスの "dir"。
+    """
+    where, params = [], []
+    for col, val in (("namespace", namespace), ("table_name", table), ("run_date", run_date)):
+        if val is not None:
+            where.append(f"{col} = ?")
+            params.append(val)
+    if since is not None:
+        where.append("run_date >= ?")
+        params.append(since)
+    if unvalidated_only:
+        where.append("(validated_at IS NULL OR validated_deep = 0)" if deep else "validated_at IS NULL")
+    sql = f"SELECT {', '.join(c for c in _COLUMNS if c != 'manifest')} FROM batches"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY namespace, table_name, run_date, batch_id"
+    with closing(_connect(landing_root)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    result = []
+    for r in rows:
+        d = dict(r)
+        d["dir"] = landing_root / d["path"]
+        result.append(d)
+    return result
+
+
+def list_namespaces_tables(landing_root: Path) -> dict[str, set[str]]:
+    """{namespace: {table, ...}}"""
+    with closing(_connect(landing_root)) as conn:
+        rows = conn.execute("SELECT DISTINCT namespace, table_name FROM batches").fetchall()
+    result: dict[str, set[str]] = {}
+    for r in rows:
+        result.setdefault(r["namespace"], set()).add(r["table_name"])
+    return result
+
+
+def latest_run_date(landing_root: Path, namespace: str, table: str) -> str | None:
+    with closing(_connect(landing_root)) as conn:
+        row = conn.execute(
+            "SELECT max(run_date) FROM batches WHERE namespace = ? AND table_name = ?", (namespace, table)
+        ).fetchone()
+    return row[0]
+
+
+def _rebuild(conn: sqlite3.Connection, landing_root: Path) -> int:
+    rows = []
+    for batch_dir in sorted(landing_root.glob("namespace=*/table=*/run_date=*/batch_id=*"), key=lambda p: str(p)):
+        # land_import の作業中ディレクトリ（.tmp）と退避（.bak）は除く
+        if not batch_dir.is_dir() or batch_dir.name.endswith((".tmp", ".bak")):
+            continue
+        row = _batch_row(landing_root, batch_dir, _read_manifest(batch_dir))
+        if row is not None:
+            rows.append(row)
+    with conn:
+        conn.execute("DELETE FROM batches")
+        for row in rows:
+            _upsert_row(conn, row)
+    return len(rows)
+
+
+def rebuild_catalog(landing_root: Path) -> int:
+    """landing を走査してカタログを作り直す（1 トランザクションで全置換）。戻り値: バッチ数"""
+    with closing(_connect(landing_root, build_if_missing=False)) as conn:
+        n = _rebuild(conn, landing_root)
+    print(f"[catalog] rebuilt: {catalog_path(landing_root)} (batches={n})")
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Landing batch catalog")
+    ap.add_argument("--landing", help="landing root (default: PATHS)", default=None)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild-catalog", help="rescan the landing tree and rebuild the catalog")
+    p_list = sub.add_parser("list", help="list cataloged batches")
+    p_list.add_argument("--namespace")
+    p_list.add_argument("--table")
+    p_list.add_argument("--since", help="YYYYMMDD")
+    args = ap.parse_args()
+
+    landing_root = Path(args.landing) if args.landing else get_paths()["LANDING_ROOT"]
+    if args.cmd == "rebuild-catalog":
+        rebuild_catalog(landing_root)
+    else:
+        for b in list_batches(landing_root, args.namespace, args.table, since=args.since):
+            print(
+                f"{b['namespace']}/{b['table_name']} run_date={b['run_date']} batch_id={b['batch_id']} "
+                f"files={b['files']} rows={b['rows']} bytes={b['bytes']} compressed={b['compressed']} "
+                f"validated_at={b['validated_at']}{' (deep)' if b['validated_deep'] else ''}"
+            )
+
+
+if __name__ == "__main__":
+    main()
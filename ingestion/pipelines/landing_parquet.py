@@ -0,0 +1,164 @@
+# ingestion/pipelines/landing_parquet.py
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingestion.utils import COMPRESSED_CSV_SUFFIXES, get_paths, glob_csv_parts
+from ingestion.pipelines.ingest_ledger import landing_source
+from ingestion.pipelines.landing_catalog import list_batches, register_batch
+
+# landing パーツの Parquet コピー（<batch>/parquet/<パーツ名>.parquet）
+# land_import --parquet（.env の LANDING_PARQUET=1）で取り込み時に書き、manifest の各ファイルに "parquet" を記録する。
+# 形式は stage_table の中間 Parquet と同じ（ファイル内で重複列を _1, _2 ... にした全列 string ＋ 行序数 __row_ord）。
+# ローダ（upsert_table / --jobs / replay）は、コピーがあって rowskip と列数が一致すれば CSV をパースせずこちらを読む。
+PARQUET_DIR = "parquet"
+_META_ROWSKIP = b"ingestion.rowskip"
+_META_HEADER = b"ingestion.header"
+_WRITE_CHUNK_ROWS = 200_000
+
+
+def parquet_enabled(flag: bool | None = None) -> bool:
+    """引数 → LANDING_PARQUET の順に決める（既定 off）。"""
+    if flag is not None:
+        return flag
+    return os.getenv("LANDING_PARQUET", "0").lower() in ("1", "true", "yes")
+
+
+def dedupe_header(hdr: list[str]) -> list[str]:
+    """1 ファイル内で重複する列名を _1, _2 ... にする（csv_to_db の正規化をファイル単体で行ったもの）。"""
+    total: dict[str, int] = {}
+    for col in hdr:
+        total[col] = total.get(col, 0) + 1
+    seen: dict[str, int] = {}
+    cols = []
+    for col in hdr:
+        seen[col] = seen.get(col, 0) + 1
+        cols.append(col if total[col] == 1 else f"{col}_{seen[col]}")
+    return cols
+
+
+def parquet_name(part_name: str) -> str:
+    """parts のファイル名 → Parquet コピーのファイル名（clean_landing の .gz / .zst は外す）。"""
+    for suffix in COMPRESSED_CSV_SUFFIXES:
+        part_name = part_name.removesuffix(suffix)
+    return f"{part_name}.parquet"
+
+
+def write_parquet_copy(csv_path: Path, out_path: Path, encoding: str, rowskip: int) -> dict | None:
+    """
+    CSV パーツを pyarrow のストリーミングリーダで読み、Parquet（zstd）に書く。ヘッダが無ければ書かない。
+    戻り値: manifest のファイル要素に足す {"parquet": 相対パス, "parquet_rows": 行数}
+    """
+    from ingestion.pipelines.csv_to_db import ROW_ORD, _iter_arrow_chunks, _read_header_raw
+
+    hdr = _read_header_raw(csv_path, encoding=encoding, rowskip=rowskip)
+    if not hdr:
+        return None
+    cols = dedupe_header(hdr)
+    schema = pa.schema(
+        [(c, pa.string()) for c in cols] + [(ROW_ORD, pa.int64())],
+        metadata={_META_ROWSKIP: str(rowskip).encode(), _META_HEADER: json.dumps(hdr, ensure_ascii=False).encode()},
+    )
+    rows = 0
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with pq.ParquetWriter(out_path, schema, compression="zstd") as writer:
+        for chunk in _iter_arrow_chunks(csv_path, cols, rowskip, _WRITE_CHUNK_ROWS, encoding):
+            writer.write_table(chunk)
+            rows += chunk.num_rows
+    return {"parquet": f"{PARQUET_DIR}/{out_path.name}", "parquet_rows": rows}
+
+
+def parquet_copy_of(path: Path, folder: str, n_cols: int, rowskip: int) -> Path | None:
+    """
+    CSV（プロモート済み or landing のパーツ）に対応する landing の Parquet コピーを返す。
+    無い・rowskip が違う・列数が違う（ヘッダの読み方が変わった）なら None（CSV を読む）。
+    """
+    source = landing_source(path, folder)
+    if source is None:
+        return None
+    batch_dir, name = source
+    copy = batch_dir / PARQUET_DIR / parquet_name(name)
+    if not copy.exists():
+        return None
+    try:
+        schema = pq.read_schema(copy)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if (schema.metadata or {}).get(_META_ROWSKIP) != str(rowskip).encode() or len(schema.names) != n_cols + 1:
+        return None
+    return copy
+
+
+def build_parquet_copies(landing_root: Path, namespace: str | None = None, table: str | None = None) -> int:
+    """
+    既存バッチに Parquet コピーを後から作る（コピーの無いパーツだけ）。manifest とカタログも更新する。
+    書けなかったパーツは一時ファイルを消して警告し、次へ進む（コピーは高速化のためだけなので CSV はそのまま読める）。
+    戻り値: 書いたファイル数
+    """
+    from ingestion.pipelines.csv_to_db import _landing_encoding, _rowskip, find_table_spec, load_config
+
+    tables_cfg = load_config()["tables"]
+    written = 0
+    for entry in list_batches(landing_root, namespace, table):
+        batch = entry["dir"]
+        manifest_path = batch / "manifest.json"
+        try:
+            meta = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            print(f"[landing-parquet] skip (manifest unreadable): {batch}")
+            continue
+        spec = find_table_spec(tables_cfg, entry["namespace"], entry["table_name"]) or {}
+        rowskip = _rowskip(spec)
+        encoding = _landing_encoding(spec, meta.get("encoding"))
+        parts = {p.name: p for p in glob_csv_parts(batch / "parts")}
+        changed = False
+        for fm in meta.get("files", []):
+            if fm.get("parquet") and (batch / fm["parquet"]).exists():
+                continue
+            name = fm.get("path", "").split("/", 1)[-1]
+            part = next((parts[n] for n in (name, *(name + s for s in COMPRESSED_CSV_SUFFIXES)) if n in parts), None)
+            if part is None:
+                continue
+            out = batch / PARQUET_DIR / parquet_name(part.name)
+            tmp = out.with_name(f".{out.name}.tmp")
+            try:
+                info = write_parquet_copy(part, tmp, encoding, rowskip)
+            except Exception as e:
+                tmp.unlink(missing_ok=True)
+                print(f"[landing-parquet][warn] skip {part.name} in {batch} (encoding={encoding}): {e}")
+                continue
+            if info is None:
+                tmp.unlink(missing_ok=True)
+                continue
+            os.replace(tmp, out)
+            fm.update(info, parquet=f"{PARQUET_DIR}/{out.name}")
+            changed = True
+            written += 1
+            print(f"[landing-parquet] wrote: {out} (rows={info['parquet_rows']})")
+        if changed:
+            tmp_manifest = manifest_path.with_name(".manifest.json.tmp")
+            tmp_manifest.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_manifest, manifest_path)
+            register_batch(landing_root, batch, meta)
+    return written
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write Parquet copies of landing parts for existing batches")
+    ap.add_argument("--landing", help="landing root (default: PATHS)", default=None)
+    ap.add_argument("--namespace")
+    ap.add_argument("--table")
+    args = ap.parse_args()
+    landing_root = Path(args.landing) if args.landing else get_paths()["LANDING_ROOT"]
+    n = build_parquet_copies(landing_root, args.namespace, args.table)
+    print(f"[landing-parquet] done (files={n})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,113 @@
 from __future__ import annotations
 
 import argparse
+import errno
+import os
 import shutil
+import sys
 from pathlib import Path
 
-from ingestion.utils import get_paths
+from ingestion.utils import get_paths, glob_csv_parts
+from ingestion.pipelines.landing_catalog import list_batches
+
+# landing → db_ingestion の置き方（.env の PROMOTE_LINK_MODE）
+#   auto    : reflink → hardlink → コピーの順に試す（既定）
+#   reflink : copy-on-write の複製（btrfs / XFS / APFS 等。元と独立しているので安全）
+#   hardlink: 同じ inode を指すリンク（同一ファイルシステムのみ。どちらかを上書き編集すると両方変わる）
+#   copy    : shutil.copy2（sendfile / 固定長バッファのストリームコピー。ファイル全体をメモリに載せない）
+# 指定の方式が使えなければ copy にフォールバックする（別ファイルシステムなら auto も自然に copy になる）。
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+
+# Linux の FICLONE ioctl（_IOW(0x94, 9, int)）
+_FICLONE = 0x40049409
+
+
+def _link_mode() -> str:
+    mode = os.getenv("PROMOTE_LINK_MODE", "auto")
+    if mode not in LINK_MODES:
+        raise ValueError(f"PROMOTE_LINK_MODE must be one of {', '.join(LINK_MODES)} (got '{mode}')")
+    return mode
+
+
+def _reflink(src: Path, dest: Path) -> bool:
+    """FICLONE で CoW 複製する。未対応（Linux 以外・ext4・別 FS など）なら False。"""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    with src.open("rb") as fsrc, dest.open("wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM):
+                return False
+            raise
+    shutil.copystat(src, dest)
+    return True
+
+
+def place_part(src: Path, dest: Path, mode: str = "auto") -> str:
+    """
+    src を dest に置き、実際に使った方式（reflink / hardlink / copy）を返す。
+    一時名に置いてから os.replace するので、同じバッチの再プロモートでも dest は常に完全なファイル。
+    """
+    tmp = dest.with_name(f".{dest.name}.promote.tmp")
+    tmp.unlink(missing_ok=True)
+    method = "copy"
+    try:
+        if mode in ("auto", "reflink") and _reflink(src, tmp):
+            method = "reflink"
+        else:
+            tmp.unlink(missing_ok=True)
+            linked = False
+            if mode in ("auto", "hardlink"):
+                try:
+                    os.link(src, tmp)
+                    linked = True
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                        raise
+            if linked:
+                method = "hardlink"
+            else:
+                shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return method
+
+
+def promote_batch(batch_dir: Path, dest_dir: Path, table: str, run_date: str, tag: str = "[promote]") -> int:
+    """
+    batch_dir/parts のパーツ（圧縮版を含む）を dest_dir に置く。
+    衝突しないように run_date/batch_id をファイル名に付与（圧縮パーツは圧縮のまま）。戻り値は件数。
+    """
+    parts_dir = batch_dir / "parts"
+    if not parts_dir.exists():
+        raise FileNotFoundError(f"parts not found: {parts_dir}")
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    mode = _link_mode()
+    methods: dict[str, int] = {}
+    for src in glob_csv_parts(parts_dir):
+        dest = dest_dir / f"{table}_{run_date}_{batch_dir.name}_{src.name}"
+        method = place_part(src, dest, mode)
+        methods[method] = methods.get(method, 0) + 1
+        print(f"{tag} {src} -> {dest} ({method})")
+
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(methods.items())) or "none"
+    print(f"{tag} promoted={sum(methods.values())} ({summary}), to={dest_dir}")
+    return sum(methods.values())
 
 
 def resolve_batch_dir(landing_root: Path, namespace: str, table: str, run_date: str, batch_id: str | None) -> Path:
     base = landing_root / f"namespace={namespace}" / f"table={table}" / f"run_date={run_date}"
     if batch_id in (None, "latest"):
-        candidates = sorted([p for p in base.glob("batch_id=*") if p.is_dir()], key=lambda p: str(p))
+        # latest は landing のカタログで決める（直接書き込んだバッチが見えなければ rebuild-catalog）
+        candidates = list_batches(landing_root, namespace, table, run_date)
         if not candidates:
             raise FileNotFoundError(f"No batch under {base}")
-        return candidates[-1]
+        return candidates[-1]["dir"]
     else:
         p = base / f"batch_id={batch_id}"
         if not p.exists():
@@ -27,22 +121,8 @@ def promote(args):
     csv_root = paths["CSV_ROOT"]
 
     batch_dir = resolve_batch_dir(landing_root, args.namespace, args.table, args.run_date, args.batch_id)
-    parts_dir = batch_dir / "parts"
-    if not parts_dir.exists():
-        raise FileNotFoundError(f"parts not found: {parts_dir}")
-
     dest_dir = csv_root / f"namespace={args.namespace}" / f"table={args.table}"
-    dest_dir.mkdir(parents=True, exist_ok=True)
-
-    copied = 0
-    for src in sorted(parts_dir.glob("*.csv"), key=lambda p: str(p)):
-        # 衝突しないように run_date/batch_id をファイル名に付与
-        dest = dest_dir / f"{args.table}_{args.run_date}_{batch_dir.name}_{src.name}"
-        shutil.copy2(src, dest)
-        copied += 1
-        print(f"[promote] {src} -> {dest}")
-
-    print(f"[promote] copied={copied}, to={dest_dir}")
+    promote_batch(batch_dir, dest_dir, args.table, args.run_date)
 
 
 def main():
@@ -3,49 +3,38 @@ from __future__ import annotations
 
 import argparse
 import shutil
+import time
 from pathlib import Path
 from typing import Iterable
 
-from ingestion.utils import get_paths
+from ingestion.utils import get_paths, glob_csv_parts
+from ingestion.pipelines.landing_catalog import list_batches, list_namespaces_tables
 from ingestion.pipelines.csv_to_db import (
     load_config,
     upsert_table,
 )
-# promote と同じ振る舞いを内蔵（コピーのみ。1テーブルに全バッチを集約→最後に1回だけUPSERT）
+# 全バッチの parts を時系列順に並べ、landing に置いたまま 1 回だけ UPSERT（db_ingestion へはコピーしない）
 
-def _iter_batches(landing_root: Path, namespace: str, table: str) -> list[Path]:
+def _iter_batches(landing_root: Path, namespace: str, table: str, since: str | None = None) -> list[Path]:
     """
     landing/namespace=<ns>/table=<table>/run_date=YYYYMMDD/batch_id=... を
-    run_date → batch_id の辞書順（= 時系列昇順）で返す
+    run_date → batch_id の辞書順（= 時系列昇順）で返す（landing のカタログから。since は run_date の下限）
     """
-    base = landing_root / f"namespace={namespace}" / f"table={table}"
-    run_dirs = [p for p in base.glob("run_date=*") if p.is_dir()]
-    batches: list[Path] = []
-    for r in sorted(run_dirs, key=lambda p: p.name):
-        bs = [p for p in r.glob("batch_id=*") if p.is_dir()]
-        bs.sort(key=lambda p: p.name)
-        batches.extend(bs)
-    return batches
-
-def _copy_batch_parts_to_csv_root(batch_dir: Path, csv_root: Path, namespace: str, table: str, run_date: str):
+    return [b["dir"] for b in list_batches(landing_root, namespace, table, since=since)]
+
+def _batch_part_files(batches: list[Path], pattern: str) -> list[Path]:
     """
-    promote.py と同様：parts/*.csv を db_ingestion 側へコピー。
-    ファイル名は <table>_<run_date>_<batch_dir.name>_<元ファイル名>
+    各バッチの parts/<pattern>（圧縮版を含む）をバッチの時系列 → ファイル名順に並べて返す。
+    promote のファイル名（<table>_<run_date>_<batch_id>_<元ファイル名>）の辞書順と同じ並びなので、
+    コピーしてから読んでいた頃と後勝ちの結果は変わらない。
     """
-    parts_dir = batch_dir / "parts"
-    if not parts_dir.exists():
-        raise FileNotFoundError(f"parts not found: {parts_dir}")
-
-    dest_dir = csv_root / f"namespace={namespace}" / f"table={table}"
-    dest_dir.mkdir(parents=True, exist_ok=True)
-
-    copied = 0
-    for src in sorted(parts_dir.glob("*.csv"), key=lambda p: str(p)):
-        dest = dest_dir / f"{table}_{run_date}_{batch_dir.name}_{src.name}"
-        shutil.copy2(src, dest)
-        copied += 1
-        print(f"[replay][copy] {src} -> {dest}")
-    return copied
+    files: list[Path] = []
+    for batch_dir in batches:
+        parts_dir = batch_dir / "parts"
+        if not parts_dir.exists():
+            raise FileNotFoundError(f"parts not found: {parts_dir}")
+        files.extend(glob_csv_parts(parts_dir, pattern))
+    return files
 
 def _wipe_table_folder(csv_root: Path, namespace: str, table: str):
     """
@@ -64,20 +53,10 @@ def _wipe_table_folder(csv_root: Path, namespace: str, table: str):
 
 def _discover_namespaces_tables(landing_root: Path) -> dict[str, set[str]]:
     """
-    landing 直下から namespace と table を列挙
+    landing のカタログから namespace と table を列挙
     戻り値: { namespace: {table, ...}, ... }
     """
-    result: dict[str, set[str]] = {}
-    for ns_dir in landing_root.glob("namespace=*"):
-        if not ns_dir.is_dir():
-            continue
-        ns = ns_dir.name.split("=", 1)[1]
-        for tbl_dir in ns_dir.glob("table=*"):
-            if not tbl_dir.is_dir():
-                continue
-            table = tbl_dir.name.split("=", 1)[1]
-            result.setdefault(ns, set()).add(table)
-    return result
+    return list_namespaces_tables(landing_root)
 
 def replay(namespace: str | None, table: str | None, since: str | None, snapshot: bool):
     paths = get_paths()
@@ -105,7 +84,7 @@ def replay(namespace: str | None, table: str | None, since: str | None, snapshot
         print("[replay] no targets found under landing. (check --namespace/--table)")
         return
 
-    # テーブル単位で：db_ingestion 側のフォルダを空に → 全バッチを時系列でコピー → 1回だけ upsert
+    # テーブル単位で：db_ingestion 側のフォルダを空に → 全バッチの parts を時系列で並べて 1回だけ upsert
     from ingestion.pipelines.csv_to_db import get_engine, ensure_schema, TARGET_SCHEMA, snapshot_table_to_parquet
     engine = get_engine()
     ensure_schema(engine, TARGET_SCHEMA)
@@ -119,35 +98,36 @@ def replay(namespace: str | None, table: str | None, since: str | None, snapshot
         print(f"[replay] ========== {ns}/{tb} ==========")
         _wipe_table_folder(csv_root, ns, tb)
 
-        # バッチの時系列列挙
-        batches = _iter_batches(landing_root, ns, tb)
-        if since:
-            # run_date=YYYYMMDD 文字列でフィルタ
-            batches = [b for b in batches if b.parent.name >= f"run_date={since}"]
+        # バッチの時系列列挙（since は run_date=YYYYMMDD の下限）
+        batches = _iter_batches(landing_root, ns, tb, since)
 
         if not batches:
             print(f"[replay] no batches for {ns}/{tb}")
             continue
 
-        total_files = 0
-        for b in batches:
-            run_date = b.parent.name.split("=", 1)[1]
-            total_files += _copy_batch_parts_to_csv_root(b, csv_root, ns, tb, run_date)
-
-        print(f"[replay] copied files: {total_files} for {ns}/{tb}")
+        part_files = _batch_part_files(batches, spec.get("filename_glob", "*.csv"))
+        part_bytes = sum(f.stat().st_size for f in part_files)
+        print(
+            f"[replay] reading {len(part_files)} file(s) in place from {len(batches)} batch(es) "
+            f"for {ns}/{tb} (not copied: {part_bytes / 2**20:.1f}MiB)"
+        )
 
-        # 1回だけ UPSERT（db_ingestion/namespace=<ns>/table=<tb> 配下の全CSVが対象）
+        # 1回だけ UPSERT（landing の parts を直接読む。台帳も作り直し、パスは LANDING_ROOT 相対で記録）
+        started = time.perf_counter()
         upsert_table(
             engine=engine,
             table_name=tb,
             cfg=spec,
-            csv_root=csv_root,
+            csv_root=landing_root,
             chunksize=spec.get("chunksize", 200_000),
             auto_add_columns=True,
+            full=True,
+            src_files=part_files,
         )
+        print(f"[replay] {ns}/{tb} done in {time.perf_counter() - started:.2f}s")
 
         if snapshot:
-            snapshot_table_to_parquet(engine, spec.get("target_table", tb), paths["PARQUET_ROOT"])
+            snapshot_table_to_parquet(engine, spec.get("target_table", tb), paths["PARQUET_ROOT"], spec)
 
 def main():
     ap = argparse.ArgumentParser(description="Replay landing -> db_ingestion -> upsert (chronological).")
@@ -0,0 +1,217 @@
+# ingestion/pipelines/snapshot_delta.py
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from ingestion.utils import get_paths
+
+# PARQUET_ROOT/YYYYMMDD/ のスナップショットの並び（テーブルごと・日ごとに 1 つ）
+#   base  : 全件（<table>.parquet か <table>/）。snapshot.mode: full（既定）は毎回これ
+#   delta : 前回スナップショット以降に入った・変わった行だけ（<table>.delta.parquet か <table>.delta/）
+# それぞれの隣に <table>.snapshot.json（サイドカー）を置き、種類・データ版・差分の起点・キーを記録する。
+# ある日付の状態は「その日以前で最新の base」＋「その後の delta」を load_mode に従って重ねて作る
+#   upsert  : primary_key ごとに新しい方
+#   replace : replace_keys の組ごとに、その組が最後に現れたスナップショットの行だけ
+#   append  : 全部足す
+# 前回からデータ版（ingest_ledger.VERSION_TABLE）も書き方（LAYOUT_KEYS）も変わっていなければ、
+# 書き出さずに前回の base を今日のフォルダへハードリンクする（delta は空になるので書かない）。
+SIDECAR_SUFFIX = ".snapshot.json"
+DELTA_SUFFIX = ".delta"
+_DATE_DIR = re.compile(r"^\d{8}$")
+SNAP_ORD = "__snap_ord"
+# ファイルの中身・並びに効く snapshot: の設定（サイドカーの layout に残し、変わったら書き直す）
+LAYOUT_KEYS = ("partition_by", "order_by", "row_group_size", "compression", "compression_level", "per_thread_output")
+
+
+def snapshot_outputs(date_folder: Path, table: str) -> dict[tuple[str, bool], Path]:
+    """{(kind, ディレクトリか): パス}。同じ日にはこのうち 1 つだけを残す。"""
+    return {
+        ("base", False): date_folder / f"{table}.parquet",
+        ("base", True): date_folder / table,
+        ("delta", False): date_folder / f"{table}{DELTA_SUFFIX}.parquet",
+        ("delta", True): date_folder / f"{table}{DELTA_SUFFIX}",
+    }
+
+
+def write_sidecar(date_folder: Path, table: str, meta: dict) -> None:
+    path = date_folder / f"{table}{SIDECAR_SUFFIX}"
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_entry(date_folder: Path, table: str) -> dict | None:
+    """
+    その日のスナップショットを {date, kind, path, version, ...} で返す。
+    サイドカーの無い旧形式（<table>.parquet / <table>/ だけ）は version 不明の base として扱う。
+    """
+    sidecar = date_folder / f"{table}{SIDECAR_SUFFIX}"
+    if sidecar.exists():
+        try:
+            meta = json.loads(sidecar.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = None
+        if meta and (date_folder / meta.get("path", "")).exists():
+            return {**meta, "date": date_folder.name, "path": date_folder / meta["path"]}
+    for (kind, _), path in snapshot_outputs(date_folder, table).items():
+        if kind == "base" and path.exists():
+            return {"date": date_folder.name, "kind": "base", "path": path, "version": None}
+    return None
+
+
+def list_snapshots(out_root: Path, table: str, until: str | None = None) -> list[dict]:
+    """table のスナップショットを日付順に返す（until を渡すとその日付以前だけ）。"""
+    if not out_root.exists():
+        return []
+    entries = []
+    for date_folder in sorted(p for p in out_root.iterdir() if p.is_dir() and _DATE_DIR.match(p.name)):
+        if until is not None and date_folder.name > until:
+            break
+        entry = _read_entry(date_folder, table)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def snapshot_layout(opts: dict) -> dict:
+    return {key: opts.get(key) for key in LAYOUT_KEYS}
+
+
+def unchanged_snapshot(out_root: Path, table: str, today: str, state: dict | None, layout: dict) -> dict | None:
+    """今日以前で最新のスナップショットが、今のデータ版・系列・書き方と同じならそれを返す。"""
+    if state is None:
+        return None
+    history = list_snapshots(out_root, table, until=today)
+    if not history:
+        return None
+    prev = history[-1]
+    if (prev.get("version"), prev.get("lineage"), prev.get("layout")) != (state["version"], state["lineage"], layout):
+        return None
+    return prev
+
+
+def plan_delta(out_root: Path, table: str, today: str, state: dict | None, full_every: int) -> tuple[int | None, str]:
+    """
+    今日 delta を書けるなら (起点の版, "")、base にすべきなら (None, 理由) を返す。
+    起点は今日より前の最新スナップショットの版。同じ日に撮り直すときも前日までを起点にする。
+    """
+    if state is None or state.get("tracked_from") is None:
+        return None, "load tracking not active"
+    history = [e for e in list_snapshots(out_root, table) if e["date"] < today]
+    if not history:
+        return None, "no previous snapshot"
+    prev = history[-1]
+    if prev.get("version") is None or prev.get("lineage") != state["lineage"]:
+        return None, "previous snapshot is from another warehouse"
+    if prev["version"] > state["version"]:
+        return None, "table version went backwards"
+    if state["tracked_from"] > prev["version"] + 1:
+        return None, "untracked loads since the previous snapshot"
+    base = next((e for e in reversed(history) if e["kind"] == "base"), None)
+    if base is None:
+        return None, "no base snapshot"
+    age = (datetime.strptime(today, "%Y%m%d") - datetime.strptime(base["date"], "%Y%m%d")).days
+    if age >= full_every:
+        return None, f"base is {age} day(s) old (full_every={full_every})"
+    return prev["version"], ""
+
+
+def resolve_chain(out_root: Path, table: str, as_of: str) -> list[dict]:
+    """
+    as_of（YYYYMMDD）の状態を作るのに要るスナップショット（最新の base → delta の順）。
+    途中の delta が欠けている（起点の版が前のスナップショットと合わない）なら ValueError。
+    """
+    return chain_of(list_snapshots(out_root, table, until=as_of), table, as_of, out_root)
+
+
+def chain_of(history: list[dict], table: str, as_of: str, out_root: Path | None = None) -> list[dict]:
+    """list_snapshots の結果から as_of の chain を切り出す（日付範囲で何度も引くとき用。中身は resolve_chain）。"""
+    history = [e for e in history if e["date"] <= as_of]
+    start = next((i for i in range(len(history) - 1, -1, -1) if history[i]["kind"] == "base"), None)
+    if start is None:
+        raise FileNotFoundError(f"[snapshot] no base snapshot of {table} on or before {as_of} under {out_root}")
+    chain = history[start:]
+    for prev, cur in itertools.pairwise(chain):
+        if cur.get("since") != prev.get("version"):
+            raise ValueError(
+                f"[snapshot] {table}: delta {cur['date']} starts at version {cur.get('since')} "
+                f"but {prev['date']} is version {prev.get('version')} (missing snapshot?)"
+            )
+    return chain
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def scan_sql(entry: dict) -> str | None:
+    """スナップショット 1 つを読む read_parquet(...)。中身の無い delta は None。"""
+    path: Path = entry["path"]
+    if not path.is_dir():
+        return f"read_parquet({_sql_literal(str(path))}, union_by_name = true)"
+    if not any(path.rglob("*.parquet")):
+        return None
+    hive = any(child.is_dir() and "=" in child.name for child in path.iterdir())
+    glob = _sql_literal(f"{path}/**/*.parquet")
+    # パーティション値は型を推測させない（TEXT の "007" が 7 にならないように）
+    hive_sql = ", hive_partitioning = true, hive_types_autocast = false" if hive else ""
+    return f"read_parquet({glob}, union_by_name = true{hive_sql})"
+
+
+def as_of_sql(chain: list[dict]) -> str:
+    """resolve_chain の結果から、その時点のテーブルを返す SELECT を作る。"""
+    scans = [(i, sql) for i, e in enumerate(chain) if (sql := scan_sql(e)) is not None]
+    if len(scans) == 1:
+        return f"SELECT * FROM {scans[0][1]}"
+    union = "\nUNION ALL BY NAME\n".join(f"SELECT *, {i} AS {SNAP_ORD} FROM {sql}" for i, sql in scans)
+    latest = chain[-1]
+    load_mode = latest.get("load_mode", "upsert")
+    if load_mode == "append":
+        qualify = ""
+    elif load_mode == "replace":
+        keys = ", ".join(f'"{k}"' for k in latest.get("replace_keys") or [])
+        qualify = f"QUALIFY {SNAP_ORD} = max({SNAP_ORD}) OVER (PARTITION BY {keys})"
+    else:
+        keys = ", ".join(f'"{k}"' for k in latest.get("primary_key") or [])
+        qualify = f"QUALIFY row_number() OVER (PARTITION BY {keys} ORDER BY {SNAP_ORD} DESC) = 1"
+    return f"SELECT * EXCLUDE ({SNAP_ORD}) FROM (\n{union}\n) {qualify}"
+
+
+def read_as_of(out_root: Path, table: str, as_of: str, conn: duckdb.DuckDBPyConnection | None = None):
+    """as_of 時点の table を DuckDB のリレーションで返す（conn 未指定ならインメモリ接続）。"""
+    conn = conn or duckdb.connect()
+    return conn.sql(as_of_sql(resolve_chain(out_root, table, as_of)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rebuild a table as of a date from base + delta Parquet snapshots")
+    ap.add_argument("--table", required=True)
+    ap.add_argument("--as-of", required=True, help="YYYYMMDD")
+    ap.add_argument("--root", help="snapshot root (default: PARQUET_ROOT)")
+    ap.add_argument("--out", help="write the rebuilt table to this Parquet file")
+    args = ap.parse_args()
+
+    out_root = Path(args.root) if args.root else get_paths()["PARQUET_ROOT"]
+    chain = resolve_chain(out_root, args.table, args.as_of)
+    for e in chain:
+        since = f", since={e['since']}" if e["kind"] == "delta" else ""
+        print(f"[snapshot] {e['date']} {e['kind']} version={e.get('version')}{since} rows={e.get('rows')} ({e['path']})")
+    conn = duckdb.connect()
+    rel = conn.sql(as_of_sql(chain))
+    if args.out:
+        conn.execute(f"COPY ({rel.sql_query()}) TO {_sql_literal(args.out)} (FORMAT PARQUET)")
+        print(f"[snapshot] Wrote {args.out}")
+    [(rows,)] = conn.sql(f"SELECT count(*) FROM ({rel.sql_query()})").fetchall()
+    print(f"[snapshot] {args.table} as of {args.as_of}: rows={rows}")
+
+
+if __name__ == "__main__":
+    main()
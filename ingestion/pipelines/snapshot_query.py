@@ -0,0 +1,153 @@
+# ingestion/pipelines/snapshot_query.py
+from __future__ import annotations
+
+import re
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from ingestion.pipelines.snapshot_delta import DELTA_SUFFIX, SIDECAR_SUFFIX, as_of_sql, chain_of, list_snapshots
+
+# PARQUET_ROOT/YYYYMMDD/ のスナップショットを、DB に戻さずそのまま DuckDB のビューとして引く（タイムトラベル）
+#   as_of       : ビュー <table> = その日付時点のテーブル（その日以前で最新の base ＋ その後の delta）
+#   start / end : ビュー <table> = 範囲内の各スナップショット日の状態を縦に積んだもの（列 SNAPSHOT_DATE_COL 付き）
+# 読むファイルは日付フォルダ名で先に絞る（範囲外・chain に要らない日は開かない）。
+# ビューは read_parquet の上の SELECT なので、WHERE は Parquet の統計・hive パーティションで読み飛ばしに使われる。
+SNAPSHOT_DATE_COL = "snapshot_date"
+_DATE_DIR = re.compile(r"^\d{8}$")
+_VIEW_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_date(value: str, what: str) -> str:
+    try:
+        datetime.strptime(value, "%Y%m%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"[query] {what} must be YYYYMMDD: {value!r}") from None
+    return value
+
+
+def snapshot_dates(out_root: Path, start: str | None = None, end: str | None = None) -> list[str]:
+    """スナップショットのある日付フォルダ（YYYYMMDD）を昇順で返す（start / end は両端を含む）。"""
+    if not out_root.exists():
+        return []
+    return sorted(
+        p.name for p in out_root.iterdir()
+        if p.is_dir() and _DATE_DIR.match(p.name)
+        and (start is None or p.name >= start) and (end is None or p.name <= end)
+    )
+
+
+def snapshot_tables(out_root: Path, dates: list[str] | None = None) -> list[str]:
+    """日付フォルダに現れるテーブル名（<table>.parquet / <table>/ / <table>.delta* / サイドカー）。"""
+    tables = set()
+    for date in dates if dates is not None else snapshot_dates(out_root):
+        for child in (out_root / date).iterdir():
+            name = child.name
+            if name.startswith("."):
+                continue
+            if name.endswith(SIDECAR_SUFFIX):
+                name = name.removesuffix(SIDECAR_SUFFIX)
+            elif child.is_dir():
+                pass
+            elif name.endswith(".parquet"):
+                name = name.removesuffix(".parquet")
+            else:
+                continue
+            tables.add(name.removesuffix(DELTA_SUFFIX))
+    return sorted(tables)
+
+
+def _date_literal(date: str) -> str:
+    return f"DATE '{date[:4]}-{date[4:6]}-{date[6:]}'"
+
+
+def history_sql(out_root: Path, table: str, dates: list[str]) -> str | None:
+    """
+    dates の各日の状態を SNAPSHOT_DATE_COL 付きで UNION ALL BY NAME した SELECT（どの日にも無ければ None）。
+    同じ chain で作れる日（ハードリンク・差分なしで版が進んでいない日）はまとめて 1 回だけ読む。
+    """
+    history = list_snapshots(out_root, table, until=dates[-1]) if dates else []
+    groups: dict[tuple, tuple[list[dict], list[str]]] = {}
+    for date in dates:
+        try:
+            chain = chain_of(history, table, date, out_root)
+        except FileNotFoundError:
+            continue  # この日にはまだ base が無い
+        key = tuple(str(e["path"]) for e in chain)
+        groups.setdefault(key, (chain, []))[1].append(date)
+    if not groups:
+        return None
+    parts = []
+    for chain, group_dates in groups.values():
+        state = as_of_sql(chain)
+        if len(group_dates) == 1:
+            parts.append(f"SELECT *, {_date_literal(group_dates[0])} AS {SNAPSHOT_DATE_COL} FROM ({state})")
+        else:
+            values = ", ".join(f"({_date_literal(d)})" for d in group_dates)
+            parts.append(f"SELECT s.*, d.{SNAPSHOT_DATE_COL} FROM ({state}) s, (VALUES {values}) d({SNAPSHOT_DATE_COL})")
+    return "\nUNION ALL BY NAME\n".join(parts)
+
+
+def create_snapshot_views(
+    conn: duckdb.DuckDBPyConnection,
+    out_root: Path,
+    as_of: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    tables: list[str] | None = None,
+) -> dict[str, list[str]]:
+    """
+    conn にテーブルごとのビューを作る。start / end のどちらかを渡すと範囲（履歴）、そうでなければ as_of 時点
+    （as_of も無ければ最新のスナップショット日）。その時点・範囲にスナップショットが無いテーブルは作らない
+    （日付フォルダが 1 つも無ければ何も作らず {} を返す）。
+    戻り値: {ビュー名: 読む日付フォルダ}
+    """
+    ranged = start is not None or end is not None
+    if ranged and as_of is not None:
+        raise ValueError("[query] as_of and start/end are exclusive")
+    for value, what in ((as_of, "as_of"), (start, "start"), (end, "end")):
+        if value is not None:
+            _check_date(value, what)
+    dates = snapshot_dates(out_root, start, end) if ranged else snapshot_dates(out_root, end=as_of)
+    if not dates:
+        return {}
+    as_of = as_of or dates[-1]
+    names = tables or snapshot_tables(out_root, dates)
+
+    views = {}
+    for table in names:
+        if not _VIEW_NAME.match(table):
+            print(f"[query] skip {table}: not usable as a view name")
+            continue
+        if ranged:
+            sql = history_sql(out_root, table, dates)
+            if sql is None:
+                continue
+            used = dates
+        else:
+            try:
+                chain = chain_of(list_snapshots(out_root, table, until=as_of), table, as_of, out_root)
+            except FileNotFoundError:
+                continue
+            sql = as_of_sql(chain)
+            used = [e["date"] for e in chain]
+        conn.execute(f'CREATE OR REPLACE VIEW "{table}" AS {sql}')
+        views[table] = used
+    return views
+
+
+def connect_snapshots(
+    out_root: Path,
+    as_of: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    tables: list[str] | None = None,
+) -> duckdb.DuckDBPyConnection:
+    """
+    スナップショットのビューを張ったインメモリ DuckDB 接続を返す。
+    例: connect_snapshots(PARQUET_ROOT, as_of="20251006").sql("SELECT count(*) FROM movies")
+    """
+    conn = duckdb.connect()
+    create_snapshot_views(conn, out_root, as_of, start, end, tables)
+    return conn
@@ -2,64 +2,370 @@ from __future__ import annotations
 
 import argparse
 import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from ingestion.utils import get_paths
+from ingestion.utils import COMPRESSED_CSV_SUFFIXES, get_paths, glob_csv_parts
+from ingestion.pipelines.content_hash import READ_CHUNK, hash_file, manifest_hash, new_hasher
+from ingestion.pipelines.landing_catalog import list_batches, mark_validated
+from ingestion.pipelines.landing_parquet import dedupe_header
 
+# --deep で reject_errors から表示する不正行の数（ファイルごと）
+_DEEP_REJECT_SAMPLES = 3
 
-def validate_landing(landing_root: Path) -> int:
+
+def _find_part(batch: Path, rel: str) -> Path | None:
+    """manifest の path（parts/<name>）に対応するパーツ。clean_landing が圧縮していれば .gz / .zst。"""
+    candidates = [batch / rel] + [batch / f"{rel}{suffix}" for suffix in COMPRESSED_CSV_SUFFIXES]
+    return next((p for p in candidates if p.exists()), None)
+
+
+def _verify_hashes(batch: Path, meta: dict) -> int:
     """
-    landing 下の batch ディレクトリをざっと検査。
-    返り値: 問題数
+    manifest の各ファイルを読み直し、記録されたハッシュ（hash_algo。旧形式は md5）と照合する。
+    clean_landing が圧縮したパーツは展開しながら圧縮前の内容で照合する。返り値: 問題数
     """
     problems = 0
-    for batch in landing_root.rglob("batch_id=*"):
-        if not batch.is_dir():
-            continue
-        manifest = batch / "manifest.json"
-        parts = batch / "parts"
-        if not manifest.exists():
-            print(f"[validate][NG] manifest missing: {manifest}")
+    for fm in meta.get("files", []):
+        rel = fm.get("path", "")
+        part = _find_part(batch, rel)
+        if part is None:
+            print(f"[validate][NG] part missing: {batch / rel}")
             problems += 1
             continue
-        if not parts.exists():
-            print(f"[validate][NG] parts folder missing: {parts}")
+        expected = manifest_hash(meta, fm)
+        if expected is None:
+            print(f"[validate][NG] no content hash in manifest: {part}")
             problems += 1
             continue
-
+        algo, digest = expected
         try:
-            meta = json.loads(manifest.read_text(encoding="utf-8"))
-        except Exception as e:
-            print(f"[validate][NG] manifest broken: {manifest} ({e})")
+            actual = hash_file(part, algo)
+        except RuntimeError as e:
+            print(f"[validate][NG] cannot verify {part}: {e}")
             problems += 1
             continue
+        if actual != digest:
+            print(f"[validate][NG] {algo} mismatch: {part} (manifest={digest}, actual={actual})")
+            problems += 1
+    return problems
+
 
-        # 最小チェック：必須キー
-        for key in ["namespace", "table", "run_date", "batch_id", "files"]:
-            if key not in meta:
-                print(f"[validate][NG] manifest key missing: {manifest} ({key})")
-                problems += 1
+def _check_batch(batch: Path, verify_hash: bool) -> tuple[int, dict | None, int]:
+    """validate_batch の本体（OK 表示なし）。戻り値: (問題数, manifest, パーツ数)"""
+    if not batch.is_dir():
+        print(f"[validate][NG] cataloged batch missing: {batch} (run rebuild-catalog if it was removed by hand)")
+        return 1, None, 0
+    manifest = batch / "manifest.json"
+    parts = batch / "parts"
+    if not manifest.exists():
+        print(f"[validate][NG] manifest missing: {manifest}")
+        return 1, None, 0
+    if not parts.exists():
+        print(f"[validate][NG] parts folder missing: {parts}")
+        return 1, None, 0
 
-        # parts/*.csv があるか
-        csvs = list(parts.glob("*.csv")) + list(parts.glob("*.csv.gz"))
-        if not csvs:
-            print(f"[validate][NG] no csv files: {parts}")
+    try:
+        meta = json.loads(manifest.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[validate][NG] manifest broken: {manifest} ({e})")
+        return 1, None, 0
+
+    problems = 0
+    # 最小チェック：必須キー
+    for key in ["namespace", "table", "run_date", "batch_id", "files"]:
+        if key not in meta:
+            print(f"[validate][NG] manifest key missing: {manifest} ({key})")
             problems += 1
 
-        print(f"[validate][OK] {batch} (files={len(csvs)})")
+    # parts/*.csv（圧縮版 .csv.gz / .csv.zst を含む）があるか
+    csvs = glob_csv_parts(parts)
+    if not csvs:
+        print(f"[validate][NG] no csv files: {parts}")
+        problems += 1
 
+    if verify_hash:
+        problems += _verify_hashes(batch, meta)
+
+    return problems, meta, len(csvs)
+
+
+def validate_batch(batch: Path, verify_hash: bool = False) -> int:
+    """
+    1 バッチをざっと検査。verify_hash なら manifest のハッシュとも照合する。
+    返り値: 問題数
+    """
+    problems, _, n_files = _check_batch(batch, verify_hash)
+    if not problems:
+        print(f"[validate][OK] {batch} (files={n_files})")
     return problems
 
 
+# ---------------------------
+# --deep: パーツ単位の内容検査（プロセスプールで並列）
+# ---------------------------
+def _scan_bytes(part: Path, algo: str | None, quote_aware: bool) -> tuple[str | None, int, int]:
+    """
+    パーツを展開しながら 1 回だけ読み、(ハッシュ, 圧縮前のバイト数, データ行数) を返す。
+    行数は land_import と同じ数え方（改行数 + 末尾の改行無し行 - ヘッダ 1 行）。
+    """
+    from ingestion.pipelines.csv_to_db import _open_part
+    from ingestion.pipelines.land_import import _count_newlines
+
+    h = new_hasher(algo) if algo else None
+    size, newlines, in_quote, last = 0, 0, False, b""
+    with _open_part(part) as f:
+        while chunk := f.read(READ_CHUNK):
+            if h is not None:
+                h.update(chunk)
+            size += len(chunk)
+            n, in_quote = _count_newlines(chunk, quote_aware, in_quote)
+            newlines += n
+            last = chunk[-1:]
+    lines = newlines + (1 if last and last != b"\n" else 0)
+    return (h.hexdigest() if h is not None else None), size, max(0, lines - 1)
+
+
+def _scan_records(part: Path, pk_cols: list[str], rowskip: int, encoding: str, threads: int) -> list[str]:
+    """
+    DuckDB でパーツを 1 回スキャンし、ヘッダと列数の合わない行・主キーが空の行を数える。
+    read_csv が扱えないエンコーディングは pyarrow のトランスコードストリームを渡す（列数違いは例外で検出）。
+    返り値: 問題メッセージ
+    """
+    import duckdb
+    from ingestion.pipelines.csv_to_db import (
+        _DUCKDB_CSV_ENCODINGS, _codec_name, _open_arrow_csv, _read_header_raw, _sql_literal,
+    )
+
+    hdr = _read_header_raw(part, encoding=encoding, rowskip=rowskip)
+    if not hdr:
+        return [f"empty header: {part}"]
+    norm_cols = dedupe_header(hdr)
+
+    problems = [f"primary key column '{pk}' missing in header: {part}" for pk in pk_cols if pk not in norm_cols]
+    pk_present = [pk for pk in pk_cols if pk in norm_cols]
+    pk_null = " OR ".join(f'"{pk}" IS NULL OR "{pk}" = \'\'' for pk in pk_present) or "false"
+
+    duck_encoding = _DUCKDB_CSV_ENCODINGS.get(_codec_name(encoding))
+    conn = duckdb.connect()
+    try:
+        conn.execute(f"SET threads = {max(1, threads)}")
+        if duck_encoding is None:
+            source = "part_stream"
+        else:
+            columns = "{" + ", ".join(f"{_sql_literal(c)}: 'VARCHAR'" for c in norm_cols) + "}"
+            source = f"""read_csv(
+                {_sql_literal(str(part))},
+                auto_detect = false,
+                header = false,
+                skip = {rowskip + 1},
+                columns = {columns},
+                encoding = {_sql_literal(duck_encoding)},
+                delim = ',',
+                quote = '"',
+                escape = '"',
+                store_rejects = true
+            )"""
+        try:
+            if duck_encoding is None:
+                # pyarrow は開いた時点で先頭ブロックを読むので、列数違いはここから出ることもある
+                conn.register("part_stream", _open_arrow_csv(part, norm_cols, rowskip, encoding))
+            # fetchall で結果を読み切る（reject_errors はクエリ完了時に書かれる）
+            [(pk_null_rows,)] = conn.execute(f"SELECT count(*) FILTER (WHERE {pk_null}) FROM {source}").fetchall()
+        except Exception as e:
+            return problems + [f"csv parse failed: {part} ({str(e).splitlines()[0]})"]
+
+        if duck_encoding is not None:
+            try:
+                # 1 行で列が余ると余った列ごとに記録されるので、行単位にまとめる
+                rejects = conn.execute(
+                    "SELECT line, max(error_message) FROM reject_errors GROUP BY line ORDER BY line"
+                ).fetchall()
+            except duckdb.CatalogException:
+                rejects = []  # 不正行が無ければ reject_errors 自体が作られない
+            if rejects:
+                sample = "; ".join(f"line {line}: {msg}" for line, msg in rejects[:_DEEP_REJECT_SAMPLES])
+                problems.append(f"{len(rejects)} malformed row(s) (expected {len(norm_cols)} columns): {part} ({sample})")
+        if pk_null_rows:
+            problems.append(f"{pk_null_rows} row(s) with empty primary key ({', '.join(pk_present)}): {part}")
+    finally:
+        conn.close()
+    return problems
+
+
+def _deep_check_part(
+    part: Path,
+    file_meta: dict,
+    expected_hash: tuple[str, str] | None,
+    quote_aware: bool,
+    pk_cols: list[str] | None,
+    rowskip: int,
+    encoding: str,
+    threads: int,
+) -> list[str]:
+    """
+    1 パーツの内容検査（ワーカープロセスで実行）。manifest の size / ハッシュ / rows と照合し、
+    tables.yml に設定があれば列数と主キーの空も見る。返り値: 問題メッセージ
+    """
+    from ingestion.pipelines.land_import import _newline_is_byte
+
+    problems: list[str] = []
+    algo = expected_hash[0] if expected_hash else None
+    try:
+        digest, size, rows = _scan_bytes(part, algo, quote_aware)
+    except RuntimeError as e:
+        return [f"cannot verify {part}: {e}"]
+    except OSError as e:
+        return [f"cannot read {part}: {e}"]
+
+    if expected_hash is None:
+        problems.append(f"no content hash in manifest: {part}")
+    elif digest != expected_hash[1]:
+        problems.append(f"{algo} mismatch: {part} (manifest={expected_hash[1]}, actual={digest})")
+    if file_meta.get("size") is not None and size != int(file_meta["size"]):
+        problems.append(f"size mismatch: {part} (manifest={file_meta['size']}, actual={size})")
+    # UTF-16/32 の rows は land_import がデコードして数えているので、バイト単位の数え直しとは比べない
+    if file_meta.get("rows") is not None and _newline_is_byte(encoding) and rows != int(file_meta["rows"]):
+        problems.append(f"row count mismatch: {part} (manifest={file_meta['rows']}, actual={rows})")
+
+    if pk_cols is not None:
+        problems += _scan_records(part, pk_cols, rowskip, encoding, threads)
+    return problems
+
+
+def _deep_workers(workers: int | None, n_tasks: int) -> int:
+    workers = workers or int(os.getenv("VALIDATE_WORKERS", "0")) or (os.cpu_count() or 1)
+    return max(1, min(workers, n_tasks))
+
+
+def _validate_deep(batches: list[Path], workers: int | None) -> dict[Path, int]:
+    """
+    各バッチの軽検査に通ったものについて、全パーツの内容検査をプロセスプールで並列に行う。
+    返り値: {バッチ: 問題数}
+    """
+    from ingestion.pipelines.csv_to_db import _landing_encoding, _rowskip, find_table_spec, load_config
+
+    tables_cfg = load_config()["tables"]
+    result: dict[Path, int] = {}
+    n_files: dict[Path, int] = {}
+    tasks: list[tuple[Path, tuple]] = []
+    for batch in batches:
+        problems, meta, n_files[batch] = _check_batch(batch, verify_hash=False)
+        result[batch] = problems
+        if problems:
+            continue
+        spec = find_table_spec(tables_cfg, meta["namespace"], meta["table"])
+        if spec is None:
+            print(f"[validate] {meta['namespace']}.{meta['table']} is not in tables.yml; "
+                  f"column / primary key checks skipped: {batch}")
+        encoding = _landing_encoding(spec, meta.get("encoding"))
+        pk_cols = list(spec.get("primary_key") or []) if spec is not None else None
+        rowskip = _rowskip(spec) if spec is not None else 0
+
+        listed: set[str] = set()
+        for fm in meta.get("files", []):
+            rel = fm.get("path", "")
+            listed.update(f"{rel}{s}" for s in ("", *COMPRESSED_CSV_SUFFIXES))
+            part = _find_part(batch, rel)
+            if part is None:
+                print(f"[validate][NG] part missing: {batch / rel}")
+                result[batch] += 1
+                continue
+            args = (part, fm, manifest_hash(meta, fm), bool(meta.get("quote_aware_rows")), pk_cols, rowskip, encoding)
+            tasks.append((batch, args))
+        for part in glob_csv_parts(batch / "parts"):
+            if part.relative_to(batch).as_posix() not in listed:
+                print(f"[validate][NG] part not in manifest: {part}")
+                result[batch] += 1
+
+    if tasks:
+        workers = _deep_workers(workers, len(tasks))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"[validate] deep check: {len(tasks)} part(s) with {workers} worker(s)")
+        # DuckDB / pyarrow のスレッドを抱えた親を fork しないよう spawn を使う
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = [(batch, pool.submit(_deep_check_part, *args, threads)) for batch, args in tasks]
+            for batch, fut in futures:
+                try:
+                    messages = fut.result()
+                except Exception as e:
+                    messages = [f"deep check failed in {batch}: {e}"]
+                for msg in messages:
+                    print(f"[validate][NG] {msg}")
+                    result[batch] += 1
+
+    for batch, problems in result.items():
+        if not problems:
+            print(f"[validate][OK] {batch} (files={n_files[batch]}, deep)")
+    return result
+
+
+def validate_landing(
+    landing_root: Path,
+    verify_hash: bool = False,
+    namespace: str | None = None,
+    table: str | None = None,
+    unvalidated_only: bool = False,
+    batches: list[Path] | None = None,
+    deep: bool = False,
+    workers: int | None = None,
+) -> int:
+    """
+    landing のカタログに載っている batch を検査する。
+    対象は batches（明示）→ namespace / table / unvalidated_only で絞ったカタログの順に決める。
+    deep なら各パーツの size / ハッシュ / 行数 / 列数 / 主キーの空まで見る（workers プロセスで並列）。
+    問題の無かったバッチには .validated マーカーを置くので、unvalidated_only で次回から飛ばせる
+    （deep のときは deep 検査済みのものだけを飛ばす）。
+    返り値: 問題数
+    """
+    if batches is None:
+        entries = list_batches(landing_root, namespace, table, unvalidated_only=unvalidated_only, deep=deep)
+        batches = [e["dir"] for e in entries]
+    if not batches:
+        print("[validate] nothing to validate")
+        return 0
+
+    if deep:
+        per_batch = _validate_deep(batches, workers)
+    else:
+        per_batch = {batch: validate_batch(batch, verify_hash) for batch in batches}
+
+    checks = {"verify_hash": verify_hash or deep, "deep": deep}
+    for batch, n in per_batch.items():
+        if not n:
+            mark_validated(landing_root, batch, checks)
+    return sum(per_batch.values())
+
+
 def main():
     ap = argparse.ArgumentParser(description="Validate landing batches")
     ap.add_argument("--landing", help="landing root (default: PATHS)", default=None)
+    ap.add_argument("--verify-hash", action="store_true",
+                    help="re-read every part and compare with the manifest hash (md5 / xxh3_128 / blake2b ...)")
+    ap.add_argument("--deep", action="store_true",
+                    help="verify size / hash / rows from the manifest and scan columns and primary keys with DuckDB")
+    ap.add_argument("--workers", type=int, help="processes for --deep (default: VALIDATE_WORKERS or CPU count)")
+    ap.add_argument("--namespace", help="only batches of this namespace")
+    ap.add_argument("--table", help="only batches of this table")
+    ap.add_argument("--unvalidated-only", action="store_true",
+                    help="skip batches that already passed validation (.validated marker)")
     args = ap.parse_args()
 
     paths = get_paths()
     landing_root = Path(args.landing) if args.landing else paths["LANDING_ROOT"]
 
-    problems = validate_landing(landing_root)
+    problems = validate_landing(
+        landing_root,
+        verify_hash=args.verify_hash,
+        namespace=args.namespace,
+        table=args.table,
+        unvalidated_only=args.unvalidated_only,
+        deep=args.deep,
+        workers=args.workers,
+    )
     if problems:
         print(f"[validate] problems={problems}")
     else:
@@ -67,4 +373,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
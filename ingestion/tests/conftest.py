@@ -0,0 +1,49 @@
+# ingestion/tests/conftest.py
+from __future__ import annotations
+
+import pytest
+
+import ingestion.pipelines.csv_to_db as csv_to_db
+import ingestion.utils as utils
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """DATA_DIR を tmp_path に向け、warehouse.duckdb とスキーマキャッシュをテストごとに作り直す。"""
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    for name in ("DUCKDB_PATH", "CSV_ROOT", "PARQUET_ROOT", "ARCHIVE_ROOT", "LANDING_ROOT"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(utils, "_SCHEMA_CACHE", None)
+    return tmp_path
+
+
+SJIS_TABLES_YML = """
+defaults:
+  encoding: utf-8
+  skiprows: 0
+tables:
+  sjis:
+    folder: namespace=ns/table=sjis
+    primary_key: ["id"]
+    encoding: cp932
+"""
+
+
+@pytest.fixture
+def drop(data_dir, monkeypatch):
+    """cp932 のテーブル設定（tables.yml）と、手動ドロップ用の CSV（cp932）を用意する。"""
+    cfg = data_dir / "tables.yml"
+    cfg.write_text(SJIS_TABLES_YML, encoding="utf-8")
+    monkeypatch.setattr(csv_to_db, "CFG_PATH", cfg)
+    src = data_dir / "manual_drop"
+    src.mkdir()
+    (src / "a.csv").write_bytes("id,名前\n1,テスト\n2,表示\n".encode("cp932"))
+    return src
+
+
+@pytest.fixture
+def sjis_batches(data_dir):
+    """sjis テーブルの landing バッチ（run_date=20260101）を返す関数。"""
+    def _batches():
+        return sorted((utils.get_paths()["LANDING_ROOT"] / "namespace=ns" / "table=sjis" / "run_date=20260101").iterdir())
+    return _batches
@@ -0,0 +1,122 @@
+# ingestion/tests/test_ingest_ledger.py
+from __future__ import annotations
+
+import hashlib
+import json
+
+import pytest
+from sqlalchemy import text
+
+import ingestion.pipelines.ingest_ledger as ingest_ledger
+from ingestion.utils import ensure_schema, get_engine, get_paths, glob_csv_parts
+from ingestion.pipelines.csv_to_db import TARGET_SCHEMA, upsert_table
+from ingestion.pipelines.ingest_ledger import pending_files, read_ledger
+
+FOLDER = "namespace=ns/table=movies"
+CFG = {"folder": FOLDER, "primary_key": ["movieId"], "encoding": "utf-8", "skiprows": 0}
+
+
+@pytest.fixture
+def engine(data_dir):
+    engine = get_engine()
+    ensure_schema(engine, TARGET_SCHEMA)
+    return engine
+
+
+def _promote(batch_id: str, content: str, names: tuple[str, ...] = ("movies.csv",)) -> None:
+    """land_import → promote と同じ形で、landing のバッチ（manifest 付き）とプロモート済みファイルを置く。"""
+    paths = get_paths()
+    body = content.encode("utf-8")
+    batch = paths["LANDING_ROOT"] / FOLDER / "run_date=20260101" / f"batch_id={batch_id}"
+    (batch / "parts").mkdir(parents=True)
+    dest = paths["CSV_ROOT"] / FOLDER
+    dest.mkdir(parents=True, exist_ok=True)
+    files = []
+    for name in names:
+        (batch / "parts" / name).write_bytes(body)
+        (dest / f"movies_20260101_batch_id={batch_id}_{name}").write_bytes(body)
+        files.append({"path": f"parts/{name}", "md5": hashlib.md5(body).hexdigest(), "size": len(body)})
+    (batch / "manifest.json").write_text(json.dumps({"files": files}), encoding="utf-8")
+
+
+def _ingest(engine) -> None:
+    upsert_table(engine, "movies", CFG, get_paths()["CSV_ROOT"], 200_000, False)
+
+
+def _title(engine) -> str:
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT title FROM "{TARGET_SCHEMA}"."movies" WHERE "movieId" = \'1\'')).scalar()
+
+
+def test_feed_returning_to_earlier_content_wins(engine):
+    # A → B → A: 3 回目は 1 回目と同じ内容だが別バッチなので読み、後勝ちで A に戻る
+    for batch_id, title in [
+        ("20260101T000000Z_aaaaaaaa", "Original"),
+        ("20260102T000000Z_bbbbbbbb", "Changed"),
+        ("20260103T000000Z_cccccccc", "Original"),
+    ]:
+        _promote(batch_id, f"movieId,title\n1,{title}\n")
+        _ingest(engine)
+        assert _title(engine) == title
+
+
+def test_replayed_part_is_not_reloaded_from_promoted_copy(engine, capsys):
+    _promote("20260101T000000Z_aaaaaaaa", "movieId,title\n1,Original\n")
+    # replay は landing のパーツを直接読む（台帳のパスは landing 側）
+    landing_root = get_paths()["LANDING_ROOT"]
+    parts = sorted(landing_root.rglob("parts/*.csv"))
+    upsert_table(engine, "movies", CFG, landing_root, 200_000, False, src_files=parts)
+    # 同じパーツのプロモート済みコピーは、パスが違っても読み直さない
+    _ingest(engine)
+    assert "No new files to load" in capsys.readouterr().out
+
+
+def test_dropped_table_is_reloaded(engine):
+    _promote("20260101T000000Z_aaaaaaaa", "movieId,title\n1,Original\n")
+    _ingest(engine)
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE "{TARGET_SCHEMA}"."movies"'))
+    # 台帳・スキーマキャッシュが残っていても、テーブルが無ければ全ファイルを読み直して作り直す
+    _ingest(engine)
+    assert _title(engine) == "Original"
+    with engine.connect() as conn:
+        version = conn.execute(
+            text(f"SELECT version FROM \"{TARGET_SCHEMA}\"._table_versions WHERE table_name = 'movies'")
+        ).scalar()
+    assert version == 1
+
+
+def test_incremental_run_reads_only_new_manifests(engine, monkeypatch):
+    _promote("20260101T000000Z_aaaaaaaa", "movieId,title\n1,Original\n")
+    _ingest(engine)
+    _promote("20260102T000000Z_bbbbbbbb", "movieId,title\n1,Changed\n", names=("p1.csv", "p2.csv", "p3.csv"))
+
+    reads = []
+
+    def counting_loads(text_):
+        reads.append(text_)
+        return json.loads(text_)
+
+    monkeypatch.setattr(ingest_ledger, "json", type("J", (), {"loads": staticmethod(counting_loads)}))
+    csv_root = get_paths()["CSV_ROOT"]
+    files = glob_csv_parts(csv_root / FOLDER)
+    pending, _ = pending_files(files, csv_root, FOLDER, read_ledger(engine, TARGET_SCHEMA, "movies"))
+    # 取り込み済みのバッチは stat だけで飛ばし、新しいバッチの manifest は 3 パーツで 1 回だけ読む
+    assert len(pending) == 3
+    assert len(reads) == 1
+
+
+def test_append_skips_repromoted_batch_from_ledger(engine, capsys):
+    cfg = {"folder": FOLDER, "primary_key": [], "load_mode": "append", "encoding": "utf-8", "skiprows": 0}
+    csv_root = get_paths()["CSV_ROOT"]
+    _promote("20260101T000000Z_aaaaaaaa", "movieId,title\n1,Original\n")
+    upsert_table(engine, "movies", cfg, csv_root, 200_000, False)
+    # 同じバッチを別の run_date で再プロモート（パスも中身も違うので台帳のパス・md5 では弾けない）
+    (csv_root / FOLDER / "movies_20260102_batch_id=20260101T000000Z_aaaaaaaa_movies.csv").write_text(
+        "movieId,title\n1,Original\n2,Extra\n", encoding="utf-8"
+    )
+    capsys.readouterr()
+    upsert_table(engine, "movies", cfg, csv_root, 200_000, False)
+    assert "Skipping batch(es) already appended: 20260101T000000Z_aaaaaaaa" in capsys.readouterr().out
+    with engine.connect() as conn:
+        assert conn.execute(text(f'SELECT count(*) FROM "{TARGET_SCHEMA}"."movies"')).scalar() == 1
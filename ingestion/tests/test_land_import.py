@@ -0,0 +1,48 @@
+# ingestion/tests/test_land_import.py
+from __future__ import annotations
+
+import pyarrow.parquet as pq
+import pytest
+
+import ingestion.pipelines.land_import as land_import
+from ingestion.utils import get_paths
+
+
+def _import(src, **kwargs):
+    land_import.import_manual(
+        src=src, namespace="ns", table="sjis", run_date="20260101", encoding="utf-8", pattern="*.csv",
+        move=True, dry_run=False, make_latest_symlink=False, parquet=True, **kwargs,
+    )
+
+
+def test_parquet_copy_uses_table_encoding(drop, sjis_batches):
+    # --encoding（既定 utf-8）ではなく tables.yml の encoding: cp932 でヘッダ・値を読む
+    _import(drop)
+    [batch] = sjis_batches()
+    table = pq.read_table(batch / "parquet" / "a.csv.parquet")
+    assert table.column_names[:2] == ["id", "名前"]
+    assert table.column("名前").to_pylist() == ["テスト", "表示"]
+    assert not (drop / "a.csv").exists()
+
+
+def test_failed_parquet_copy_is_not_fatal(drop, sjis_batches, monkeypatch):
+    def broken(*args, **kwargs):
+        raise UnicodeDecodeError("utf-8", b"\x82", 0, 1, "invalid start byte")
+
+    monkeypatch.setattr(land_import, "write_parquet_copy", broken)
+    _import(drop)
+    [batch] = sjis_batches()
+    assert (batch / "parts" / "a.csv").exists()
+    assert not (batch / "parquet" / "a.csv.parquet").exists()
+
+
+def test_failed_import_restores_moved_sources(drop, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(land_import, "_scan_file", broken)
+    with pytest.raises(OSError):
+        _import(drop)
+    # 一時バッチを残さず、move したファイルは元の場所へ戻す（次の実行がそのままやり直せる）
+    assert (drop / "a.csv").read_bytes() == "id,名前\n1,テスト\n2,表示\n".encode("cp932")
+    assert not (get_paths()["LANDING_ROOT"] / "namespace=ns" / "table=sjis" / "run_date=20260101").exists()
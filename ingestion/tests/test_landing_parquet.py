@@ -0,0 +1,38 @@
+# ingestion/tests/test_landing_parquet.py
+from __future__ import annotations
+
+import pyarrow.parquet as pq
+
+import ingestion.pipelines.landing_parquet as landing_parquet
+from ingestion.pipelines.land_import import import_manual
+from ingestion.utils import get_paths
+
+
+def _import_without_copy(src):
+    # ingest_flow と同じく --encoding 既定（utf-8）で取り込む。manifest の encoding は utf-8 になる
+    import_manual(
+        src=src, namespace="ns", table="sjis", run_date="20260101", encoding="utf-8", pattern="*.csv",
+        move=True, dry_run=False, make_latest_symlink=False, parquet=False,
+    )
+
+
+def test_backfill_uses_table_encoding(drop, sjis_batches):
+    _import_without_copy(drop)
+    assert landing_parquet.build_parquet_copies(get_paths()["LANDING_ROOT"]) == 1
+    [batch] = sjis_batches()
+    table = pq.read_table(batch / "parquet" / "a.csv.parquet")
+    assert table.column("名前").to_pylist() == ["テスト", "表示"]
+
+
+def test_backfill_skips_parts_it_cannot_copy(drop, sjis_batches, monkeypatch):
+    _import_without_copy(drop)
+
+    def broken(csv_path, out_path, encoding, rowskip):
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(b"partial")
+        raise UnicodeDecodeError("utf-8", b"\x96", 0, 1, "invalid start byte")
+
+    monkeypatch.setattr(landing_parquet, "write_parquet_copy", broken)
+    assert landing_parquet.build_parquet_copies(get_paths()["LANDING_ROOT"]) == 0
+    [batch] = sjis_batches()
+    assert list((batch / "parquet").iterdir()) == []
@@ -0,0 +1,25 @@
+# ingestion/tests/test_snapshot_query.py
+from __future__ import annotations
+
+import argparse
+
+import duckdb
+
+import ingestion.pipelines.csv_to_db as csv_to_db
+from ingestion.pipelines.snapshot_query import create_snapshot_views
+from ingestion.utils import get_paths
+
+
+def test_no_snapshot_dates_returns_no_views(data_dir):
+    parquet_root = get_paths()["PARQUET_ROOT"]
+    assert create_snapshot_views(duckdb.connect(), parquet_root) == {}
+    (parquet_root / "20260105").mkdir(parents=True)
+    # as_of より前に日付フォルダが無いのも同じ扱い（例外にしない）
+    assert create_snapshot_views(duckdb.connect(), parquet_root, as_of="20260101") == {}
+
+
+def test_cmd_query_without_snapshots_prints_message(data_dir, monkeypatch, capsys):
+    monkeypatch.setattr(csv_to_db, "PATHS", get_paths())
+    args = argparse.Namespace(as_of="20260101", date_from=None, date_to=None, table=None, sql="SELECT 1", out=None, limit=40)
+    csv_to_db.cmd_query(args)
+    assert "[query] no tables have snapshots for the requested date(s)" in capsys.readouterr().out
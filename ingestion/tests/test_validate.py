@@ -0,0 +1,15 @@
+# ingestion/tests/test_validate.py
+from __future__ import annotations
+
+from ingestion.pipelines.land_import import import_manual
+from ingestion.pipelines.validate import validate_landing
+from ingestion.utils import get_paths
+
+
+def test_deep_validation_uses_table_encoding(drop):
+    # manifest の encoding は --encoding 既定の utf-8。deep 検査は tables.yml の cp932 で読む
+    import_manual(
+        src=drop, namespace="ns", table="sjis", run_date="20260101", encoding="utf-8", pattern="*.csv",
+        move=True, dry_run=False, make_latest_symlink=False, parquet=False,
+    )
+    assert validate_landing(get_paths()["LANDING_ROOT"], deep=True, workers=1) == 0
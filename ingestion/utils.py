@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 import secrets
 from datetime import datetime, timezone
@@ -47,16 +48,32 @@ def landing_batch_dir(root: Path, namespace: str, table: str, run_date: str, bat
     return root / f"namespace={namespace}" / f"table={table}" / f"run_date={run_date}" / f"batch_id={batch_id}"
 
 
+# clean_landing が古いパーツを圧縮したときの拡張子。各ステージは展開コピーを作らずそのまま読む
+COMPRESSED_CSV_SUFFIXES = (".gz", ".zst")
+
+
+def glob_csv_parts(folder: Path, pattern: str = "*.csv") -> list[Path]:
+    """pattern に一致するファイルをパス順で返す。*.csv 系なら圧縮版（*.csv.gz / *.csv.zst）も含める。"""
+    patterns = [pattern]
+    if pattern.endswith(".csv"):
+        patterns += [pattern + suffix for suffix in COMPRESSED_CSV_SUFFIXES]
+    return sorted({f for pat in patterns for f in folder.glob(pat)}, key=lambda f: str(f))
+
+
 # ---------------------------
 # DB ENGINE & DDL
 # ---------------------------
 
+def get_db_path() -> Path:
+    data_dir = Path(get_env("DATA_DIR", "./data"))
+    return Path(get_env("DUCKDB_PATH", data_dir / "warehouse.duckdb"))
+
+
 def get_engine() -> Engine:
     """
     DuckDB 用の SQLAlchemy Engine を作成。
     """
-    data_dir = Path(get_env("DATA_DIR", "./data"))
-    db_path = Path(get_env("DUCKDB_PATH", data_dir / "warehouse.duckdb"))
+    db_path = get_db_path()
     
     # DBファイルの親ディレクトリを確保
     db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -80,6 +97,16 @@ def table_exists(engine: Engine, schema: str, table: str) -> bool:
         return conn.execute(text(sql), {"schema": schema, "table": table}).scalar() is not None
 
 
+def has_primary_key(engine: Engine, schema: str, table: str) -> bool:
+    sql = """
+    SELECT 1
+    FROM duckdb_constraints()
+    WHERE schema_name = :schema AND table_name = :table AND constraint_type = 'PRIMARY KEY'
+    """
+    with engine.connect() as conn:
+        return conn.execute(text(sql), {"schema": schema, "table": table}).scalar() is not None
+
+
 def get_table_columns(engine: Engine, schema: str, table: str) -> list[str]:
     sql = """
     SELECT column_name
@@ -91,18 +118,165 @@ def get_table_columns(engine: Engine, schema: str, table: str) -> list[str]:
         return list(conn.execute(text(sql), {"schema": schema, "table": table}).scalars().all())
 
 
-def create_text_table(engine: Engine, schema: str, table: str, columns: list[str], pk_cols: list[str]):
-    """すべて TEXT 列 + 主キーで作成（存在しない場合）。"""
-    cols_sql = ", ".join([f'"{c}" TEXT' for c in columns])
+def get_table_column_types(engine: Engine, schema: str, table: str) -> dict[str, str]:
+    """{列名: 型名（VARCHAR / BIGINT ...）} を列順で返す。"""
+    sql = """
+    SELECT column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = :schema AND table_name = :table
+    ORDER BY ordinal_position
+    """
+    with engine.connect() as conn:
+        return {r.column_name: r.data_type for r in conn.execute(text(sql), {"schema": schema, "table": table})}
+
+
+def create_text_table(
+    engine: Engine,
+    schema: str,
+    table: str,
+    columns: list[str],
+    pk_cols: list[str],
+    col_types: dict[str, str] | None = None,
+):
+    """TEXT 列 + 主キーで作成（存在しない場合）。col_types に載っている列だけその型で作る。"""
+    col_types = col_types or {}
+    cols_sql = ", ".join([f'"{c}" {col_types.get(c, "TEXT")}' for c in columns])
     pk_sql = f", PRIMARY KEY ({', '.join([f'\"{c}\"' for c in pk_cols])})" if pk_cols else ""
     ddl = f'CREATE TABLE IF NOT EXISTS "{schema}"."{table}" ({cols_sql}{pk_sql});'
     with engine.begin() as conn:
         conn.execute(text(ddl))
+    invalidate_table_cache(schema, table)
 
 
-def add_missing_text_columns(engine: Engine, schema: str, table: str, missing_cols: list[str]):
+def add_missing_text_columns(
+    engine: Engine, schema: str, table: str, missing_cols: list[str], col_types: dict[str, str] | None = None
+):
     if not missing_cols:
         return
+    col_types = col_types or {}
     with engine.begin() as conn:
         for c in missing_cols:
-            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" ADD COLUMN IF NOT EXISTS "{c}" TEXT'))
\ No newline at end of file
+            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" ADD COLUMN IF NOT EXISTS "{c}" {col_types.get(c, "TEXT")}'))
+    invalidate_table_cache(schema, table)
+
+
+# ---------------------------
+# SCHEMA CACHE
+# ---------------------------
+# warehouse.duckdb の隣に置く JSON キャッシュ（<db>.schema_cache.json）
+#   headers: ファイル fingerprint（パス, size, mtime, encoding, rowskip）→ 生ヘッダ
+#   tables : "schema.table" → {columns, types, ddl_version}
+# 本テーブルの DDL（create_text_table / add_missing_text_columns）を実行すると列リストを捨て、
+# ddl_version を進める。DB ファイルが作り直された（inode が変わった）らテーブル側は全破棄。
+
+_SCHEMA_CACHE: dict | None = None
+
+
+def _schema_cache_path() -> Path:
+    db_path = get_db_path()
+    return db_path.with_name(db_path.name + ".schema_cache.json")
+
+
+def _db_identity() -> int | None:
+    try:
+        return get_db_path().stat().st_ino
+    except OSError:
+        return None
+
+
+def _read_schema_cache_file() -> dict:
+    try:
+        cache = json.loads(_schema_cache_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
+    cache.setdefault("headers", {})
+    cache.setdefault("tables", {})
+    if cache.get("db_ino") != _db_identity():
+        cache["tables"] = {}
+    return cache
+
+
+def _schema_cache() -> dict:
+    global _SCHEMA_CACHE
+    if _SCHEMA_CACHE is None:
+        _SCHEMA_CACHE = _read_schema_cache_file()
+    return _SCHEMA_CACHE
+
+
+def save_schema_cache(tables: bool = True):
+    """
+    キャッシュを書き戻す（temp → rename で原子的）。headers は他プロセス（--jobs のワーカ）分とマージ。
+    tables=False なら tables はディスク側を保持（ワーカは本テーブルの DDL を知らないため）。
+    """
+    mem = _schema_cache()
+    disk = _read_schema_cache_file()
+    headers = {k: v for k, v in (disk["headers"] | mem["headers"]).items() if os.path.exists(k)}
+    out = {
+        "db_ino": _db_identity(),
+        "headers": headers,
+        "tables": mem["tables"] if tables else disk["tables"],
+    }
+    path = _schema_cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(out, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def cached_header(path: Path, encoding: str, rowskip: int) -> list[str] | None:
+    """fingerprint が一致すればキャッシュ済みの生ヘッダを返す（無ければ None）。"""
+    key = str(path.resolve())
+    hit = _schema_cache()["headers"].get(key)
+    if not hit:
+        return None
+    st = path.stat()
+    if (hit["size"], hit["mtime_ns"], hit["encoding"], hit["rowskip"]) != (st.st_size, st.st_mtime_ns, encoding, rowskip):
+        return None
+    return hit["header"]
+
+
+def store_header(path: Path, encoding: str, rowskip: int, header: list[str]):
+    st = path.stat()
+    _schema_cache()["headers"][str(path.resolve())] = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "encoding": encoding,
+        "rowskip": rowskip,
+        "header": header,
+    }
+
+
+def cached_table_types(engine: Engine, schema: str, table: str) -> dict[str, str] | None:
+    """
+    本テーブルの {列名: 型名}（存在しなければ None）。キャッシュに無いときだけ information_schema を引く。
+    キャッシュがあってもテーブルの存在だけは毎回確かめる（dbt や手作業の DROP はキャッシュを捨てないため）。
+    """
+    entry = _schema_cache()["tables"].get(f"{schema}.{table}")
+    exists = table_exists(engine, schema, table)
+    if entry and entry.get("types") is not None:
+        if exists:
+            return entry["types"]
+        invalidate_table_cache(schema, table)
+        return None
+    types = get_table_column_types(engine, schema, table) if exists else None
+    if types is not None:
+        entry = entry or {"ddl_version": 0}
+        entry["columns"] = list(types)
+        entry["types"] = types
+        _schema_cache()["tables"][f"{schema}.{table}"] = entry
+        save_schema_cache()
+    return types
+
+
+def cached_table_columns(engine: Engine, schema: str, table: str) -> list[str] | None:
+    """本テーブルの列リスト（存在しなければ None）。キャッシュに無いときだけ information_schema を引く。"""
+    types = cached_table_types(engine, schema, table)
+    return None if types is None else list(types)
+
+
+def invalidate_table_cache(schema: str, table: str):
+    """DDL 実行後に呼ぶ。列リストを捨て ddl_version を 1 進める。"""
+    tables = _schema_cache()["tables"]
+    entry = tables.get(f"{schema}.{table}", {"ddl_version": 0})
+    tables[f"{schema}.{table}"] = {"columns": None, "types": None, "ddl_version": entry.get("ddl_version", 0) + 1}
+    save_schema_cache()
\ No newline at end of file